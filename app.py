@@ -1,4 +1,6 @@
 # Fastapi code for the app
+import asyncio
+import atexit
 import sentry_sdk
 import uvicorn
 from fastapi import FastAPI
@@ -53,7 +55,9 @@ from src.api.routes.video_layouts_routes import video_layouts_router
 from src.api.routes.webhook_routes import webhook_router
 from src.api.routes.payments_routes import payments_router
 from src.config.settings import Settings
+from src.services.video_editing.actor_cache import warm_actor_preprocessing_cache
 from src.utils.logger import logger
+from src.workflow.render_worker import start_render_workers, stop_render_workers
 
 app.include_router(main_router)
 app.include_router(actors_router)
@@ -65,6 +69,11 @@ app.include_router(video_layouts_router)
 app.include_router(webhook_router)
 app.include_router(payments_router)
 
+@app.on_event("startup")
+async def warm_actor_cache():
+    # Preprocessing downloads every actor video, so it runs in the background
+    app.state.actor_cache_warmup = asyncio.create_task(asyncio.to_thread(warm_actor_preprocessing_cache))
+
 @app.get("/sentry-debug")
 async def trigger_error():
     division_by_zero = 1 / 0
@@ -75,4 +84,8 @@ else:
     logger.info(f"App running in local environment")
     
 if __name__ == '__main__':
+    # Started here rather than on startup, which runs once per uvicorn worker
+    if Settings.START_RENDER_WORKERS:
+        # The workers are not daemonic, so they are stopped explicitly when the API exits
+        atexit.register(stop_render_workers, start_render_workers())
     uvicorn.run("app:app", host="0.0.0.0", port=5151, workers=2, reload=True)
\ No newline at end of file
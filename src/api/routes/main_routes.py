@@ -1,23 +1,31 @@
 import asyncio
-from fastapi import Body, Depends, UploadFile, File, HTTPException
+import time
+from fastapi import Body, Depends, Query, UploadFile, File, HTTPException
 from uuid import uuid4, UUID
 from typing import List, Optional
 from datetime import datetime
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 import os
-from src.api.routes.users_routes import reduce_credit
 from src.api.utils import verify_token
 from src.config.constants import Constants
-from src.models.base_models import Asset, ProjectStatus, VideoConfiguration
+from src.config.settings import Settings
+from src.models.base_models import Asset, CaptionRenderMode, ProjectStatus, RenderEngine, VideoConfiguration
 from src.models.shared_state import projects_in_memory
 from src.notification.async_slack_bot import RA_SLACK_BOT
 
 # DB functions
 
-from src.supabase_tools.handle_project_tb_updates import add_project_to_db
+from src.supabase_tools.handle_profiles_tb_updates import get_user_from_db
+from src.supabase_tools.handle_project_tb_updates import add_project_to_db, get_project_from_db
 from src.utils.logger import logger
 from src.utils.util_functions import determine_asset_type, save_file_locally
-from src.workflow.video_gen_workflow import start_assets_video_generation, start_lipsync_gen_with_audio
+from src.workflow.admission_control import admission_control
+from src.workflow.job_queue import JobStatus, job_queue
+from src.workflow.job_scheduling import get_generation_progress, get_project_priority
+from src.workflow.render_worker import enqueue_preview, get_preview_result
+from src.workflow.video_gen_workflow import PREVIEW_JOB, get_stored_caption_timeline
+from src.workflow.wrokflow_utils import get_render_options
 
 
 main_router = APIRouter()
@@ -70,9 +78,13 @@ async def upload_asset(project_id: UUID,file: UploadFile = File(...)):
     return {"asset_uploaded": True, "message": "Asset uploaded successfully", "asset_id": str(len(project.assets) - 1)}
 
 # Generate Video
-from fastapi import BackgroundTasks
 @main_router.post("/api/projects/{project_id}/generate-final-video")
-async def generate_final_video(project_id: UUID, background_tasks: BackgroundTasks, user_id: UUID = Depends(verify_token)):
+async def generate_final_video(project_id: UUID, user_id: UUID = Depends(verify_token),
+                               render_engine: Optional[RenderEngine] = None,
+                               caption_mode: Optional[CaptionRenderMode] = None,
+                               caption_workers: Optional[int] = Query(None, ge=1, le=os.cpu_count() or 1),
+                               asset_workers: Optional[int] = Query(None, ge=1, le=os.cpu_count() or 1),
+                               stream_assets: Optional[bool] = None):
     try:
         if project_id not in projects_in_memory:
             logger.warning(f"Project not found: {project_id}")
@@ -81,23 +93,46 @@ async def generate_final_video(project_id: UUID, background_tasks: BackgroundTas
         project = projects_in_memory[project_id]
         project.user_id = user_id
         project.status = ProjectStatus.PROCESSING
+        render_options = get_render_options(project)
+        if render_engine is not None:
+            render_options.engine = render_engine
+        if caption_mode is not None:
+            render_options.caption_mode = caption_mode
+        if caption_workers is not None:
+            render_options.caption_workers = caption_workers
+        if asset_workers is not None:
+            render_options.asset_workers = asset_workers
+        if stream_assets is not None:
+            render_options.stream_assets = stream_assets
+        project.render_options = render_options
+
+        # The credit is only charged once the project is admitted
+        user = await get_user_from_db(user_id)
+        if user.credits < 1:
+            logger.warning(f"No credits available for user {user_id}")
+            raise HTTPException(status_code=403, detail="No credits available")
 
-        reduced, _ = await reduce_credit(user_id)
-
-        if reduced:
-
-            # add project to db with status processing with user_id
-            await add_project_to_db(project)
-
-            background_tasks.add_task(start_lipsync_gen_with_audio, project)
-            background_tasks.add_task(start_assets_video_generation, project)
+        # add project to db with status processing with user_id
+        await add_project_to_db(project)
 
+        # The render workers run the stages; the request only enqueues them once there is capacity
+        priority = await get_project_priority(project)
+        admission = await admission_control.request(project, priority)
+        if admission["admitted"]:
+            if admission["job_id"] is None and not admission.get("starting"):
+                raise HTTPException(status_code=403, detail="No credits available")
             logger.info(f"Video generation process started for project {project_id}")
             await RA_SLACK_BOT.send_message(f"Video generation started for project {project_id}")
-            return {"generation_started": True, "message": "Video generation process started"}
-        else:
-            logger.warning(f"No credits available for user {user_id}")
-            raise HTTPException(status_code=403, detail="No credits available")
+            return {"generation_started": True, "message": "Video generation process started", "job_id": admission["job_id"]}
+        if admission["in_progress"]:
+            raise HTTPException(status_code=409, detail="Video generation is already in progress")
+
+        logger.info(f"Video generation for project {project_id} queued at position {admission['queue_position']}")
+        return JSONResponse(status_code=202, content={
+            "generation_started": False,
+            "message": "Video generation queued, it starts once there is render capacity",
+            "queue_position": admission["queue_position"],
+        })
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -110,25 +145,77 @@ async def generate_final_video(project_id: UUID, background_tasks: BackgroundTas
 
 
 
+# Low resolution preview of the final video, free of charge but rate limited; rendered by the render workers
+@main_router.post("/api/projects/{project_id}/generate-preview-video")
+async def generate_preview(project_id: UUID, user_id: UUID = Depends(verify_token)):
+    try:
+        if project_id not in projects_in_memory:
+            logger.warning(f"Project not found: {project_id}")
+            raise HTTPException(status_code=404, detail="Project not found")
 
-# Polling endpoint to check project status
+        project = projects_in_memory[project_id]
+        project.user_id = user_id
+        if not project.assets or project.actor_base is None or (project.video_layout_base is None and project.video_layout_id is None):
+            raise HTTPException(status_code=400, detail="Assets, actor and layout are required for a preview")
+        if not project.final_script and not (project.lipsync_video_url and get_stored_caption_timeline(project)):
+            raise HTTPException(status_code=400, detail="A script is required for a preview")
+
+        # A preview still waiting is not rendered twice
+        latest = await asyncio.to_thread(job_queue.get_latest_job, str(project_id), PREVIEW_JOB)
+        if latest is not None and latest.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+            job_id = latest.id
+        else:
+            since = time.time() - Settings.PREVIEW_RATE_LIMIT_WINDOW_SECONDS
+            if await asyncio.to_thread(job_queue.count_user_jobs, str(user_id), PREVIEW_JOB, since) >= Settings.PREVIEW_RATE_LIMIT:
+                raise HTTPException(status_code=429, detail="Too many previews, try again later")
+            job_id = await asyncio.to_thread(enqueue_preview, project)
+
+        logger.info(f"Preview queued for project {project_id}")
+        return JSONResponse(status_code=202, content={"preview_generated": False, "job_id": job_id,
+                                                      "message": "Preview queued, poll the preview endpoint for its URL"})
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"An error occurred while generating the preview: {error_message}")
+        raise HTTPException(status_code=500, detail=error_message)
+
+@main_router.get("/api/projects/{project_id}/preview-video")
+async def get_preview(project_id: UUID, user_id: UUID = Depends(verify_token)):
+    job = await asyncio.to_thread(job_queue.get_latest_job, str(project_id), PREVIEW_JOB)
+    if job is None or job.user_id != str(user_id):
+        raise HTTPException(status_code=404, detail="No preview requested")
+    if job.status == JobStatus.FAILED:
+        return {"preview_generated": False, "status": job.status, "message": job.last_error}
+    preview_video_url = await asyncio.to_thread(get_preview_result, str(project_id)) if job.status == JobStatus.SUCCEEDED else None
+    queue_position = None
+    if job.status == JobStatus.QUEUED:
+        positions = await asyncio.to_thread(job_queue.get_queue_positions, str(project_id))
+        queue_position = next((position for waiting, position in positions if waiting.id == job.id), None)
+    return {"preview_generated": preview_video_url is not None, "status": job.status,
+            "preview_video_url": preview_video_url, "queue_position": queue_position}
 
-# @main_router.get("/api/projects/{project_id}/status")
-# async def get_project_status(project_id: UUID):
-#     if project_id not in projects_in_memory:
-#         raise HTTPException(status_code=404, detail="Project not found")
 
-#     project = projects_in_memory[project_id]
-#     response = {
-#         "status": project.status,
-#         "message": f"Project is {project.status}"
-#     }
 
-#     if project.status == "completed":
-#         print("Final video url: ", project.final_video_url)
-#         response["final_video_url"] = str(project.final_video_url)
-#     else:
-#         response["final_video_url"] = None
+# Polling endpoint to check project status
+@main_router.get("/api/projects/{project_id}/status")
+async def get_project_status(project_id: UUID, user_id: UUID = Depends(verify_token)):
+    try:
+        # Stages run in the worker processes, so the DB has the latest status
+        project = await get_project_from_db(project_id)
+    except Exception as e:
+        logger.warning(f"Project not found: {project_id}: {e}")
+        raise HTTPException(status_code=404, detail="Project not found")
 
-#     return response
+    response = {
+        "status": project.status,
+        "message": f"Project is {project.status.value}",
+        "final_video_url": project.final_video_url if project.status == ProjectStatus.COMPLETED else None,
+        "queue_position": None,
+        "eta_seconds": None,
+    }
+    if project.status not in (ProjectStatus.COMPLETED, ProjectStatus.FAILED):
+        # Where the project's next job waits and when its final video should be ready
+        response.update(await asyncio.to_thread(get_generation_progress, project_id))
+    return response
 
@@ -1,7 +1,9 @@
 import json
-from fastapi import BackgroundTasks, Request, HTTPException
+import asyncio
+from fastapi import Request, HTTPException
 from fastapi import APIRouter
-from src.services.webhook_processing.replicate_processing import handle_webhook_error, process_replicate_webhook, update_project_status
+from src.services.video_editing.aiditor.render_tracker import render_tracker
+from src.services.webhook_processing.replicate_processing import handle_webhook_error, update_project_status
 from src.models.base_models import  ProjectStatus
 from src.payments.dodo_payments_helper import verify_signature
 from src.payments.handle_payment_scenarios import handle_dispute_event, handle_payment_event, handle_refund_event
@@ -9,6 +11,8 @@ from src.payments.payments_utils import is_payment_test_mode
 from src.supabase_tools.handle_dodo_webhook_tb_updates import check_existing_webhook, insert_new_webhook
 from src.supabase_tools.handle_profiles_tb_updates import get_user_id_from_email
 from src.utils.logger import logger
+from src.workflow.admission_control import admission_control
+from src.workflow.render_worker import enqueue_replicate_webhook
 from fastapi import Request, HTTPException
 from src.models.base_models import DoDoWebhook
 
@@ -30,31 +34,24 @@ async def videoaiditor_webhook(request: Request):
         logger.info(f"Received videoaiditor webhook data: {data}")
 
         event = data.get("event")
-        render_data = data.get("data", {})
-        render_id = render_data.get("_id")
-        status = render_data.get("status")
-        output_url = render_data.get("outputUrl")
-        error = render_data.get("error")
-        video_id = render_data.get("videoId")
-        video_version = render_data.get("videoVersion")
-        created_at = render_data.get("createdAt")
-        updated_at = render_data.get("updatedAt")
-        video_data = render_data.get("videoData")
-
-        if event == "render.completed":
-            logger.info(f"Render completed for video ID {video_id} with output URL {output_url}")
-            # Process the completed render, e.g., update database, notify user, etc.
-            # Example: await update_video_status(video_id, status, output_url)
-            return {"status": "received", "message": "Render completed successfully"}
-        elif event == "render.failed":
-            logger.error(f"Render failed for video ID {video_id} with error: {error}")
-            # Handle the error case, e.g., log the error, notify user, etc.
-            # Example: await handle_render_error(video_id, error)
-            return {"status": "failed", "message": "Render failed"}
-        else:
+        render_id = data.get("data", {}).get("_id")
+        if event not in ("render.completed", "render.failed") or not render_id:
             logger.error(f"Unexpected event type: {event}")
             raise HTTPException(status_code=400, detail="Unexpected event type")
 
+        # The render's status is fetched from videoaiditor, and the worker waiting on it picks it up from the job store
+        result = await render_tracker.record(render_id)
+        if result is None:
+            logger.warning(f"Webhook {event} for render {render_id}, which videoaiditor does not report finished")
+            raise HTTPException(status_code=409, detail="Render is not finished")
+        if result.status == "completed":
+            logger.info(f"Render {render_id} completed with output URL {result.output_url}")
+            return {"status": "received", "message": "Render completed successfully"}
+        logger.error(f"Render {render_id} failed with error: {result.error}")
+        return {"status": "failed", "message": "Render failed"}
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing videoaiditor webhook: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -62,7 +59,7 @@ async def videoaiditor_webhook(request: Request):
 
 
 @webhook_router.post("/webhook/replicate")
-async def replicate_webhook(request: Request, background_tasks: BackgroundTasks):
+async def replicate_webhook(request: Request):
     try:
         data = await request.json()
         logger.info(f"Received webhook data: {data}")
@@ -70,15 +67,18 @@ async def replicate_webhook(request: Request, background_tasks: BackgroundTasks)
         
         if status == "succeeded":
             logger.info("Prediction succeeded, processing in background.")
-            background_tasks.add_task(process_replicate_webhook,data)
+            await asyncio.to_thread(enqueue_replicate_webhook, data)
             return {"status": "received"}
         elif status == "failed":
             logger.warning("Prediction failed.")
             await update_project_status(data, ProjectStatus.ACTOR_GENERATION_FAILED)
+            # The run cannot finish, so it gives up its render slot
+            await admission_control.release_prediction(data.get("id"))
             return {"status": status, "message": "The prediction failed."}
         elif status == "canceled":
             logger.info("Prediction was canceled.")
             await update_project_status(data, ProjectStatus.ACTOR_GENERATION_CANCELLED)
+            await admission_control.release_prediction(data.get("id"))
             return {"status": status, "message": "The prediction was canceled."}
         else:
             logger.error("Unknown prediction status received.")
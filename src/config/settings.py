@@ -19,6 +19,53 @@ class Settings:
     IS_PRODUCTION = os.getenv("IS_PRODUCTION", "TRUE").upper() == "TRUE"
     REDIRECT_URL = os.getenv("REDIRECT_URL")
     ASSEMBLYAI_API_KEY = os.getenv("ASSEMBLYAI_API_KEY","Kat gaya")
+    FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+    FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+    DEFAULT_RENDER_ENGINE = os.getenv("DEFAULT_RENDER_ENGINE", "moviepy")
+    DEFAULT_CAPTION_MODE = os.getenv("DEFAULT_CAPTION_MODE", "frames")
+    CAPTION_WORKERS = int(os.getenv("CAPTION_WORKERS", os.cpu_count() or 1))
+    STREAM_ASSETS = os.getenv("STREAM_ASSETS", "FALSE").upper() == "TRUE"
+    ASSET_VIDEO_WORKERS = int(os.getenv("ASSET_VIDEO_WORKERS", os.cpu_count() or 1))
+    ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join("src", "temp_storage", "asset_cache"))
+    ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+    MEDIA_PROBE_CACHE_DIR = os.getenv("MEDIA_PROBE_CACHE_DIR", os.path.join("src", "temp_storage", "media_probe_cache"))
+    ACTOR_CACHE_DIR = os.getenv("ACTOR_CACHE_DIR", os.path.join("src", "temp_storage", "actor_cache"))
+    # Input fingerprints and reusable outputs of every workflow stage, per project
+    STAGE_CACHE_DIR = os.getenv("STAGE_CACHE_DIR", os.path.join("src", "temp_storage", "stage_cache"))
+    # Projects untouched this long are evicted, and the least recently used ones beyond the size limit
+    STAGE_CACHE_MAX_AGE_SECONDS = int(os.getenv("STAGE_CACHE_MAX_AGE_SECONDS", 7 * 24 * 3600))
+    STAGE_CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+    # Durable job queue shared by the API and the render worker processes
+    JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join("src", "temp_storage", "job_queue.sqlite3"))
+    START_RENDER_WORKERS = os.getenv("START_RENDER_WORKERS", "TRUE").upper() == "TRUE"
+    JOB_WORKER_PROCESSES = int(os.getenv("JOB_WORKER_PROCESSES", (os.cpu_count() or 1) + 1))
+    RENDER_QUEUE_CONCURRENCY = int(os.getenv("RENDER_QUEUE_CONCURRENCY", os.cpu_count() or 1))
+    IO_QUEUE_CONCURRENCY = int(os.getenv("IO_QUEUE_CONCURRENCY", 8))
+    JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", 300))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_DELAY_SECONDS = int(os.getenv("JOB_RETRY_DELAY_SECONDS", 30))
+    # Fair share: running jobs of one queue a user can hold while other users' jobs wait
+    JOB_USER_CONCURRENCY = int(os.getenv("JOB_USER_CONCURRENCY", 1))
+    JOB_PRIORITY_AGING_SECONDS = int(os.getenv("JOB_PRIORITY_AGING_SECONDS", 60))
+    # Admission control of new video generations: projects running at once, the memory their
+    # renders may use (0 for 3/4 of the container's memory) and the free disk left under temp_storage
+    MAX_IN_FLIGHT_RENDERS = int(os.getenv("MAX_IN_FLIGHT_RENDERS", 2 * (os.cpu_count() or 1)))
+    RENDER_MEMORY_BUDGET_MB = int(os.getenv("RENDER_MEMORY_BUDGET_MB", 0))
+    MIN_FREE_DISK_MB = int(os.getenv("MIN_FREE_DISK_MB", 2048))
+    # An admitted project not finished after this long (e.g. its lipsync webhook never came) frees its place
+    ADMISSION_TIMEOUT_SECONDS = int(os.getenv("ADMISSION_TIMEOUT_SECONDS", 2 * 3600))
+    # Free previews a user can request per window
+    PREVIEW_RATE_LIMIT = int(os.getenv("PREVIEW_RATE_LIMIT", 10))
+    PREVIEW_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("PREVIEW_RATE_LIMIT_WINDOW_SECONDS", 3600))
+    DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "cache")
+    DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", 1024 ** 3))
+    DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 8))
+    VIDEOAIDITOR_API_KEY = os.getenv("VIDEOAIDITOR_API_KEY")
+    # Render jobs running at once before new renders prefer the cheapest local backend
+    LOCAL_RENDER_BUSY_JOBS = int(os.getenv("LOCAL_RENDER_BUSY_JOBS", max(1, (os.cpu_count() or 1) // 2)))
+    LOCAL_RENDER_MAX_LOAD = float(os.getenv("LOCAL_RENDER_MAX_LOAD", 1.5))
+    RENDER_BACKEND_MAX_FAILURES = int(os.getenv("RENDER_BACKEND_MAX_FAILURES", 3))
+    RENDER_BACKEND_COOLDOWN_SECONDS = int(os.getenv("RENDER_BACKEND_COOLDOWN_SECONDS", 300))
 
 if __name__ == "__main__":
     # print(os.getenv("IS_PRODUCTION", "TRUE"))
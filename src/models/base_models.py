@@ -53,6 +53,17 @@ class AspectRatio(str, Enum):
     SQUARE = "1:1"
     NINE_SIXTEEN = "9:16"
 
+class RenderEngine(str, Enum):
+    MOVIEPY = "moviepy"
+    FFMPEG = "ffmpeg"
+    REMOTE = "remote"
+
+class CaptionRenderMode(str, Enum):
+    FRAMES = "frames"
+    STREAMING = "streaming"
+    PARALLEL = "parallel"
+    ASS = "ass"
+
 # temporary entites.
 class Asset(BaseModel):
     type: AssetType
@@ -76,6 +87,14 @@ class VideoConfiguration(BaseModel):
     def serialize_for_db(self) -> Dict[str, Any]:
         return self.model_dump()
 
+class RenderOptions(BaseModel):
+    engine: RenderEngine = RenderEngine.MOVIEPY
+    caption_mode: CaptionRenderMode = CaptionRenderMode.FRAMES
+    caption_workers: Optional[int] = None
+    asset_workers: Optional[int] = None
+    # Stream the asset track into the combine stage instead of encoding the asset video
+    stream_assets: bool = False
+
 class Script(BaseModel):
     id: UUID
     title: str
@@ -212,14 +231,17 @@ class Project(ProjectDTO):
     # final data 
     final_script: Optional[str] = None
     t2s_audio_url: Optional[str] = None
+    # Asset video, or the asset timeline manifest when render_options.stream_assets is set
     assets_video_local_path: Optional[str] = None
     lipsync_prediction_id: Optional[str] = None
     lipsync_video_url: Optional[str] = None
     final_video_duration: Optional[float] = None
+    # Per generation request, not stored in the projects table; the job payload carries it to the workers
+    render_options: Optional[RenderOptions] = None
     
 
     def serialize_for_db(self) -> Dict[str, Any]:
-        data = self.model_dump(exclude={"product_base", "actor_base", "voice_base","video_layout_base","script"})
+        data = self.model_dump(exclude={"product_base", "actor_base", "voice_base","video_layout_base","script","render_options"})
         # print(data)
 
         # Convert UUID to string
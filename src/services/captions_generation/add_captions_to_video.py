@@ -1,13 +1,60 @@
 import cv2
 import numpy as np
 import os
-from typing import List, Tuple
+from typing import Iterator, Optional
 from moviepy.editor import VideoFileClip
-from captions import CaptionType
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import CaptionType
 from src.utils.logger import logger
+from src.utils.media_probe import media_probe
+from src.utils.video_utils import OUTPUT_PIX_FMT, X264_CRF, X264_PRESET, close_ffmpeg_pipe, open_ffmpeg_pipe
+
+def caption_frames(cap: cv2.VideoCapture, caption_type: CaptionType, timeline: CaptionTimeline,
+                   start_frame: int = 0, frame_count: Optional[int] = None) -> Iterator[np.ndarray]:
+    """
+    Decode frames from an opened capture and yield them with captions burned in.
+    start_frame/frame_count restrict the loop to one range of the video.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    text_y = height // 2  # Vertically center the captions
+
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    end_frame = start_frame + frame_count if frame_count is not None else None
+
+    # Frame times only move forward, so the cursor finds the active word without searching
+    cursor = timeline.cursor()
+    frame_number = start_frame
+
+    while end_frame is None or frame_number < end_frame:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        word_index = cursor.seek(frame_number / fps)
+        if word_index >= 0:
+            line_words, current_word_index = timeline.caption_at(word_index)
+            frame = caption_type.render(frame, line_words, current_word_index, (0, text_y))
+
+        yield frame
+        frame_number += 1
+
+        if frame_number % 100 == 0:
+            logger.info(f"Processed {frame_number} frames")
+
+    logger.info(f"Caption sprite cache: {caption_type.sprite_cache.stats()}")
+
+def get_temp_output_path(output_video: str, suffix: str) -> str:
+    """Temp file next to the output, so concurrent projects never share one."""
+    root, ext = os.path.splitext(output_video)
+    return f"{root}_{suffix}{ext}"
 
 def process_video_for_captions(input_video: str, output_video: str, caption_type: CaptionType, 
-                               sentences: List[Tuple[List[str], float, float]]) -> str:
+                               timeline: CaptionTimeline) -> str:
+    cap = None
+    out = None
+    temp_output = get_temp_output_path(output_video, "captions_temp")
     try:
         logger.info(f"Loading video: {input_video}")
         video = VideoFileClip(input_video)
@@ -15,54 +62,17 @@ def process_video_for_captions(input_video: str, output_video: str, caption_type
         # Extract audio from the input video
         audio = video.audio
 
+        media_info = media_probe.probe(input_video)
+        fps, width, height = media_info.fps, media_info.width, media_info.height
         cap = cv2.VideoCapture(input_video)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
+        os.makedirs(os.path.dirname(temp_output), exist_ok=True)
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        temp_output = 'temp_output.mp4'
         out = cv2.VideoWriter(temp_output, fourcc, fps, (width, height))
 
         logger.info("Processing video...")
-        frame_number = 0
-        word_index = 0
-        sentence_index = 0
-        current_sentence = []
-        current_sentence_start_time = 0
-        current_sentence_end_time = 0
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            current_time = frame_number / fps
-
-            # Move to the next sentence if the current one has ended
-            if current_time > current_sentence_end_time and sentence_index < len(sentences):
-                current_sentence, current_sentence_start_time, current_sentence_end_time = sentences[sentence_index]
-                sentence_index += 1
-                word_index = 0
-
-            # Determine the current word index based on the timing
-            if current_sentence_end_time > current_sentence_start_time and current_sentence:
-                word_duration = (current_sentence_end_time - current_sentence_start_time) / len(current_sentence)
-                word_index = int((current_time - current_sentence_start_time) / word_duration)
-                word_index = min(word_index, len(current_sentence) - 1)
-            else:
-                word_index = 0
-
-            if current_sentence:
-                current_word_index = word_index
-                text_y = height // 2  # Vertically center the captions
-                frame = caption_type.render(frame, current_sentence, current_word_index, (0, text_y))
-
+        for frame in caption_frames(cap, caption_type, timeline):
             out.write(frame)
-            frame_number += 1
-
-            if frame_number % 100 == 0:
-                logger.info(f"Processed {frame_number} frames")
 
         cap.release()
         out.release()
@@ -90,8 +100,53 @@ def process_video_for_captions(input_video: str, output_video: str, caption_type
     except Exception as e:
         logger.error(f"An error occurred during captions video processing: {e}")
     finally:
-        cap.release()
-        out.release()
+        if cap is not None:
+            cap.release()
+        if out is not None:
+            out.release()
         cv2.destroyAllWindows()
         if os.path.exists(temp_output):
-            os.remove(temp_output)
\ No newline at end of file
+            os.remove(temp_output)
+
+def process_video_for_captions_streaming(input_video: str, output_video: str, caption_type: CaptionType,
+                                         timeline: CaptionTimeline) -> str:
+    """
+    Burn captions in while streaming raw frames into a single ffmpeg encoder. The original audio
+    stream is copied from the input, so there is no intermediate mp4v file and only one lossy encode.
+    """
+    logger.info(f"Streaming captions onto video: {input_video}")
+    cap = cv2.VideoCapture(input_video)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {input_video}")
+
+    media_info = media_probe.probe(input_video)
+    fps, width, height = media_info.fps, media_info.width, media_info.height
+
+    # Encode into a per-project partial file and only move it into place once ffmpeg succeeded
+    partial_output = get_temp_output_path(output_video, "partial")
+    os.makedirs(os.path.dirname(partial_output), exist_ok=True)
+    encoder = open_ffmpeg_pipe([
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-",
+        "-i", input_video,
+        "-map", "0:v", "-map", "1:a?",
+        "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-c:a", "copy",
+        "-movflags", "+faststart",
+        partial_output,
+    ])
+    try:
+        for frame in caption_frames(cap, caption_type, timeline):
+            encoder.stdin.write(frame.tobytes())
+        close_ffmpeg_pipe(encoder)
+        os.replace(partial_output, output_video)
+    except Exception as e:
+        logger.error(f"An error occurred during streaming captions video processing: {e}")
+        encoder.kill()
+        raise
+    finally:
+        cap.release()
+        if os.path.exists(partial_output):
+            os.remove(partial_output)
+
+    logger.info(f"Video processing complete. Output saved to {output_video}")
+    return output_video
@@ -0,0 +1,216 @@
+import os
+import struct
+from typing import List, Optional, Tuple
+from src.services.captions_generation.add_captions_to_video import get_temp_output_path
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import BoxedHighlightCaption, CaptionType, HighlightedWordsCaption
+from src.utils.logger import logger
+from src.utils.media_probe import media_probe
+from src.utils.video_utils import OUTPUT_PIX_FMT, X264_CRF, X264_PRESET, run_ffmpeg
+
+# Layers: caption background, highlight box, words
+BACKGROUND_LAYER = 0
+HIGHLIGHT_LAYER = 1
+TEXT_LAYER = 2
+
+def ass_color(color: Tuple[int, ...]) -> str:
+    """
+    RGB(A) tuple to an ASS &HAABBGGRR colour. ASS alpha is inverted: 00 is opaque.
+    """
+    red, green, blue = color[:3]
+    alpha = color[3] if len(color) > 3 else 255
+    return f"&H{255 - alpha:02X}{blue:02X}{green:02X}{red:02X}"
+
+def ass_override_color(color: Tuple[int, ...]) -> str:
+    """
+    Colour and alpha override tags for the primary fill.
+    """
+    red, green, blue = color[:3]
+    alpha = color[3] if len(color) > 3 else 255
+    return f"\\1c&H{blue:02X}{green:02X}{red:02X}&\\1a&H{255 - alpha:02X}&"
+
+def ass_time(seconds: float) -> str:
+    centiseconds = int(round(seconds * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    seconds, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{seconds:02d}.{centiseconds:02d}"
+
+def escape_ass_text(text: str) -> str:
+    # Braces start override blocks and backslashes start tags
+    return text.replace("\\", "/").replace("{", "(").replace("}", ")")
+
+def read_font_win_metrics(font_path: str) -> Optional[Tuple[float, float]]:
+    """
+    (usWinAscent, usWinDescent) / unitsPerEm from the OS/2 and head tables of a TrueType font.
+    libass sizes and places text by these metrics, not by the hhea ones PIL reports.
+    """
+    with open(font_path, "rb") as f:
+        data = f.read()
+    num_tables = struct.unpack(">H", data[4:6])[0]
+    tables = {}
+    for index in range(num_tables):
+        tag, _, offset, _ = struct.unpack(">4sIII", data[12 + 16 * index:28 + 16 * index])
+        tables[tag] = offset
+    if b"OS/2" not in tables or b"head" not in tables:
+        return None
+    units_per_em = struct.unpack(">H", data[tables[b"head"] + 18:tables[b"head"] + 20])[0]
+    win_ascent, win_descent = struct.unpack(">HH", data[tables[b"OS/2"] + 74:tables[b"OS/2"] + 78])
+    if not units_per_em or not win_ascent + win_descent:
+        return None
+    return win_ascent / units_per_em, win_descent / units_per_em
+
+def get_ass_font(caption_type: CaptionType) -> Tuple[str, float, int]:
+    """
+    Font name libass should match in fontsdir, the ASS font size that renders glyphs at the same
+    pixel size as the PIL font, and the y offset that puts the baseline where PIL draws it.
+    """
+    family, style = caption_type.font.getname()
+    font_name = family if style in ("Regular", "") else f"{family} {style}"
+    ascent, descent = caption_type.font.getmetrics()
+    win_metrics = read_font_win_metrics(caption_type.font_path)
+    if win_metrics is None:
+        return font_name, float(ascent + descent), 0
+    win_ascent, win_descent = win_metrics
+    font_size = caption_type.font.size
+    return font_name, font_size * (win_ascent + win_descent), int(round(ascent - font_size * win_ascent))
+
+def rectangle_event(layer: int, start: str, end: str, box: Tuple[int, int, int, int], color: Tuple[int, ...]) -> str:
+    x0, y0, x1, y1 = box
+    return (f"Dialogue: {layer},{start},{end},Caption,,0,0,0,,"
+            f"{{\\an7\\pos(0,0)\\bord0\\shad0{ass_override_color(color)}\\p1}}"
+            f"m {x0} {y0} l {x1} {y0} l {x1} {y1} l {x0} {y1}{{\\p0}}")
+
+def text_event(layer: int, start: str, end: str, x: int, y: int, word: str, color: Tuple[int, int, int]) -> str:
+    return f"Dialogue: {layer},{start},{end},Caption,,0,0,0,,{{\\an7\\pos({x},{y}){ass_override_color(color)}}}{escape_ass_text(word)}"
+
+def compile_caption_events(caption_type: CaptionType, lines_to_render, current_word_index: int, frame_width: int,
+                           start_y: int, line_height: int, text_y_offset: int, start: str, end: str) -> List[str]:
+    """
+    ASS events for one caption state, with the same layout the PIL renderer draws: every word is
+    positioned where draw_lines would put it and the highlight is applied with override tags.
+    """
+    events = []
+    if isinstance(caption_type, BoxedHighlightCaption):
+        total_height = len(lines_to_render) * line_height * 1.5
+        background_y = start_y - caption_type.background_padding
+        background_height = int(total_height + 2 * caption_type.background_padding)
+        if len(caption_type.background_color) < 4 or caption_type.background_color[3] > 0:
+            events.append(rectangle_event(BACKGROUND_LAYER, start, end, (0, background_y, frame_width, background_y + background_height),
+                                          caption_type.background_color))
+
+    y = start_y
+    for line, line_width in lines_to_render:
+        x = int((frame_width - line_width) / 2)  # Center each line
+        for word, word_index, word_width in line:
+            if isinstance(caption_type, BoxedHighlightCaption):
+                if word_index == current_word_index:
+                    font_size = caption_type.font.size
+                    box_width = word_width + font_size // 2
+                    box_height = font_size + font_size // 4
+                    box_x = x - (box_width - word_width) // 2
+                    box_y = y - (box_height - font_size) // 2
+                    events.append(rectangle_event(HIGHLIGHT_LAYER, start, end, (box_x, box_y, box_x + box_width, box_y + box_height),
+                                                  caption_type.highlight_color))
+                color = caption_type.default_color
+            elif isinstance(caption_type, HighlightedWordsCaption):
+                color = caption_type.highlight_color if word_index == current_word_index else caption_type.default_color
+            else:
+                raise ValueError(f"Caption type {caption_type.name} has no ASS style")
+            events.append(text_event(TEXT_LAYER, start, end, x, y + text_y_offset, word, color))
+            x += word_width
+        y += int(line_height * 1.5)  # Move to next line
+    return events
+
+def write_ass_script(caption_type: CaptionType, timeline: CaptionTimeline, frame_size: Tuple[int, int], output_path: str) -> str:
+    """
+    Compile the caption style and the word timeline into an Advanced SubStation Alpha script
+    that ffmpeg's subtitles filter (libass) burns in.
+    """
+    frame_width, frame_height = frame_size
+    position = (0, frame_height // 2)  # Vertically center the captions
+    font_name, font_size, text_y_offset = get_ass_font(caption_type)
+    outline_color = getattr(caption_type, "outline_color", (0, 0, 0))
+
+    script = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {frame_width}",
+        f"PlayResY: {frame_height}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+        "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Caption,{font_name},{font_size:.2f},{ass_color(caption_type.default_color)},{ass_color(caption_type.default_color)},"
+        f"{ass_color(outline_color)},&H00000000,0,0,0,0,100,100,0,0,1,{caption_type.outline_thickness},0,7,0,0,0,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    state_count = 0
+    for start_time, end_time, words, word_index in timeline.states():
+        start, end = ass_time(start_time), ass_time(end_time)
+        if start == end:
+            continue
+        lines_to_render, line_height, start_y = caption_type.get_caption_layout(frame_width, words, word_index, position)
+        script.extend(compile_caption_events(caption_type, lines_to_render, word_index, frame_width,
+                                             start_y, line_height, text_y_offset, start, end))
+        state_count += 1
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(script) + "\n")
+    logger.info(f"Wrote ASS script with {state_count} caption states to {output_path}")
+    return output_path
+
+def get_subtitles_filter(script_path: str, fonts_dir: str) -> str:
+    """
+    ffmpeg subtitles filter for the script, escaped for use inside a filtergraph.
+    """
+    def quote(path: str) -> str:
+        # Quoting keeps ':' and ',' in the path from splitting the filter options
+        path = os.path.abspath(path).replace("\\", "/")
+        if "'" in path:
+            raise ValueError(f"Unsupported path for the subtitles filter: {path}")
+        return f"'{path}'"
+    return f"subtitles=filename={quote(script_path)}:fontsdir={quote(fonts_dir)}"
+
+def process_video_for_captions_ass(input_video: str, output_video: str, caption_type: CaptionType,
+                                   timeline: CaptionTimeline) -> str:
+    """
+    Burn captions in with libass in a single ffmpeg encode. No Python frame loop is involved;
+    the original audio stream is copied.
+    """
+    logger.info(f"Burning ASS captions onto video: {input_video}")
+    media_info = media_probe.probe(input_video)
+    if media_info.kind != "video":
+        raise ValueError(f"Cannot open video: {input_video}")
+    frame_size = (media_info.width, media_info.height)
+
+    script_path = f"{os.path.splitext(output_video)[0]}.ass"
+    write_ass_script(caption_type, timeline, frame_size, script_path)
+
+    partial_output = get_temp_output_path(output_video, "partial")
+    try:
+        run_ffmpeg([
+            "-i", input_video,
+            "-vf", get_subtitles_filter(script_path, os.path.dirname(caption_type.font_path)),
+            "-map", "0:v", "-map", "0:a?",
+            "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+            "-c:a", "copy",
+            "-movflags", "+faststart",
+            partial_output,
+        ])
+        os.replace(partial_output, output_video)
+    except Exception as e:
+        logger.error(f"An error occurred during ASS captions video processing: {e}")
+        raise
+    finally:
+        if os.path.exists(partial_output):
+            os.remove(partial_output)
+
+    logger.info(f"Video processing complete. Output saved to {output_video}")
+    return output_video
@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, List
+import cv2
+import numpy as np
+from PIL import Image
+from src.config.constants import Constants
+from src.services.captions_generation.add_captions_to_video import process_video_for_captions_streaming
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import BoxedHighlightCaption, CaptionType
+from src.services.captions_generation.parallel_captions import process_video_for_captions_parallel
+from src.utils.logger import logger
+from src.utils.video_utils import run_ffmpeg
+
+FRAME_WIDTH = 1080
+FRAME_HEIGHT = 1920
+SAMPLE_WORDS = "Want to create amazing video ads in a snap with Reels AI Pro".split()
+
+def full_frame_composite(caption_type: CaptionType, frame: np.ndarray, current_word_index: int) -> np.ndarray:
+    """The previous per-frame path: full-frame RGBA overlay composited through PIL."""
+    overlay = caption_type.render_overlay((FRAME_WIDTH, FRAME_HEIGHT), SAMPLE_WORDS, current_word_index, (0, FRAME_HEIGHT // 2))
+    frame_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    frame_with_text = Image.alpha_composite(frame_pil.convert('RGBA'), overlay)
+    return cv2.cvtColor(np.array(frame_with_text), cv2.COLOR_RGB2BGR)
+
+def roi_blend(caption_type: CaptionType, frame: np.ndarray, current_word_index: int) -> np.ndarray:
+    return caption_type.render(frame, SAMPLE_WORDS, current_word_index, (0, FRAME_HEIGHT // 2))
+
+def time_per_frame(render: Callable[[CaptionType, np.ndarray, int], np.ndarray], caption_type: CaptionType,
+                   frames: int = 200) -> float:
+    frame = np.random.default_rng(0).integers(0, 255, (FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    # Warm the sprite cache so only the steady-state per-frame cost is measured
+    for word_index in range(len(SAMPLE_WORDS)):
+        render(caption_type, frame, word_index)
+
+    started_at = time.perf_counter()
+    for frame_number in range(frames):
+        render(caption_type, frame, frame_number % len(SAMPLE_WORDS))
+    return (time.perf_counter() - started_at) / frames * 1000
+
+def create_sample_video(output_path: str, duration: int = 30) -> str:
+    run_ffmpeg([
+        "-f", "lavfi", "-i", f"testsrc2=size={FRAME_WIDTH}x{FRAME_HEIGHT}:rate=25:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=duration={duration}",
+        "-c:v", "libx264", "-g", "50", "-c:a", "aac", "-shortest",
+        output_path,
+    ])
+    return output_path
+
+def get_sample_timeline(duration: float) -> CaptionTimeline:
+    caption_words = []
+    word_duration_ms = 350
+    for index in range(int(duration * 1000 // word_duration_ms)):
+        word = SAMPLE_WORDS[index % len(SAMPLE_WORDS)]
+        if index % len(SAMPLE_WORDS) == len(SAMPLE_WORDS) - 1:
+            word += "."
+        caption_words.append({"word": word, "start": index * word_duration_ms, "end": (index + 1) * word_duration_ms})
+    return CaptionTimeline.from_caption_words(caption_words)
+
+def benchmark_parallel_captions(caption_type: CaptionType, input_video: str, worker_counts: List[int]) -> None:
+    """
+    Wall time of the serial streaming caption pass against the parallel chunked pass.
+    """
+    cap = cv2.VideoCapture(input_video)
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    timeline = get_sample_timeline(duration)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        started_at = time.perf_counter()
+        process_video_for_captions_streaming(input_video, os.path.join(output_dir, "serial.mp4"), caption_type, timeline)
+        serial_time = time.perf_counter() - started_at
+
+        results = []
+        for workers in worker_counts:
+            started_at = time.perf_counter()
+            process_video_for_captions_parallel(input_video, os.path.join(output_dir, f"parallel_{workers}.mp4"),
+                                                caption_type, timeline, workers=workers)
+            results.append((workers, time.perf_counter() - started_at))
+
+    logger.info(f"Caption pass on {duration:.1f}s of video, {os.cpu_count()} CPUs: serial {serial_time:.1f}s")
+    for workers, parallel_time in results:
+        logger.info(f"Parallel with {workers} workers: {parallel_time:.1f}s ({serial_time / parallel_time:.2f}x)")
+
+if __name__ == "__main__":
+    caption_type = BoxedHighlightCaption(
+        font_path=Constants.ROBOTO_FONT_PATH,
+        font_size=72,
+        default_color=(255, 255, 255),
+        highlight_color=(255, 0, 0),
+        outline_color=(0, 0, 0),
+        outline_thickness=3,
+        background_color=(0, 0, 0, 0),
+        background_padding=5
+    )
+
+    before = time_per_frame(full_frame_composite, caption_type)
+    after = time_per_frame(roi_blend, caption_type)
+    logger.info(f"Full-frame PIL composite: {before:.2f} ms/frame")
+    logger.info(f"ROI NumPy blend: {after:.2f} ms/frame ({before / after:.1f}x faster)")
+
+    # python -m src.services.captions_generation.benchmark_captions [input.mp4]
+    # Run on the 4 and 8 core render boxes to get the parallel speedup
+    with tempfile.TemporaryDirectory() as sample_dir:
+        input_video = sys.argv[1] if len(sys.argv) > 1 else create_sample_video(os.path.join(sample_dir, "sample.mp4"))
+        benchmark_parallel_captions(caption_type, input_video, [2, 4, 8])
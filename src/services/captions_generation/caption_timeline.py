@@ -0,0 +1,187 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from src.utils.logger import logger
+
+# (word, start, end) in seconds
+WordTiming = Tuple[str, float, float]
+
+SENTENCE_END_PUNCTUATION = (".", "!", "?")
+
+class CaptionTimeline:
+    """
+    Word level caption timing built once per video.
+
+    Words are stored flat with sorted start/end arrays (seconds) and the index of the first word
+    of every caption line. A word stays highlighted until the next word of its line starts; the
+    last word of a line stays until it ends, so pauses between lines show no caption.
+    """
+    def __init__(self, lines: Sequence[Sequence[WordTiming]]):
+        lines = [line for line in lines if line]
+        self.words: List[str] = [word for line in lines for word, _, _ in line]
+        starts = np.array([start for line in lines for _, start, _ in line], dtype=np.float64)
+        ends = np.array([end for line in lines for _, _, end in line], dtype=np.float64)
+
+        if starts.size and np.any(np.diff(starts) < 0):
+            logger.warning("Caption word timings are not sorted, clamping start times")
+            starts = np.maximum.accumulate(starts)
+        self.starts = starts
+        self.ends = np.maximum(ends, starts)
+
+        line_lengths = np.array([len(line) for line in lines], dtype=np.int64)
+        self.line_breaks = np.concatenate(([0], np.cumsum(line_lengths)[:-1])).astype(np.int64) if lines else np.zeros(0, dtype=np.int64)
+        self.word_line = np.repeat(np.arange(len(lines)), line_lengths)
+        self.word_offset = np.arange(len(self.words)) - self.line_breaks[self.word_line] if lines else np.zeros(0, dtype=np.int64)
+        self.line_words: List[List[str]] = [[word for word, _, _ in line] for line in lines]
+
+        # End of the highlight of every word: the next word's start inside a line, its own end at a line break
+        self.hold_ends = self.ends.copy()
+        if self.words:
+            last_in_line = np.zeros(len(self.words), dtype=bool)
+            last_in_line[np.cumsum(line_lengths) - 1] = True
+            next_starts = np.append(self.starts[1:], np.inf)
+            self.hold_ends = np.where(last_in_line, self.ends, np.maximum(next_starts, self.starts))
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    @classmethod
+    def from_sentences(cls, sentences: List[Tuple[List[str], float, float]]) -> "CaptionTimeline":
+        """
+        Build a timeline from (words, start, end) sentences that have no per-word timing,
+        spreading every sentence evenly across its words.
+        """
+        lines = []
+        for words, start_time, end_time in sentences:
+            if not words or end_time <= start_time:
+                continue
+            word_duration = (end_time - start_time) / len(words)
+            lines.append([(word, start_time + index * word_duration, start_time + (index + 1) * word_duration)
+                          for index, word in enumerate(words)])
+        return cls(lines)
+
+    @classmethod
+    def from_caption_words(cls, caption_words: List[Dict], max_words_per_line: Optional[int] = None) -> "CaptionTimeline":
+        """
+        Build a timeline from the aiditor caption_words format: [{"word", "start", "end"}] in milliseconds.
+        Lines break after sentence ending punctuation and, optionally, every max_words_per_line words.
+        """
+        lines = []
+        current_line = []
+        for caption_word in caption_words:
+            word = caption_word["word"].strip()
+            if not word:
+                continue
+            current_line.append((word, caption_word["start"] / 1000.0, caption_word["end"] / 1000.0))
+            if word.endswith(SENTENCE_END_PUNCTUATION) or (max_words_per_line and len(current_line) >= max_words_per_line):
+                lines.append(current_line)
+                current_line = []
+        if current_line:
+            lines.append(current_line)
+        return cls(lines)
+
+    @classmethod
+    def from_script(cls, script: str, duration: float) -> "CaptionTimeline":
+        """
+        Estimated timeline of a script nobody has voiced or transcribed yet: one line per sentence
+        and the duration spread evenly across the words, as used for previews.
+        """
+        sentences = []
+        current_sentence = []
+        for word in script.split():
+            current_sentence.append(word)
+            if word.endswith(SENTENCE_END_PUNCTUATION):
+                sentences.append(current_sentence)
+                current_sentence = []
+        if current_sentence:
+            sentences.append(current_sentence)
+
+        word_count = sum(len(sentence) for sentence in sentences)
+        if not word_count or duration <= 0:
+            return cls([])
+        word_duration = duration / word_count
+        lines = []
+        start_time = 0.0
+        for sentence in sentences:
+            end_time = start_time + len(sentence) * word_duration
+            lines.append((sentence, start_time, end_time))
+            start_time = end_time
+        return cls.from_sentences(lines)
+
+    def to_lines(self) -> List[List[WordTiming]]:
+        """
+        The lines the timeline was built from, e.g. to store it as JSON and rebuild it with CaptionTimeline(lines).
+        """
+        bounds = [int(line_break) for line_break in self.line_breaks] + [len(self.words)]
+        return [[(self.words[index], float(self.starts[index]), float(self.ends[index])) for index in range(start, end)]
+                for start, end in zip(bounds, bounds[1:])]
+
+    def to_caption_words(self) -> List[Dict]:
+        return [{"word": word, "start": int(round(start * 1000)), "end": int(round(end * 1000))}
+                for word, start, end in zip(self.words, self.starts, self.ends)]
+
+    def word_at(self, time: float) -> int:
+        """
+        Index of the word highlighted at the given time, or -1 when no caption is shown.
+        """
+        index = int(np.searchsorted(self.starts, time, side="right")) - 1
+        if index < 0 or time >= self.hold_ends[index]:
+            return -1
+        return index
+
+    def caption_at(self, word_index: int) -> Tuple[List[str], int]:
+        """
+        Words of the line containing word_index and the position of the word inside that line.
+        """
+        return self.line_words[self.word_line[word_index]], int(self.word_offset[word_index])
+
+    def cursor(self) -> "CaptionCursor":
+        return CaptionCursor(self)
+
+    def states(self) -> Iterator[Tuple[float, float, List[str], int]]:
+        """
+        Yield (start, end, line words, word index in line) for every highlighted word, in time order.
+        """
+        for index in range(len(self.words)):
+            start_time, end_time = float(self.starts[index]), float(self.hold_ends[index])
+            if end_time <= start_time:
+                continue
+            line_words, word_index = self.caption_at(index)
+            yield start_time, end_time, line_words, word_index
+
+class CaptionCursor:
+    """
+    Finds the active word for monotonically increasing times (the frame loop) by advancing an
+    index instead of searching. Seeking backwards falls back to a binary search.
+    """
+    def __init__(self, timeline: CaptionTimeline):
+        self.timeline = timeline
+        self.index = -1
+
+    def seek(self, time: float) -> int:
+        starts = self.timeline.starts
+        if self.index >= 0 and time < starts[self.index]:
+            self.index = int(np.searchsorted(starts, time, side="right")) - 1
+        while self.index + 1 < len(starts) and starts[self.index + 1] <= time:
+            self.index += 1
+
+        if self.index < 0 or time >= self.timeline.hold_ends[self.index]:
+            return -1
+        return self.index
+
+if __name__ == "__main__":
+    caption_words = [
+        {"start": 320, "end": 432, "word": "Welcome"},
+        {"start": 432, "end": 568, "word": "to"},
+        {"start": 568, "end": 1100, "word": "Reels"},
+        {"start": 1100, "end": 1500, "word": "AI."},
+        {"start": 2200, "end": 2400, "word": "Let's"},
+        {"start": 2400, "end": 2800, "word": "go!"},
+    ]
+    timeline = CaptionTimeline.from_caption_words(caption_words)
+    cursor = timeline.cursor()
+    for frame_number in range(80):
+        time = frame_number / 25
+        word_index = cursor.seek(time)
+        assert word_index == timeline.word_at(time)
+        if word_index >= 0 and frame_number % 5 == 0:
+            print(f"{time:.2f}s", timeline.caption_at(word_index))
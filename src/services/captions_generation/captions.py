@@ -1,88 +1,225 @@
 import cv2
 import numpy as np
-from typing import List, Tuple
+from typing import Dict, Hashable, List, Optional, Tuple
+from cachetools import LRUCache
 from PIL import Image, ImageDraw, ImageFont
 from src.utils.logger import logger
+from src.utils.overlay_utils import OverlaySprite, blend_overlay, get_overlay_roi
 
 roboto_font_path = "src/fonts/Roboto-Black.ttf"
 
+# A laid out line: ([(word, word_index, word_width), ...], line_width)
+CaptionLine = Tuple[List[Tuple[str, int, int]], int]
+
+class CaptionSpriteCache:
+    """
+    LRU cache of pre-rendered caption lines. Each entry is a tight premultiplied strip plus its offset,
+    keyed by (style, frame width, visible line words, highlighted word), so every caption state
+    is drawn once and later frames only blend the cached strip.
+    """
+    def __init__(self, max_size: int = 256):
+        self._sprites = LRUCache(maxsize=max_size)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return sprite
+
+    def put(self, key: Hashable, sprite) -> None:
+        self._sprites[key] = sprite
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._sprites)}
+
 class CaptionType:
     def __init__(self, name: str, font_path: str, font_size: int = 32,
                  thickness: int = 2, line_type: int = cv2.LINE_AA, outline_thickness: int = 2):
         self.name = name
+        self.font_path = font_path
         self.font = ImageFont.truetype(font_path, font_size)
         self.thickness = thickness
         self.line_type = line_type
         self.outline_thickness = outline_thickness
+        self.sprite_cache = CaptionSpriteCache()
+        self._layout_cache = LRUCache(maxsize=256)
         logger.debug(f"Initialized CaptionType: {self.name}")
 
-    def render(self, frame: np.ndarray, text: str, position: Tuple[int, int]) -> np.ndarray:
-        raise NotImplementedError("Subclasses must implement the render method")
+    def render(self, frame: np.ndarray, words: List[str], current_word_index: int, position: Tuple[int, int]) -> np.ndarray:
+        """
+        Blend the caption onto the BGR frame in place and return it.
+        """
+        frame_width = frame.shape[1]
+        sprite, (x, y) = self.get_sprite(frame_width, words, current_word_index, position)
+        if sprite is not None:
+            blend_overlay(frame, sprite, x, y)
+        return frame
 
-    def get_text_size(self, text: str) -> Tuple[int, int]:
-        bbox = self.font.getbbox(text)
-        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+    def render_overlay(self, frame_size: Tuple[int, int], words: List[str], current_word_index: int,
+                       position: Tuple[int, int]) -> Image.Image:
+        """
+        Draw the caption onto a transparent RGBA image of the given (width, height).
+        """
+        frame_width, frame_height = frame_size
+        overlay = Image.new('RGBA', frame_size, (0, 0, 0, 0))
+        sprite, (x, y) = self.get_sprite(frame_width, words, current_word_index, position)
+        if sprite is None:
+            return overlay
 
-class HighlightedWordsCaption(CaptionType):
-    def __init__(self, font_path: str, font_size: int = 32, default_color: Tuple[int, int, int] = (255, 255, 255),
-                 highlight_color: Tuple[int, int, int] = (0, 255, 0),
-                 outline_color: Tuple[int, int, int] = (0, 0, 0), outline_thickness: int = 2):
-        super().__init__("HighlightedWords", font_path, font_size, outline_thickness=outline_thickness)
-        self.default_color = default_color
-        self.highlight_color = highlight_color
-        self.outline_color = outline_color
-        logger.debug("Initialized HighlightedWordsCaption")
+        roi = get_overlay_roi((frame_height, frame_width), sprite, x, y)
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            overlay.paste(sprite.to_rgba_image().crop((x0 - x, y0 - y, x1 - x, y1 - y)), (x0, y0))
+        return overlay
+
+    def get_sprite(self, frame_width: int, words: List[str], current_word_index: int,
+                   position: Tuple[int, int]) -> Tuple[Optional[OverlaySprite], Tuple[int, int]]:
+        """
+        Return the cached strip for this caption state and the frame coordinates of its top left corner.
+        """
+        lines_to_render, line_height, start_y = self.get_caption_layout(frame_width, words, current_word_index, position)
+
+        visible_indices = [word_index for line, _ in lines_to_render for _, word_index, _ in line]
+        highlight_index = visible_indices.index(current_word_index) if current_word_index in visible_indices else -1
+        key = (
+            self.get_style_key(),
+            frame_width,
+            tuple(tuple(word for word, _, _ in line) for line, _ in lines_to_render),
+            highlight_index,
+            line_height,
+        )
+
+        cached = self.sprite_cache.get(key)
+        if cached is None:
+            cached = self.draw_sprite(lines_to_render, current_word_index, frame_width, line_height)
+            self.sprite_cache.put(key, cached)
+
+        sprite, (offset_x, offset_y) = cached
+        return sprite, (offset_x, start_y + offset_y)
+
+    def get_caption_layout(self, frame_width: int, words: List[str], current_word_index: int,
+                           position: Tuple[int, int]) -> Tuple[List[CaptionLine], int, int]:
+        """
+        Lines shown for this caption state, their line height and the y of the first line.
+        """
+        lines, measured_height = self.layout_lines(words, frame_width)
+        lines_to_render = self.get_visible_lines(lines, current_word_index)
+        line_height = self.get_line_height(measured_height)
+
+        _, y = position
+        total_height = len(lines_to_render) * line_height * 1.5  # 1.5 for line spacing
+        start_y = max(line_height, int(y - total_height / 2))
+        return lines_to_render, line_height, start_y
+
+    def draw_sprite(self, lines_to_render: List[CaptionLine], current_word_index: int, frame_width: int,
+                    line_height: int) -> Tuple[Optional[OverlaySprite], Tuple[int, int]]:
+        """
+        Draw the visible lines once and crop them to a tight strip. The offset is relative to
+        (0, start_y) of the first line.
+        """
+        margin = self.get_sprite_margin(line_height)
+        total_height = len(lines_to_render) * line_height * 1.5
+        canvas = Image.new('RGBA', (frame_width, int(total_height) + 2 * margin), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(canvas)
+        self.draw_lines(draw, lines_to_render, current_word_index, frame_width, margin, line_height)
+
+        bbox = canvas.getbbox()
+        if bbox is None:
+            return None, (0, 0)
+        return OverlaySprite.from_rgba_image(canvas.crop(bbox)), (bbox[0], bbox[1] - margin)
+
+    def layout_lines(self, words: List[str], frame_width: int) -> Tuple[List[CaptionLine], int]:
+        """
+        Wrap the words into lines that fit 90% of the frame width. Returns the lines and the
+        height of the last measured word.
+        """
+        key = (tuple(words), frame_width)
+        layout = self._layout_cache.get(key)
+        if layout is not None:
+            return layout
 
-    def render(self, frame: np.ndarray, words: List[str], current_word_index: int, position: Tuple[int, int]) -> np.ndarray:
-        logger.debug("Rendering HighlightedWordsCaption")
-        frame_height, frame_width = frame.shape[:2]
-        x, y = position
         max_width = int(frame_width * 0.9)  # Use 90% of frame width
         lines = []
         current_line = []
         current_line_width = 0
+        word_height = self.font.size
 
         for i, word in enumerate(words):
-            word_size = self.get_text_size(word + " ")
-            if current_line_width + word_size[0] > max_width:
+            word_width, word_height = self.get_text_size(word + " ")
+            if current_line_width + word_width > max_width:
                 lines.append((current_line, current_line_width))
                 current_line = []
                 current_line_width = 0
-            current_line.append((word, i))
-            current_line_width += word_size[0]
-        
+            current_line.append((word, i, word_width))
+            current_line_width += word_width
+
         if current_line:
             lines.append((current_line, current_line_width))
 
-        total_height = len(lines) * word_size[1] * 1.5  # 1.5 for line spacing
-        start_y = max(word_size[1], int(y - total_height / 2))
+        layout = (lines, word_height)
+        self._layout_cache[key] = layout
+        return layout
+
+    def get_visible_lines(self, lines: List[CaptionLine], current_word_index: int) -> List[CaptionLine]:
+        return lines
+
+    def get_line_height(self, measured_height: int) -> int:
+        return measured_height
+
+    def get_sprite_margin(self, line_height: int) -> int:
+        # Room above and below the lines for outlines and highlight boxes
+        return line_height + self.outline_thickness
 
-        # Create a transparent overlay
-        overlay = Image.new('RGBA', (frame_width, frame_height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
+    def get_style_key(self) -> Tuple:
+        raise NotImplementedError("Subclasses must implement the get_style_key method")
 
-        for line, line_width in lines:
+    def draw_lines(self, draw: ImageDraw.ImageDraw, lines_to_render: List[CaptionLine], current_word_index: int,
+                   frame_width: int, start_y: int, line_height: int) -> None:
+        raise NotImplementedError("Subclasses must implement the draw_lines method")
+
+    def draw_outlined_text(self, draw: ImageDraw.ImageDraw, x: int, y: int, word: str,
+                           color: Tuple[int, int, int], outline_color: Tuple[int, int, int]) -> None:
+        # Draw outline
+        for dx, dy in [(-self.outline_thickness, -self.outline_thickness), (-self.outline_thickness, self.outline_thickness),
+                       (self.outline_thickness, -self.outline_thickness), (self.outline_thickness, self.outline_thickness)]:
+            draw.text((x+dx, y+dy), word, font=self.font, fill=outline_color)
+
+        # Draw text
+        draw.text((x, y), word, font=self.font, fill=color)
+
+    def get_text_size(self, text: str) -> Tuple[int, int]:
+        bbox = self.font.getbbox(text)
+        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+class HighlightedWordsCaption(CaptionType):
+    def __init__(self, font_path: str, font_size: int = 32, default_color: Tuple[int, int, int] = (255, 255, 255),
+                 highlight_color: Tuple[int, int, int] = (0, 255, 0),
+                 outline_color: Tuple[int, int, int] = (0, 0, 0), outline_thickness: int = 2):
+        super().__init__("HighlightedWords", font_path, font_size, outline_thickness=outline_thickness)
+        self.default_color = default_color
+        self.highlight_color = highlight_color
+        self.outline_color = outline_color
+        logger.debug("Initialized HighlightedWordsCaption")
+
+    def get_style_key(self) -> Tuple:
+        return (self.name, self.font_path, self.font.size, self.default_color, self.highlight_color,
+                self.outline_color, self.outline_thickness)
+
+    def draw_lines(self, draw: ImageDraw.ImageDraw, lines_to_render: List[CaptionLine], current_word_index: int,
+                   frame_width: int, start_y: int, line_height: int) -> None:
+        logger.debug("Rendering HighlightedWordsCaption")
+        for line, line_width in lines_to_render:
             x = int((frame_width - line_width) / 2)  # Center each line
-            for word, word_index in line:
+            for word, word_index, word_width in line:
                 color = self.highlight_color if word_index == current_word_index else self.default_color
-                
-                # Draw outline
-                for dx, dy in [(-self.outline_thickness, -self.outline_thickness), (-self.outline_thickness, self.outline_thickness), 
-                               (self.outline_thickness, -self.outline_thickness), (self.outline_thickness, self.outline_thickness)]:
-                    draw.text((x+dx, start_y+dy), word, font=self.font, fill=self.outline_color)
-                
-                # Draw text
-                draw.text((x, start_y), word, font=self.font, fill=color)
-                
-                word_width, _ = self.get_text_size(word + " ")
+                self.draw_outlined_text(draw, x, start_y, word, color, self.outline_color)
                 x += word_width
 
-            start_y += int(word_size[1] * 1.5)  # Move to next line
-
-        # Combine the overlay with the frame
-        frame_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        frame_with_text = Image.alpha_composite(frame_pil.convert('RGBA'), overlay)
-        return cv2.cvtColor(np.array(frame_with_text), cv2.COLOR_RGB2BGR)
+            start_y += int(line_height * 1.5)  # Move to next line
 
 class BoxedHighlightCaption(CaptionType):
     def __init__(self, font_path: str = "src/fonts/Roboto-Black.ttf", font_size: int = 64,
@@ -102,47 +239,33 @@ class BoxedHighlightCaption(CaptionType):
         self.max_lines = max_lines  # Store the max_lines parameter
         logger.debug("Initialized BoxedHighlightCaption")
 
-    def render(self, frame: np.ndarray, words: List[str], current_word_index: int, position: Tuple[int, int]) -> np.ndarray:
-        logger.debug("Rendering BoxedHighlightCaption")
-        frame_height, frame_width = frame.shape[:2]
-        x, y = position
-        max_width = int(frame_width * 0.9)  # Use 90% of frame width
-
-        # Split words into lines
-        lines = []
-        current_line = []
-        current_line_width = 0
-
-        for i, word in enumerate(words):
-            word_size = self.get_text_size(word + " ")
-            if current_line_width + word_size[0] > max_width:
-                lines.append((current_line, current_line_width))
-                current_line = []
-                current_line_width = 0
-            current_line.append((word, i))
-            current_line_width += word_size[0]
-        
-        if current_line:
-            lines.append((current_line, current_line_width))
+    def get_style_key(self) -> Tuple:
+        return (self.name, self.font_path, self.font.size, self.default_color, self.highlight_color,
+                self.outline_color, self.outline_thickness, self.background_color, self.background_padding)
 
+    def get_visible_lines(self, lines: List[CaptionLine], current_word_index: int) -> List[CaptionLine]:
         # Determine which line contains the current word
         current_line_index = 0
         for i, (line, _) in enumerate(lines):
-            if any(word_index == current_word_index for _, word_index in line):
+            if any(word_index == current_word_index for _, word_index, _ in line):
                 current_line_index = i
                 break
 
         # Only render the current line
         start_index = max(0, current_line_index - self.max_lines + 1)
         end_index = start_index + self.max_lines
-        lines_to_render = lines[start_index:end_index]
+        return lines[start_index:end_index]
 
-        total_height = len(lines_to_render) * self.font.size * 1.5  # 1.5 for line spacing
-        start_y = max(self.font.size, int(y - total_height / 2))
+    def get_line_height(self, measured_height: int) -> int:
+        return self.font.size
 
-        # Create a transparent overlay
-        overlay = Image.new('RGBA', (frame_width, frame_height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
+    def get_sprite_margin(self, line_height: int) -> int:
+        return super().get_sprite_margin(line_height) + self.background_padding
+
+    def draw_lines(self, draw: ImageDraw.ImageDraw, lines_to_render: List[CaptionLine], current_word_index: int,
+                   frame_width: int, start_y: int, line_height: int) -> None:
+        logger.debug("Rendering BoxedHighlightCaption")
+        total_height = len(lines_to_render) * line_height * 1.5  # 1.5 for line spacing
 
         # Add a semi-transparent background for the entire text area
         background_height = int(total_height + 2 * self.background_padding)
@@ -152,32 +275,19 @@ class BoxedHighlightCaption(CaptionType):
 
         for line, line_width in lines_to_render:
             x = int((frame_width - line_width) / 2)  # Center each line
-            for word, word_index in line:
-                word_width, word_height = self.get_text_size(word + " ")
+            for word, word_index, word_width in line:
                 if word_index == current_word_index:
                     # Calculate centered position for highlight box
                     box_width = word_width + self.font.size // 2  # Add some padding
                     box_height = self.font.size + self.font.size // 4  # Add some padding
                     box_x = x - (box_width - word_width) // 2
                     box_y = start_y - (box_height - self.font.size) // 2
-                    
+
                     # Draw centered box around the word
-                    draw.rectangle([box_x, box_y, box_x + box_width, box_y + box_height], 
+                    draw.rectangle([box_x, box_y, box_x + box_width, box_y + box_height],
                                    fill=self.highlight_color)
-                
-                # Draw outline
-                for dx, dy in [(-self.outline_thickness, -self.outline_thickness), (-self.outline_thickness, self.outline_thickness), 
-                               (self.outline_thickness, -self.outline_thickness), (self.outline_thickness, self.outline_thickness)]:
-                    draw.text((x+dx, start_y+dy), word, font=self.font, fill=self.outline_color)
-                
-                # Draw text
-                draw.text((x, start_y), word, font=self.font, fill=self.default_color)
-                
+
+                self.draw_outlined_text(draw, x, start_y, word, self.default_color, self.outline_color)
                 x += word_width
 
             start_y += int(self.font.size * 1.5)  # Move to next line
-
-        # Combine the overlay with the frame
-        frame_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        frame_with_text = Image.alpha_composite(frame_pil.convert('RGBA'), overlay)
-        return cv2.cvtColor(np.array(frame_with_text), cv2.COLOR_RGB2BGR)
\ No newline at end of file
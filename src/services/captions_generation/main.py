@@ -3,6 +3,7 @@ import whisper
 from captions import BoxedHighlightCaption
 from transcriptions import transcribe_video_whisper, transcribe_video_assembly
 from add_captions_to_video import process_video_for_captions
+from caption_timeline import CaptionTimeline
 from src.utils.logger import logger
 
 if __name__ == "__main__":
@@ -26,7 +27,8 @@ if __name__ == "__main__":
     logger.info("Loading Whisper model")
     # model = whisper.load_model("base")
     sentences= transcribe_video_assembly(input_video)
+    timeline = CaptionTimeline.from_sentences(sentences)
 
     # Process the video to add captions
-    ouptut_video = process_video_for_captions(input_video, output_video, caption_type, sentences)
+    ouptut_video = process_video_for_captions(input_video, output_video, caption_type, timeline)
     print("Output video:", output_video)
\ No newline at end of file
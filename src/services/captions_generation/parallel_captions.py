@@ -0,0 +1,133 @@
+import os
+import shutil
+import time
+from typing import List, Optional, Tuple
+import cv2
+from src.services.captions_generation.add_captions_to_video import caption_frames, get_temp_output_path
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import CaptionType
+from src.utils.logger import logger
+from src.utils.media_probe import media_probe
+from src.utils.video_utils import OUTPUT_PIX_FMT, X264_CRF, X264_PRESET, close_ffmpeg_pipe, get_keyframe_times, get_segment_pool, open_ffmpeg_pipe, run_ffmpeg
+
+# (start_frame, frame_count), frame_count None means "until the end of the video"
+FrameRange = Tuple[int, Optional[int]]
+
+def plan_frame_ranges(keyframe_times: List[float], fps: float, total_frames: int, segments: int) -> List[FrameRange]:
+    """
+    Split the video into at most `segments` ranges of similar length that start on keyframes, so
+    every worker can seek straight to its first frame. When the video has fewer keyframes than
+    segments the ranges are split evenly instead and the decoder seeks from the previous keyframe.
+    """
+    keyframes = sorted({int(round(keyframe_time * fps)) for keyframe_time in keyframe_times} | {0})
+    keyframes = [keyframe for keyframe in keyframes if keyframe < total_frames]
+    if len(keyframes) >= segments:
+        boundaries = []
+        for segment in range(segments):
+            target = segment * total_frames / segments
+            boundaries.append(min(keyframes, key=lambda keyframe: abs(keyframe - target)))
+        boundaries = sorted(set(boundaries))
+    else:
+        logger.info(f"Only {len(keyframes)} keyframes for {segments} caption segments, splitting on plain frames")
+        boundaries = sorted({segment * total_frames // segments for segment in range(segments)})
+
+    frame_ranges = []
+    for index, start_frame in enumerate(boundaries):
+        next_start = boundaries[index + 1] if index + 1 < len(boundaries) else None
+        frame_ranges.append((start_frame, next_start - start_frame if next_start is not None else None))
+    return frame_ranges
+
+def render_caption_segment(input_video: str, segment_path: str, caption_type: CaptionType, timeline: CaptionTimeline,
+                           frame_range: FrameRange, encoder_threads: int) -> str:
+    """
+    Worker: decode one frame range with its own capture, burn captions in and encode it without audio.
+    """
+    start_frame, frame_count = frame_range
+    cap = cv2.VideoCapture(input_video)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {input_video}")
+
+    # Cached on disk by the parent's probe, so workers do not parse the headers again
+    media_info = media_probe.probe(input_video)
+    fps, width, height = media_info.fps, media_info.width, media_info.height
+
+    # Every segment is encoded with the same parameters so they can be concatenated with stream copy
+    encoder = open_ffmpeg_pipe([
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-",
+        "-an",
+        "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-threads", str(encoder_threads),
+        segment_path,
+    ])
+    try:
+        for frame in caption_frames(cap, caption_type, timeline, start_frame, frame_count):
+            encoder.stdin.write(frame.tobytes())
+        close_ffmpeg_pipe(encoder)
+    except Exception:
+        encoder.kill()
+        raise
+    finally:
+        cap.release()
+    return segment_path
+
+def process_video_for_captions_parallel(input_video: str, output_video: str, caption_type: CaptionType,
+                                        timeline: CaptionTimeline, workers: int = 4) -> str:
+    """
+    Burn captions in by rendering keyframe aligned ranges of the video in separate processes, each with
+    its own decoder and encoder. The segments are joined with the concat demuxer without re-encoding
+    and the original audio is muxed once.
+    """
+    started_at = time.perf_counter()
+    media_info = media_probe.probe(input_video)
+    if media_info.kind != "video":
+        raise ValueError(f"Cannot open video: {input_video}")
+    fps, total_frames = media_info.fps, media_info.frame_count
+    # The mp4 sync sample table already lists the keyframes, other containers scan the packets
+    keyframe_times = media_info.keyframe_times
+    if keyframe_times is None:
+        keyframe_times = get_keyframe_times(input_video)
+
+    workers = max(1, workers)
+    frame_ranges = plan_frame_ranges(keyframe_times, fps, total_frames, workers)
+    encoder_threads = max(1, (os.cpu_count() or 1) // len(frame_ranges))
+    logger.info(f"Rendering captions for {total_frames} frames in {len(frame_ranges)} segments: {frame_ranges}")
+
+    segments_dir = f"{os.path.splitext(output_video)[0]}_segments"
+    os.makedirs(segments_dir, exist_ok=True)
+    partial_output = get_temp_output_path(output_video, "partial")
+    try:
+        segment_paths = [os.path.abspath(os.path.join(segments_dir, f"segment_{index:03d}.mp4")) for index in range(len(frame_ranges))]
+        with get_segment_pool(len(frame_ranges)) as executor:
+            futures = [
+                executor.submit(render_caption_segment, input_video, segment_path, caption_type, timeline, frame_range, encoder_threads)
+                for segment_path, frame_range in zip(segment_paths, frame_ranges)
+            ]
+            for future in futures:
+                future.result()
+        logger.info(f"Caption segments rendered in {time.perf_counter() - started_at:.1f}s")
+
+        playlist_path = os.path.join(segments_dir, "segments.ffconcat")
+        with open(playlist_path, "w") as f:
+            f.write("ffconcat version 1.0\n")
+            for segment_path in segment_paths:
+                f.write(f"file '{segment_path}'\n")
+
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", playlist_path,
+            "-i", input_video,
+            "-map", "0:v", "-map", "1:a?",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            partial_output,
+        ])
+        os.replace(partial_output, output_video)
+    except Exception as e:
+        logger.error(f"An error occurred during parallel captions video processing: {e}")
+        raise
+    finally:
+        shutil.rmtree(segments_dir, ignore_errors=True)
+        if os.path.exists(partial_output):
+            os.remove(partial_output)
+
+    logger.info(f"Parallel captions with {len(frame_ranges)} workers took {time.perf_counter() - started_at:.1f}s. Output saved to {output_video}")
+    return output_video
@@ -1,12 +1,16 @@
 
 import os
 import pickle
-from typing import List, Tuple
-import whisper
+from typing import TYPE_CHECKING, List, Tuple
+from src.services.captions_generation.caption_timeline import CaptionTimeline
 from src.utils.logger import logger
 import assemblyai as aai
 
-def transcribe_video_whisper(video_path: str, model: whisper.Whisper) -> List[Tuple[List[str], float, float]]:
+if TYPE_CHECKING:
+    # whisper pulls in torch, only import it where a model is actually used
+    import whisper
+
+def transcribe_video_whisper(video_path: str, model: "whisper.Whisper") -> List[Tuple[List[str], float, float]]:
     """
     Transcribe the video using Whisper and return the sentences with their timings.
     """
@@ -46,7 +50,28 @@ def transcribe_video_assembly(video_path: str) -> List[Tuple[List[str], float, f
     
     return setences_input
 
+def transcribe_video_assembly_words(video_path: str) -> CaptionTimeline:
+    """
+    Transcribe the video using AssemblyAI and keep the per-word timestamps, one caption line per sentence.
+    """
+    logger.info('Transcribing video with word timestamps')
+
+    transcriber = aai.Transcriber()
+
+    transcript = transcriber.transcribe(video_path)
+    sentences = transcript.get_sentences()
+
+    lines = []
+    for sentence in sentences:
+        lines.append([(word.text.strip(), word.start / 1000.0, word.end / 1000.0)
+                      for word in sentence.words if word.text.strip()])
+
+    timeline = CaptionTimeline(lines)
+    logger.info(f'Transcription complete: {len(timeline)} words in {len(timeline.line_words)} lines')
+    return timeline
+
 if __name__ == "__main__":
+    import whisper
     video_path = "src/temp_storage/4c6c84ca-9a42-4618-b590-3cb866b7e4b2/assets/000_675f3f6f371f91c3d8aa055f_with_audio.mp4"
     
     # Transcribe using Whisper
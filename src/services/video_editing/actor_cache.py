@@ -0,0 +1,143 @@
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from typing import Dict, List, Optional
+from uuid import UUID
+from pydantic import BaseModel
+from src.config.settings import Settings
+from src.models.base_models import Actor
+from src.supabase_tools.handle_actor_tb_updates import get_actors_from_db
+from src.utils.logger import logger
+from src.utils.media_probe import get_source_etag, probe_remote
+
+class ActorPreprocessing(BaseModel):
+    """
+    Probe metadata of an actor's source video. The lipsync video keeps its geometry, so the render
+    and the remote layouts take the actor's size and duration from here instead of probing.
+    """
+    actor_id: UUID
+    source_url: str
+    etag: str
+    # Fingerprint of the actor row the entry was built from
+    row_fingerprint: str
+    width: int
+    height: int
+    fps: float
+    frame_count: int
+    duration: float
+
+def get_row_fingerprint(actor: Actor) -> str:
+    return hashlib.sha256(actor.model_dump_json().encode()).hexdigest()
+
+class ActorPreprocessingCache:
+    """
+    Per actor disk cache of the actor video's metadata, keyed by actor id + source ETag. There are
+    only a handful of actors, so every entry is also kept in memory and found by actor id or URL.
+    Entries are built on first use (or when warmed at startup) and dropped when the actor row or
+    the source file changes.
+    """
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries: Dict[UUID, ActorPreprocessing] = {}
+
+    def get_entry_dir(self, actor_id: UUID, etag: str) -> str:
+        return os.path.join(self.cache_dir, str(actor_id), hashlib.sha256(etag.encode()).hexdigest()[:16])
+
+    def get_cached(self, actor_id: UUID) -> Optional[ActorPreprocessing]:
+        return self._entries.get(actor_id)
+
+    def find_by_url(self, url: str) -> Optional[ActorPreprocessing]:
+        for entry in list(self._entries.values()):
+            if entry.source_url == url:
+                return entry
+        return None
+
+    def get(self, actor: Actor) -> ActorPreprocessing:
+        """
+        Entry for the actor, loading it from disk or building it when the source changed.
+        """
+        etag = get_source_etag(actor.full_video_link)
+        row_fingerprint = get_row_fingerprint(actor)
+        entry = self._entries.get(actor.id)
+        if entry is not None and entry.etag == etag and entry.row_fingerprint == row_fingerprint:
+            return entry
+
+        with self._lock:
+            entry_dir = self.get_entry_dir(actor.id, etag)
+            metadata_path = os.path.join(entry_dir, "metadata.json")
+            entry = None
+            if os.path.exists(metadata_path):
+                with open(metadata_path) as f:
+                    entry = ActorPreprocessing.model_validate_json(f.read())
+                if entry.row_fingerprint != row_fingerprint:
+                    entry = None
+            if entry is None:
+                entry = self.build(actor, etag, row_fingerprint, entry_dir)
+            self._entries[actor.id] = entry
+            self.remove_stale(actor.id, entry_dir)
+            return entry
+
+    def build(self, actor: Actor, etag: str, row_fingerprint: str, entry_dir: str) -> ActorPreprocessing:
+        logger.info(f"Preprocessing actor {actor.id} from {actor.full_video_link}")
+        # Range reads of the headers, the video is not downloaded
+        media_info = probe_remote(actor.full_video_link)
+        width, height, fps, frame_count = media_info.width, media_info.height, media_info.fps, media_info.frame_count
+        if media_info.kind != "video" or not width or not height or not fps or not frame_count:
+            raise ValueError(f"Invalid actor video {actor.full_video_link}: {width}x{height} at {fps} fps")
+
+        entry = ActorPreprocessing(
+            actor_id=actor.id,
+            source_url=actor.full_video_link,
+            etag=etag,
+            row_fingerprint=row_fingerprint,
+            width=width,
+            height=height,
+            fps=fps,
+            frame_count=frame_count,
+            duration=frame_count / fps,
+        )
+        os.makedirs(entry_dir, exist_ok=True)
+        temp_metadata_path = os.path.join(entry_dir, f"metadata.{uuid.uuid4().hex}.tmp")
+        with open(temp_metadata_path, "w") as f:
+            f.write(entry.model_dump_json())
+        os.replace(temp_metadata_path, os.path.join(entry_dir, "metadata.json"))
+        return entry
+
+    def remove_stale(self, actor_id: UUID, current_entry_dir: str) -> None:
+        actor_dir = os.path.join(self.cache_dir, str(actor_id))
+        for name in os.listdir(actor_dir):
+            path = os.path.join(actor_dir, name)
+            if path != current_entry_dir:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Removed stale preprocessing of actor {actor_id}: {path}")
+
+    def invalidate(self, actor_id: UUID) -> None:
+        with self._lock:
+            self._entries.pop(actor_id, None)
+            shutil.rmtree(os.path.join(self.cache_dir, str(actor_id)), ignore_errors=True)
+        logger.info(f"Invalidated preprocessing of actor {actor_id}")
+
+    def warm(self, actors: List[Actor]) -> None:
+        for actor in actors:
+            try:
+                self.get(actor)
+            except Exception as e:
+                logger.error(f"Could not preprocess actor {actor.id}: {e}")
+        logger.info(f"Actor preprocessing cache warmed with {len(self._entries)}/{len(actors)} actors")
+
+actor_preprocessing_cache = ActorPreprocessingCache(Settings.ACTOR_CACHE_DIR)
+
+def warm_actor_preprocessing_cache() -> None:
+    actor_preprocessing_cache.warm(get_actors_from_db())
+
+if __name__ == "__main__":
+    # python -m src.services.video_editing.actor_cache
+    actors = get_actors_from_db()
+    actor_preprocessing_cache.warm(actors)
+    for actor in actors:
+        entry = actor_preprocessing_cache.get_cached(actor.id)
+        if entry is not None:
+            logger.info(f"{actor.name}: {entry.width}x{entry.height} {entry.fps} fps, {entry.duration:.1f}s")
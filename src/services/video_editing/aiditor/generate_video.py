@@ -1,16 +1,17 @@
 from math import floor
-from PIL import Image
+import asyncio
 import requests
 from io import BytesIO
-import cv2
 import json
 import os
-import hashlib
-from pathlib import Path
 import uuid
-import time
 from typing import Dict, Optional
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
+from src.services.video_editing.actor_cache import actor_preprocessing_cache
+from src.services.video_editing.aiditor.render_tracker import render_tracker
+from src.utils.download_cache import download_cache
+from src.utils.media_probe import media_probe
 
 load_dotenv()
 
@@ -26,72 +27,65 @@ lower_container_dimensions = [frame_width, frame_height/2]
 upper_container_center = [frame_width/2, frame_height/4]
 lower_container_center = [frame_width/2, frame_height/4*3]
 
-# Create cache directory if it doesn't exist
-CACHE_DIR = Path("cache")
-CACHE_DIR.mkdir(exist_ok=True)
+def get_url_extension(url):
+    # Extension of the URL path, query strings of signed URLs are ignored
+    return os.path.splitext(urlsplit(url).path)[1].lstrip('.').lower()
 
-def get_cached_file_path(url):
-    # Create a unique filename using URL hash
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    file_ext = url.split('.')[-1].lower()
-    return CACHE_DIR / f"{url_hash}.{file_ext}"
+MEDIA_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'mp4', 'mov', 'avi', 'webm']
 
-def download_and_cache(url):
-    cache_path = get_cached_file_path(url)
-    
-    # If file exists in cache, return the cached path
-    if cache_path.exists():
-        return str(cache_path)
-    
-    # Download and save to cache
+def is_video_url(url):
+    return get_url_extension(url) in ['mp4', 'mov', 'avi', 'webm']
+
+async def download_and_cache(url):
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
-        with open(cache_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        return str(cache_path)
+        return await download_cache.fetch(url)
     except Exception as e:
         print(f"Error downloading {url}: {str(e)}")
         return None
-    
-def get_video_duration(actor_video_url):
-    """Get the duration of a video file in milliseconds"""
+
+async def get_media_info(url):
+    """Width, height and duration of a remote file, read from its headers with range requests"""
     try:
-        video_path = download_and_cache(actor_video_url)
-        video = cv2.VideoCapture(video_path)
-        fps = video.get(cv2.CAP_PROP_FPS)
-        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = (frame_count / fps) * 1000  # Convert to milliseconds
-        video.release()
-        return int(duration)
+        return await media_probe.probe_async(url)
     except Exception as e:
-        print(f"Error getting video duration: {str(e)}")
+        print(f"Error probing {url}, downloading it instead: {str(e)}")
+    # Only files the range probe cannot read are downloaded in full
+    local_path = await download_and_cache(url)
+    if not local_path:
+        return None
+    try:
+        return await media_probe.probe_async(local_path)
+    except Exception as e:
+        print(f"Error probing {local_path}: {str(e)}")
+        return None
+
+async def get_video_duration(actor_video_url):
+    """Get the duration of a video file in milliseconds"""
+    actor_preprocessing = actor_preprocessing_cache.find_by_url(actor_video_url)
+    if actor_preprocessing:
+        return int(actor_preprocessing.duration * 1000)
+    media_info = await get_media_info(actor_video_url)
+    if media_info is None or not media_info.duration:
+        print("Error getting video duration")
         return 30000  # Default duration if unable to get actual duration
+    return int(media_info.duration * 1000)  # Convert to milliseconds
 
-def get_position_and_scale(container_center, asset_url, z_index, fit_dimension='auto', rotation=0, is_full_frame=False):
+def get_position_and_scale(container_center, asset_url, z_index, fit_dimension='auto', rotation=0, is_full_frame=False, media_info=None):
     try:
-        # Get cached file path or download
-        local_path = download_and_cache(asset_url)
-        if not local_path:
-            raise Exception("Failed to download or retrieve from cache")
-        
-        file_ext = asset_url.split('.')[-1].lower()
-        
-        if file_ext in ['jpg', 'jpeg', 'png', 'gif']:
-            media = Image.open(local_path)
-            width, height = media.size
-            
-        elif file_ext in ['mp4', 'mov', 'avi', 'webm']:
-            video = cv2.VideoCapture(local_path)
-            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            video.release()
-            
-            # If video dimensions couldn't be read, use default dimensions
+        file_ext = get_url_extension(asset_url)
+        # Actor videos are already probed by the actor preprocessing cache
+        actor_preprocessing = actor_preprocessing_cache.find_by_url(asset_url)
+
+        if actor_preprocessing:
+            width, height = actor_preprocessing.width, actor_preprocessing.height
+
+        elif file_ext in MEDIA_EXTENSIONS:
+            # create_video_json probes every file before the layout is computed
+            if media_info is None:
+                raise Exception("Failed to probe media")
+            width, height = media_info.width or 0, media_info.height or 0
+
+            # If the dimensions couldn't be read, use default dimensions
             if width == 0 or height == 0:
                 width, height = frame_width, frame_height
                 
@@ -154,6 +148,68 @@ def get_position_and_scale(container_center, asset_url, z_index, fit_dimension='
             }
         }
 
+def get_captions_clip(x_position: int, y_position: int, start_time:int, offset:int,end_time:int, caption_words: list) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "type": "caption",
+        "name": "Caption",
+        "timeFrame": {
+            "start":start_time,
+            "offset": offset,
+            "end": end_time
+        },
+        "position": {
+            "x": x_position,
+            "y": y_position,
+            "z": 10
+        },
+        "volume": 1,
+        "transform": {
+            "scale": {
+                "x": 1,
+                "y": 1
+            },
+            "rotation": 0
+        },
+        "size": {
+            "width": 500,
+            "height": 100
+        },
+        "captionProperties": {
+            "words": caption_words,
+            "highlightTextProperties": {
+                "fontSize": 80,
+                "color": "#FFFFFF",
+                "fontFamily": "Montserrat",
+                "fontWeight": 800,
+                "fontStyle": "normal",
+                "underline": False,
+                "backgroundColor": "#ff1414",
+                "padding": 8,
+                "strokeWidth": 4,
+                "strokeColor": "#000000"
+            },
+            "nonHighlightTextProperties": {
+                "fontSize": 60,
+                "color": "#ffffff",
+                "fontFamily": "Montserrat",
+                "fontWeight": 600,
+                "fontStyle": "normal",
+                "underline": False,
+                "padding": 0,
+                "strokeWidth": 4,
+                "borderWidth": 0,
+                "strokeColor": "#000000"
+            },
+            "textAlign": "center",
+            "maxWidth": 1080,
+            "maxWordsInFrame": 5
+        },
+        "textAlign": "center",
+        "maxWidth": 1080,
+        "maxWordsInFrame": 5
+    }
+
 # Video structure:
 # First 5s: Actor video
 # Middle: Alternating between AA (two assets) and AD (asset + actor) patterns
@@ -161,14 +217,13 @@ def get_position_and_scale(container_center, asset_url, z_index, fit_dimension='
 
 only_actor_time = 5000
 
-def create_video_json(actor_video_url, total_duration, assets, background_color_hex="#000000"):
-    # Download files first...
-    print("Caching actor video...")
-    download_and_cache(actor_video_url)
-    
-    print("Caching assets...")
-    for asset_url in assets:
-        download_and_cache(asset_url)
+async def create_video_json(actor_video_url, total_duration, assets, background_color_hex="#000000", caption_words=None):
+    # Probe the headers of all files first, concurrently. Nothing is downloaded: the render service
+    # fetches the sources itself. A preprocessed actor video is already probed.
+    urls = [url for url in dict.fromkeys([actor_video_url, *assets])
+            if get_url_extension(url) in MEDIA_EXTENSIONS and not actor_preprocessing_cache.find_by_url(url)]
+    print(f"Probing {len(urls)} files...")
+    media_infos = dict(zip(urls, await asyncio.gather(*[get_media_info(url) for url in urls])))
     
     n = len(assets)
     P = floor(n/3)
@@ -180,10 +235,11 @@ def create_video_json(actor_video_url, total_duration, assets, background_color_
     
     clips = []
 
-    clips.append(get_captions_clip(x_position=540,y_position=1600,start_time=0,offset=0,end_time=only_actor_time))
+    if caption_words:
+        clips.append(get_captions_clip(x_position=540,y_position=1600,start_time=0,offset=0,end_time=only_actor_time,caption_words=caption_words))
     
     # First 5 seconds - Actor video (full screen)
-    actor_start = get_position_and_scale(frame_center, actor_video_url, 0, 'height', 0, True)
+    actor_start = get_position_and_scale(frame_center, actor_video_url, 0, 'height', 0, True, media_infos.get(actor_video_url))
     clips.append({
         "id": str(uuid.uuid4()),
         "type": "video",
@@ -208,7 +264,8 @@ def create_video_json(actor_video_url, total_duration, assets, background_color_
     remaining_ad = AD
     
     
-    clips.append(get_captions_clip(x_position=540,y_position=960,start_time=current_time,offset=current_time,end_time=current_time+total_duration_of_asset_screens))
+    if caption_words:
+        clips.append(get_captions_clip(x_position=540,y_position=960,start_time=current_time,offset=current_time,end_time=current_time+total_duration_of_asset_screens,caption_words=caption_words))
 
     while remaining_aa > 0 or remaining_ad > 0:
         # Handle AA pattern
@@ -242,10 +299,10 @@ def create_video_json(actor_video_url, total_duration, assets, background_color_
             })
             
             # First asset in upper container
-            upper_asset = get_position_and_scale(upper_container_center, assets[asset_index], 2)
+            upper_asset = get_position_and_scale(upper_container_center, assets[asset_index], 2, media_info=media_infos.get(assets[asset_index]))
             clips.append({
                 "id": str(uuid.uuid4()),
-                "type": "video" if assets[asset_index].lower().endswith(('mp4', 'mov', 'avi', 'webm')) else "image",
+                "type": "video" if is_video_url(assets[asset_index]) else "image",
                 "name": assets[asset_index].split('/')[-1],
                 "source": assets[asset_index],
                 "timeFrame": {
@@ -260,10 +317,10 @@ def create_video_json(actor_video_url, total_duration, assets, background_color_
             
             # Second asset in lower container
             asset_index += 1
-            lower_asset = get_position_and_scale(lower_container_center, assets[asset_index], 2)
+            lower_asset = get_position_and_scale(lower_container_center, assets[asset_index], 2, media_info=media_infos.get(assets[asset_index]))
             clips.append({
                 "id": str(uuid.uuid4()),
-                "type": "video" if assets[asset_index].lower().endswith(('mp4', 'mov', 'avi', 'webm')) else "image",
+                "type": "video" if is_video_url(assets[asset_index]) else "image",
                 "name": assets[asset_index].split('/')[-1],
                 "source": assets[asset_index],
                 "timeFrame": {
@@ -282,10 +339,10 @@ def create_video_json(actor_video_url, total_duration, assets, background_color_
         # Handle AD pattern
         if remaining_ad > 0:
             # Asset in upper container
-            upper_asset = get_position_and_scale(upper_container_center, assets[asset_index], 2)
+            upper_asset = get_position_and_scale(upper_container_center, assets[asset_index], 2, media_info=media_infos.get(assets[asset_index]))
             clips.append({
                 "id": str(uuid.uuid4()),
-                "type": "video" if assets[asset_index].lower().endswith(('mp4', 'mov', 'avi', 'webm')) else "image",
+                "type": "video" if is_video_url(assets[asset_index]) else "image",
                 "name": assets[asset_index].split('/')[-1],
                 "source": assets[asset_index],
                 "timeFrame": {
@@ -300,7 +357,7 @@ def create_video_json(actor_video_url, total_duration, assets, background_color_
             
             # If this is the first AD pattern, add the continuous actor video
             if remaining_ad == AD:
-                actor_clip = get_position_and_scale(lower_container_center, actor_video_url, 0)
+                actor_clip = get_position_and_scale(lower_container_center, actor_video_url, 0, media_info=media_infos.get(actor_video_url))
                 clips.append({
                     "id": str(uuid.uuid4()),
                     "type": "video",
@@ -323,10 +380,11 @@ def create_video_json(actor_video_url, total_duration, assets, background_color_
 
     
         
-    clips.append(get_captions_clip(x_position=540,y_position=1600,start_time=current_time,offset=current_time,end_time=total_duration))
+    if caption_words:
+        clips.append(get_captions_clip(x_position=540,y_position=1600,start_time=current_time,offset=current_time,end_time=total_duration,caption_words=caption_words))
     
     # Last 5 seconds - Actor video (full screen)
-    actor_end = get_position_and_scale(frame_center, actor_video_url, 0, 'height', 0, True)
+    actor_end = get_position_and_scale(frame_center, actor_video_url, 0, 'height', 0, True, media_infos.get(actor_video_url))
     clips.append({
         "id": str(uuid.uuid4()),
         "type": "video",
@@ -411,63 +469,7 @@ def render_video(video_json: Dict) -> Optional[str]:
         print(f"Error initiating render: {str(e)}")
         return None
 
-def monitor_render_progress(render_id: str, max_attempts: int = 60) -> Optional[str]:
-    """
-    Monitor the rendering progress and return the output URL when complete
-    
-    Args:
-        render_id (str): The render ID to monitor
-        max_attempts (int): Maximum number of attempts to check status (default: 60)
-    
-    Returns:
-        Optional[str]: The output URL if successful, None otherwise
-    """
-    API_KEY = os.environ.get('VIDEOAIDITOR_API_KEY')
-    if not API_KEY:
-        print("Error: VIDEOAIDITOR_API_KEY environment variable not set")
-        return None
-    
-    headers = {
-        'x-api-key': API_KEY
-    }
-    
-    attempt = 0
-    while attempt < max_attempts:
-        try:
-            response = requests.get(
-                f'https://api.videoaiditor.com/v1/renders/{render_id}',
-                headers=headers
-            )
-            response.raise_for_status()
-            
-            data = response.json()['data']
-            status = data.get('status')
-            
-            if status == 'completed':
-                output_url = data.get('outputUrl')
-                print(f"\nRendering completed!")
-                print(f"Output URL: {output_url}")
-                return output_url
-            
-            elif status == 'failed':
-                error = data.get('error', 'Unknown error')
-                print(f"\nRendering failed: {error}")
-                return None
-            
-            else:
-                print(f"Rendering in progress... Status: {status}")
-                time.sleep(60)  # Wait 60 seconds before next check
-                attempt += 1
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Error checking render status: {str(e)}")
-            return None
-    
-    print("Timeout: Maximum attempts reached")
-    return None
-
-
-def create_and_render_video(actor_url: str, total_duration: int, assets: list) -> Optional[str]:
+async def create_and_render_video(actor_url: str, total_duration: int, assets: list, caption_words: Optional[list] = None) -> Optional[str]:
     """
     Create video JSON and initiate rendering
     
@@ -475,19 +477,19 @@ def create_and_render_video(actor_url: str, total_duration: int, assets: list) -
         Optional[str]: The output URL if successful, None otherwise
     """
     # Create video JSON template
-    video_json = create_video_json(actor_url, total_duration, assets)
+    video_json = await create_video_json(actor_url, total_duration, assets, caption_words=caption_words)
     
     # Initiate rendering
-    render_id = render_video(video_json)
+    render_id = await asyncio.to_thread(render_video, video_json)
     if not render_id:
         return None
     
-    # Monitor progress and get output URL
-    return monitor_render_progress(render_id)
+    # Wait for the videoaiditor webhook (or the fallback poller) and get output URL
+    return await render_tracker.wait(render_id)
 
 if __name__ == "__main__":
     actor_url = "https://aiditor-uploads.s3.ap-south-1.amazonaws.com/uploads/4cd491c7-f68c-46e1-9cda-089a883076d0.mp4"
-    total_duration = get_video_duration(actor_video_url=actor_url) 
+    total_duration = asyncio.run(get_video_duration(actor_video_url=actor_url))
     assets = [
         "https://aiditor-uploads.s3.ap-south-1.amazonaws.com/uploads/72ac7657-7164-4442-bb4e-15851e9fc4e8.jpg",
         "https://aiditor-uploads.s3.ap-south-1.amazonaws.com/uploads/573135ba-9dcb-4690-993b-5bc943c36582.jpg",
@@ -878,71 +880,7 @@ if __name__ == "__main__":
           }
         ]
     
-    def get_captions_clip(x_position: int, y_position: int, start_time:int, offset:int,end_time:int) -> dict:
-        import uuid
-        
-        return {
-            "id": str(uuid.uuid4()),
-            "type": "caption",
-            "name": "Caption",
-            "timeFrame": {
-                "start":start_time,
-                "offset": offset,
-                "end": end_time
-            },
-            "position": {
-                "x": x_position,
-                "y": y_position,
-                "z": 10
-            },
-            "volume": 1,
-            "transform": {
-                "scale": {
-                    "x": 1,
-                    "y": 1
-                },
-                "rotation": 0
-            },
-            "size": {
-                "width": 500,
-                "height": 100
-            },
-            "captionProperties": {
-                "words": caption_words,
-                "highlightTextProperties": {
-                    "fontSize": 80,
-                    "color": "#FFFFFF",
-                    "fontFamily": "Montserrat",
-                    "fontWeight": 800,
-                    "fontStyle": "normal",
-                    "underline": False,
-                    "backgroundColor": "#ff1414",
-                    "padding": 8,
-                    "strokeWidth": 4,
-                    "strokeColor": "#000000"
-                },
-                "nonHighlightTextProperties": {
-                    "fontSize": 60,
-                    "color": "#ffffff",
-                    "fontFamily": "Montserrat",
-                    "fontWeight": 600,
-                    "fontStyle": "normal",
-                    "underline": False,
-                    "padding": 0,
-                    "strokeWidth": 4,
-                    "borderWidth": 0,
-                    "strokeColor": "#000000"
-                },
-                "textAlign": "center",
-                "maxWidth": 1080,
-                "maxWordsInFrame": 5
-            },
-            "textAlign": "center",
-            "maxWidth": 1080,
-            "maxWordsInFrame": 5
-        }
-
-    output_url = create_and_render_video(actor_url, total_duration, assets)
+    output_url = asyncio.run(create_and_render_video(actor_url, total_duration, assets, caption_words))
     # create_video_json(actor_url, total_duration, assets, captions_clip)
     if output_url:
         print(f"\nFinal video URL: {output_url}")
\ No newline at end of file
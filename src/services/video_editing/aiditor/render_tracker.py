@@ -0,0 +1,184 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+import aiohttp
+from cachetools import TTLCache
+from pydantic import BaseModel
+from src.config.settings import Settings
+from src.utils.logger import logger
+from src.workflow.job_queue import JobQueue, job_queue
+
+RENDERS_URL = "https://api.videoaiditor.com/v1/renders"
+# Fallback polling starts short (fast renders, lost webhooks) and backs off to one poll a minute
+POLL_INITIAL_INTERVAL = 5
+POLL_MAX_INTERVAL = 60
+POLL_BACKOFF = 1.5
+# Same budget as the old 60 polls a minute apart
+RENDER_TIMEOUT = 3600
+# Webhooks for renders nobody is waiting on yet (the webhook can beat the render POST's response)
+EARLY_RESULT_TTL = 600
+# Seconds between checks of the job store for results the webhook recorded
+RESULT_CHECK_INTERVAL = 1.0
+
+class RenderResult(BaseModel):
+    render_id: str
+    status: str  # "completed" or "failed"
+    output_url: Optional[str] = None
+    error: Optional[str] = None
+
+class PendingRender:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.interval = POLL_INITIAL_INTERVAL
+        self.next_poll_at = time.monotonic() + POLL_INITIAL_INTERVAL
+
+class RenderTracker:
+    """
+    Completion of videoaiditor renders as awaitable futures. Renders wait in the worker processes
+    while the webhook arrives in the API, so the webhook records the render's result in the job
+    store and one shared loop per process picks it up from there every RESULT_CHECK_INTERVAL.
+    The same loop covers renders whose webhook never comes: it polls each outstanding render at
+    videoaiditor with its own backoff.
+    """
+    def __init__(self, store: JobQueue = job_queue):
+        self.store = store
+        self._pending: Dict[str, PendingRender] = {}
+        self._early_results: TTLCache = TTLCache(maxsize=1024, ttl=EARLY_RESULT_TTL)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def get_wakeup(self) -> asyncio.Event:
+        # Futures and the poller belong to the running loop; a new loop (e.g. asyncio.run in a script) starts over
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._pending = {}
+            self._poller = None
+            self._wakeup = asyncio.Event()
+            self._loop = loop
+        return self._wakeup
+
+    def track(self, render_id: str) -> asyncio.Future:
+        wakeup = self.get_wakeup()
+        if render_id in self._pending:
+            return self._pending[render_id].future
+        future = self._loop.create_future()
+        early_result = self._early_results.pop(render_id, None)
+        if early_result is not None:
+            future.set_result(early_result)
+            return future
+
+        self._pending[render_id] = PendingRender(future)
+        if self._poller is None or self._poller.done():
+            self._poller = self._loop.create_task(self.poll_loop())
+        wakeup.set()
+        return future
+
+    async def wait(self, render_id: str, timeout: float = RENDER_TIMEOUT) -> Optional[str]:
+        """
+        Output URL of the render, None when it failed or did not finish in time.
+        """
+        future = self.track(render_id)
+        try:
+            result: RenderResult = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout waiting for render {render_id}")
+            return None
+        finally:
+            pending = self._pending.get(render_id)
+            if pending is not None and pending.future is future:
+                self._pending.pop(render_id, None)
+
+        if result.status == "completed":
+            logger.info(f"Render {render_id} completed: {result.output_url}")
+            return result.output_url
+        logger.error(f"Render {render_id} failed: {result.error}")
+        return None
+
+    def get_result_key(self, render_id: str) -> str:
+        return f"videoaiditor/{render_id}"
+
+    async def record(self, render_id: str) -> Optional[RenderResult]:
+        """
+        Record the result of a render the webhook reported finished, for the process waiting on it.
+        The webhook is not signed, so the status is fetched from videoaiditor rather than taken
+        from its body. None when videoaiditor does not report the render finished.
+        """
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            result = await self.fetch_status(session, render_id)
+        if result is None:
+            return None
+        await asyncio.to_thread(self.store.arrive, self.get_result_key(render_id), "result", result.model_dump(), ["result"])
+        return result
+
+    def check_recorded(self) -> List[RenderResult]:
+        results = []
+        for render_id in list(self._pending):
+            recorded = self.store.get_join(self.get_result_key(render_id)).get("result")
+            if recorded is not None:
+                results.append(RenderResult(**recorded))
+        return results
+
+    def resolve(self, result: RenderResult) -> bool:
+        """
+        Complete a render from its recorded webhook result or a poll. Returns False when nobody in this process is
+        waiting on it yet; the result is then kept for a later track().
+        """
+        pending = self._pending.pop(result.render_id, None)
+        if pending is None:
+            self._early_results[result.render_id] = result
+            return False
+        if not pending.future.done():
+            pending.future.set_result(result)
+        return True
+
+    async def fetch_status(self, session: aiohttp.ClientSession, render_id: str) -> Optional[RenderResult]:
+        async with session.get(f"{RENDERS_URL}/{render_id}", headers={"x-api-key": Settings.VIDEOAIDITOR_API_KEY or ""}) as response:
+            response.raise_for_status()
+            data = (await response.json())["data"]
+        status = data.get("status")
+        if status not in ("completed", "failed"):
+            return None
+        return RenderResult(render_id=render_id, status=status, output_url=data.get("outputUrl"),
+                            error=data.get("error") or "Unknown error" if status == "failed" else None)
+
+    async def poll(self, session: aiohttp.ClientSession, render_id: str, pending: PendingRender) -> None:
+        try:
+            result = await self.fetch_status(session, render_id)
+        except Exception as e:
+            logger.warning(f"Error checking render status of {render_id}: {e}")
+            result = None
+        if result is not None:
+            self.resolve(result)
+            return
+        pending.interval = min(pending.interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+        pending.next_poll_at = time.monotonic() + pending.interval
+
+    async def poll_loop(self) -> None:
+        wakeup = self._wakeup
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            while self._pending:
+                wakeup.clear()
+                try:
+                    for result in await asyncio.to_thread(self.check_recorded):
+                        self.resolve(result)
+                except Exception as e:
+                    logger.warning(f"Error checking recorded render results: {e}")
+                now = time.monotonic()
+                due = [(render_id, pending) for render_id, pending in list(self._pending.items())
+                       if pending.next_poll_at <= now and not pending.future.done()]
+                if due:
+                    logger.debug(f"Polling {len(due)}/{len(self._pending)} outstanding renders")
+                    await asyncio.gather(*[self.poll(session, render_id, pending) for render_id, pending in due])
+                    continue
+
+                if not self._pending:
+                    break
+                next_poll_at = min([pending.next_poll_at for pending in self._pending.values()] + [now + RESULT_CHECK_INTERVAL])
+                try:
+                    # A newly tracked render wakes the loop up early
+                    await asyncio.wait_for(wakeup.wait(), max(0.0, next_poll_at - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+
+render_tracker = RenderTracker()
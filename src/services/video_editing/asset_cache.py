@@ -0,0 +1,186 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
+from cachetools import LRUCache
+from PIL import Image
+from src.config.settings import Settings
+from src.models.base_models import Asset, AssetType
+from src.utils.logger import logger
+from src.utils.video_utils import OUTPUT_FPS, get_x264_args, run_ffmpeg
+
+# Same (245, 243, 242) background generate_asset_video always padded the assets with
+ASSET_BACKGROUND_COLOR = (245, 243, 242)
+# Lock file in the cache dir, the render workers of all processes evict one at a time
+EVICTION_LOCK_NAME = ".evict.lock"
+# Entries used this recently may still be read by a render in another process and are kept
+EVICTION_GRACE_SECONDS = 600
+
+def get_fit_size(source_size: Tuple[int, int], frame_size: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Largest size with the source aspect ratio that fits the frame, rounded like generate_asset_video did.
+    """
+    source_width, source_height = source_size
+    width, height = frame_size
+    source_aspect_ratio = source_width / source_height
+    if source_aspect_ratio > width / height:
+        return width, int(width / source_aspect_ratio)
+    return int(height * source_aspect_ratio), height
+
+class NormalizedAssetCache:
+    """
+    Disk cache of assets already scaled and padded to the output frame: a PNG for images and a
+    constant fps mp4 of the segment duration for videos. Entries are keyed by the content hash of the
+    source file plus target size, background colour and duration policy, so the same product image
+    uploaded to different projects is normalized once. The least recently used entries are evicted
+    when the cache grows past max_bytes, under a file lock since several processes share the cache.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # (path, mtime, size) -> sha256, so files are hashed once per process
+        self._content_hashes = LRUCache(maxsize=1024)
+        self.hits = 0
+        self.misses = 0
+
+    def get_content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        content_hash = self._content_hashes.get(key)
+        if content_hash is None:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            content_hash = digest.hexdigest()
+            self._content_hashes[key] = content_hash
+        return content_hash
+
+    def get_entry_path(self, asset: Asset, frame_size: Tuple[int, int], background_color: Tuple[int, int, int],
+                       duration: Optional[float]) -> str:
+        if asset.type == AssetType.IMAGE:
+            duration_policy, extension = "still", "png"
+        else:
+            # Shorter videos are looped and longer ones trimmed to the segment duration
+            duration_policy, extension = f"loop_trim_{duration:.3f}s_{OUTPUT_FPS}fps", "mp4"
+        key = "|".join([
+            self.get_content_hash(asset.local_path),
+            f"{frame_size[0]}x{frame_size[1]}",
+            "%02x%02x%02x" % background_color,
+            duration_policy,
+        ])
+        entry_name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, entry_name[:2], f"{entry_name}.{extension}")
+
+    def get_normalized_asset(self, asset: Asset, frame_size: Tuple[int, int], duration: Optional[float] = None,
+                             background_color: Tuple[int, int, int] = ASSET_BACKGROUND_COLOR) -> str:
+        """
+        Path of the normalized asset, creating it on a miss.
+        """
+        if asset.type not in (AssetType.IMAGE, AssetType.VIDEO):
+            raise ValueError(f"Unsupported asset type: {asset.type}")
+        if asset.type == AssetType.VIDEO and duration is None:
+            raise ValueError("Video assets need a segment duration")
+
+        entry_path = self.get_entry_path(asset, frame_size, background_color, duration)
+        if os.path.exists(entry_path):
+            self.hits += 1
+            # mtime is the LRU clock
+            os.utime(entry_path)
+            logger.debug(f"Normalized asset cache hit for {asset.local_path}: {entry_path}")
+            return entry_path
+
+        self.misses += 1
+        logger.info(f"Normalizing asset {asset.local_path} to {frame_size[0]}x{frame_size[1]}")
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        root, extension = os.path.splitext(entry_path)
+        # Unique temp name so concurrent renders never see a half written entry
+        temp_path = f"{root}.{uuid.uuid4().hex}.tmp{extension}"
+        try:
+            if asset.type == AssetType.IMAGE:
+                normalize_image(asset.local_path, temp_path, frame_size, background_color)
+            else:
+                normalize_video(asset.local_path, temp_path, frame_size, background_color, duration)
+            os.replace(temp_path, entry_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.evict()
+        return entry_path
+
+    def evict(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock, open(os.path.join(self.cache_dir, EVICTION_LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for filename in files:
+                    if ".tmp" in filename or filename == EVICTION_LOCK_NAME:
+                        continue
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            in_use_since = time.time() - EVICTION_GRACE_SECONDS
+            for mtime, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes or mtime > in_use_since:
+                    break
+                try:
+                    os.remove(path)
+                    total_bytes -= size
+                    logger.info(f"Evicted normalized asset {path}")
+                except FileNotFoundError:
+                    continue
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+def normalize_image(input_path: str, output_path: str, frame_size: Tuple[int, int],
+                    background_color: Tuple[int, int, int]) -> str:
+    """
+    Scale the image to fit the frame and centre it on the background colour.
+    """
+    with Image.open(input_path) as image:
+        image = image.convert("RGBA")
+        fit_size = get_fit_size(image.size, frame_size)
+        image = image.resize(fit_size, Image.LANCZOS)
+
+    frame = Image.new("RGB", frame_size, background_color)
+    position = ((frame_size[0] - fit_size[0]) // 2, (frame_size[1] - fit_size[1]) // 2)
+    frame.paste(image, position, image)
+    frame.save(output_path, format="PNG", compress_level=1)
+    return output_path
+
+def normalize_video(input_path: str, output_path: str, frame_size: Tuple[int, int],
+                    background_color: Tuple[int, int, int], duration: float) -> str:
+    """
+    Loop or trim the video to the duration, scale it to fit the frame, pad it with the background
+    colour and re-encode it at the output fps with the shared segment encoder settings.
+    """
+    width, height = frame_size
+    color = "0x%02X%02X%02X" % background_color
+    run_ffmpeg([
+        "-stream_loop", "-1", "-i", input_path,
+        "-t", f"{duration:.3f}",
+        "-frames:v", str(round(duration * OUTPUT_FPS)),
+        "-vf", (
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color={color},setsar=1,fps={OUTPUT_FPS}"
+        ),
+        "-an",
+        *get_x264_args(),
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    return output_path
+
+normalized_asset_cache = NormalizedAssetCache(Settings.ASSET_CACHE_DIR, Settings.ASSET_CACHE_MAX_BYTES)
@@ -0,0 +1,137 @@
+import os
+import shutil
+from typing import List, Optional, Tuple
+from src.models.base_models import Asset, AssetType
+from src.services.video_editing.asset_cache import normalized_asset_cache
+from src.utils.logger import logger
+from src.utils.video_utils import OUTPUT_FPS, get_segment_pool, get_x264_args, run_ffmpeg
+
+# A still segment is encoded as a short unit that the concat playlist repeats. x264 spends about as
+# much on an unchanged P frame as on the keyframe, so short units are faster while the extra
+# keyframes of a still are small; 0.2s keeps the intermediate around 1-2 Mbps.
+STILL_UNIT_FRAMES = OUTPUT_FPS // 5
+
+def get_segment_frame_counts(segment_count: int, final_video_length: float) -> List[int]:
+    """
+    Frames per segment with the boundaries rounded on the output timeline, so the segments add up
+    to the exact video length instead of drifting by a frame per segment.
+    """
+    segment_duration = final_video_length / segment_count
+    boundaries = [round(index * segment_duration * OUTPUT_FPS) for index in range(segment_count + 1)]
+    return [end - start for start, end in zip(boundaries, boundaries[1:])]
+
+def encode_still_segment(image_path: str, frame_count: int, output_dir: str, name: str,
+                         tune: Optional[str] = "stillimage") -> List[str]:
+    """
+    Encode a segment from a single pre-composited frame. Only one unit of the still is encoded
+    (plus a shorter tail) and the concat playlist repeats that unit for the rest of the segment,
+    since every unit of a still is identical. Returns the playlist entries for the segment.
+    """
+    units, tail_frames = divmod(frame_count, STILL_UNIT_FRAMES)
+    entries = []
+    for suffix, unit_frames, repeat in (("unit", STILL_UNIT_FRAMES, units), ("tail", tail_frames, 1)):
+        if not unit_frames or not repeat:
+            continue
+        unit_path = os.path.join(output_dir, f"{name}_{suffix}.mp4")
+        run_ffmpeg([
+            "-loop", "1", "-framerate", str(OUTPUT_FPS), "-i", image_path,
+            "-frames:v", str(unit_frames),
+            *get_x264_args(tune),
+            unit_path,
+        ])
+        entries += [unit_path] * repeat
+    return entries
+
+def concat_segments(segment_paths: List[str], output_path: str) -> str:
+    """
+    Join segments encoded with identical parameters using the concat demuxer and stream copy.
+    """
+    playlist_path = f"{os.path.splitext(output_path)[0]}.ffconcat"
+    with open(playlist_path, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for segment_path in segment_paths:
+            f.write(f"file '{os.path.abspath(segment_path)}'\n")
+    try:
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", playlist_path,
+            "-c", "copy",
+            "-movflags", "+faststart",
+            output_path,
+        ])
+    finally:
+        os.remove(playlist_path)
+    return output_path
+
+def encode_asset_segment(asset: Asset, frame_count: int, frame_size: Tuple[int, int], output_dir: str, name: str,
+                         tune: Optional[str] = None) -> List[str]:
+    """
+    Worker: build the segment of one asset and return its playlist entries. Decoding happens in
+    ffmpeg, so a worker never holds more than the one clip it is encoding.
+    """
+    if asset.type == AssetType.IMAGE:
+        image_path = normalized_asset_cache.get_normalized_asset(asset, frame_size)
+        return encode_still_segment(image_path, frame_count, output_dir, name, tune)
+
+    # The normalized video already is a segment encoded with the shared settings
+    normalized_path = normalized_asset_cache.get_normalized_asset(asset, frame_size, frame_count / OUTPUT_FPS)
+    segment_path = os.path.join(output_dir, f"{name}.mp4")
+    try:
+        # Link rather than reference the cache entry, so eviction cannot remove it before the concat
+        os.link(normalized_path, segment_path)
+    except OSError:
+        shutil.copyfile(normalized_path, segment_path)
+    return [segment_path]
+
+def build_asset_video(assets: List[Asset], final_video_length: float, frame_size: Tuple[int, int], output_path: str,
+                      workers: int = 1) -> str:
+    """
+    Encode every asset segment in its own worker process with matching codec parameters, fps, GOP
+    and pixel format, then stitch the segments with stream copy.
+    Image-only reels use the stillimage tune; it changes the PPS, so mixed reels encode their stills
+    with the same settings as the video segments.
+    """
+    valid_assets = []
+    for asset in assets:
+        if asset.type in (AssetType.IMAGE, AssetType.VIDEO):
+            valid_assets.append(asset)
+        else:
+            logger.warning(f"Unsupported asset type: {asset.type}. Skipping this asset.")
+    if not valid_assets:
+        logger.error("No valid clips to concatenate")
+        raise ValueError("No valid clips to concatenate")
+
+    tune = "stillimage" if all(asset.type == AssetType.IMAGE for asset in valid_assets) else None
+    frame_counts = get_segment_frame_counts(len(valid_assets), final_video_length)
+    workers = max(1, min(workers, len(valid_assets)))
+    logger.info(f"Building asset video from {len(valid_assets)} segments with {workers} workers")
+
+    segments_dir = f"{os.path.splitext(output_path)[0]}_segments"
+    os.makedirs(segments_dir, exist_ok=True)
+    try:
+        segment_args = [
+            (asset, frame_count, frame_size, segments_dir, f"segment_{index:03d}", tune)
+            for index, (asset, frame_count) in enumerate(zip(valid_assets, frame_counts))
+        ]
+        if workers == 1:
+            segment_entries = [encode_asset_segment(*args) for args in segment_args]
+        else:
+            with get_segment_pool(workers) as executor:
+                segment_entries = list(executor.map(encode_asset_segment, *zip(*segment_args)))
+        concat_segments([entry for entries in segment_entries for entry in entries], output_path)
+    finally:
+        shutil.rmtree(segments_dir, ignore_errors=True)
+
+    logger.info(f"Asset video written to {output_path}")
+    return output_path
+
+def render_image_slideshow(assets: List[Asset], final_video_length: float, frame_size: Tuple[int, int],
+                           output_path: str, workers: int = 1) -> str:
+    """
+    Asset video for reels made only of images: every image is normalized once (cached), encoded as
+    a still segment with the stillimage tune and the segments are joined without re-encoding.
+    """
+    if not assets or any(asset.type != AssetType.IMAGE for asset in assets):
+        raise ValueError("The image slideshow only supports image assets")
+
+    logger.info(f"Rendering image slideshow of {len(assets)} images")
+    return build_asset_video(assets, final_video_length, frame_size, output_path, workers)
@@ -0,0 +1,109 @@
+import os
+from typing import Iterator, List, Tuple
+import cv2
+import numpy as np
+from pydantic import BaseModel
+from src.models.base_models import Asset, AssetType
+from src.services.video_editing.asset_cache import normalized_asset_cache
+from src.services.video_editing.asset_segments import get_segment_frame_counts
+from src.utils.logger import logger
+from src.utils.video_utils import OUTPUT_FPS
+
+class AssetTimelineSegment(BaseModel):
+    asset: Asset
+    frame_count: int
+
+class AssetTimeline(BaseModel):
+    """
+    The asset track as a list of segments instead of an encoded mp4. frames() yields the track frame
+    by frame from the normalized asset cache, so the combine stage can composite it directly.
+    Saved as a small JSON manifest in place of the intermediate asset video.
+    """
+    frame_size: Tuple[int, int]
+    segments: List[AssetTimelineSegment]
+
+    @classmethod
+    def from_assets(cls, assets: List[Asset], final_video_length: float, frame_size: Tuple[int, int]) -> "AssetTimeline":
+        valid_assets = []
+        for asset in assets:
+            if asset.type in (AssetType.IMAGE, AssetType.VIDEO):
+                valid_assets.append(asset)
+            else:
+                logger.warning(f"Unsupported asset type: {asset.type}. Skipping this asset.")
+        if not valid_assets:
+            logger.error("No valid clips to concatenate")
+            raise ValueError("No valid clips to concatenate")
+
+        frame_counts = get_segment_frame_counts(len(valid_assets), final_video_length)
+        return cls(
+            frame_size=frame_size,
+            segments=[AssetTimelineSegment(asset=asset, frame_count=count) for asset, count in zip(valid_assets, frame_counts)],
+        )
+
+    @property
+    def frame_count(self) -> int:
+        return sum(segment.frame_count for segment in self.segments)
+
+    def get_normalized_path(self, segment: AssetTimelineSegment) -> str:
+        # A cache hit unless the entry was evicted since prepare(), in which case it is rebuilt
+        return normalized_asset_cache.get_normalized_asset(segment.asset, self.frame_size, segment.frame_count / OUTPUT_FPS)
+
+    def prepare(self) -> None:
+        """
+        Normalize every asset into the cache. This is the asset stage's work when streaming;
+        compositing only has to read the prepared frames.
+        """
+        for segment in self.segments:
+            self.get_normalized_path(segment)
+        logger.info(f"Prepared {len(self.segments)} asset segments ({self.frame_count} frames), cache: {normalized_asset_cache.stats()}")
+
+    def frames(self) -> Iterator[np.ndarray]:
+        """
+        BGR frames of the asset track at the output fps. A still yields the same array for its whole
+        segment and only one video is open at a time, so memory stays at about one frame.
+        """
+        for segment in self.segments:
+            normalized_path = self.get_normalized_path(segment)
+            if segment.asset.type == AssetType.IMAGE:
+                frame = cv2.imread(normalized_path)
+                if frame is None:
+                    raise ValueError(f"Cannot read normalized asset: {normalized_path}")
+                for _ in range(segment.frame_count):
+                    yield frame
+                continue
+
+            cap = cv2.VideoCapture(normalized_path)
+            if not cap.isOpened():
+                raise ValueError(f"Cannot open normalized asset: {normalized_path}")
+            try:
+                frame = None
+                for _ in range(segment.frame_count):
+                    ret, next_frame = cap.read()
+                    if ret:
+                        frame = next_frame
+                    elif frame is None:
+                        raise ValueError(f"No frames in normalized asset: {normalized_path}")
+                    # A short read holds the last frame rather than shifting the following segments
+                    yield frame
+            finally:
+                cap.release()
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.model_dump_json())
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "AssetTimeline":
+        with open(path) as f:
+            return cls.model_validate_json(f.read())
+
+def prepare_asset_timeline(assets: List[Asset], final_video_length: float, frame_size: Tuple[int, int], manifest_path: str) -> str:
+    """
+    Streaming counterpart of build_asset_video: normalizes the assets and writes the timeline
+    manifest instead of encoding the asset video.
+    """
+    timeline = AssetTimeline.from_assets(assets, final_video_length, frame_size)
+    timeline.prepare()
+    return timeline.save(manifest_path)
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+from typing import Callable, List
+import numpy as np
+from PIL import Image, ImageDraw
+from src.config.settings import Settings
+from src.models.base_models import AspectRatio, Asset, AssetType
+from src.services.video_editing.asset_segments import build_asset_video
+from src.services.video_editing.edit_asset_video import generate_asset_video
+from src.utils.logger import logger
+
+REEL_LENGTH = 30
+REEL_IMAGES = 9
+
+def create_sample_images(output_dir: str, count: int = REEL_IMAGES) -> List[Asset]:
+    """
+    Product-shot like images (soft gradient background, a few solid shapes) with mixed sizes.
+    """
+    rng = np.random.default_rng(0)
+    sizes = [(1200, 1200), (1600, 1200), (1080, 1920), (2000, 1500), (900, 1600)]
+    assets = []
+    for index in range(count):
+        width, height = sizes[index % len(sizes)]
+        top, bottom = rng.integers(0, 255, 3), rng.integers(0, 255, 3)
+        gradient = np.linspace(0, 1, height)[:, None, None]
+        pixels = (top * (1 - gradient) + bottom * gradient).repeat(width, axis=1).astype(np.uint8)
+        image = Image.fromarray(pixels)
+        draw = ImageDraw.Draw(image)
+        for _ in range(4):
+            x, y = int(rng.integers(0, width // 2)), int(rng.integers(0, height // 2))
+            draw.ellipse([x, y, x + width // 3, y + height // 3], fill=tuple(int(c) for c in rng.integers(0, 255, 3)))
+        draw.text((width // 10, height // 10), f"Product {index}", fill=(0, 0, 0))
+
+        image_path = os.path.join(output_dir, f"product_{index}.jpg")
+        image.save(image_path, quality=90)
+        assets.append(Asset(type=AssetType.IMAGE, local_path=image_path, description=f"product {index}"))
+    return assets
+
+def time_render(render: Callable[[], str]) -> float:
+    started_at = time.perf_counter()
+    render()
+    return time.perf_counter() - started_at
+
+if __name__ == "__main__":
+    # python -m src.services.video_editing.benchmark_asset_video
+    with tempfile.TemporaryDirectory() as work_dir:
+        assets = create_sample_images(work_dir)
+        aspect_ratio = AspectRatio.NINE_SIXTEEN.value
+
+        # The first run also fills the normalized asset cache, the others reuse it
+        cold_time = time_render(lambda: generate_asset_video(assets, REEL_LENGTH, aspect_ratio, os.path.join(work_dir, "cold.mp4"),
+                                                             use_still_image_path=False))
+        general_time = time_render(lambda: generate_asset_video(assets, REEL_LENGTH, aspect_ratio, os.path.join(work_dir, "general.mp4"),
+                                                                use_still_image_path=False))
+        still_time = time_render(lambda: generate_asset_video(assets, REEL_LENGTH, aspect_ratio, os.path.join(work_dir, "still.mp4")))
+        segments_time = time_render(lambda: build_asset_video(assets, REEL_LENGTH, (1080, 1920), os.path.join(work_dir, "segments.mp4"),
+                                                              Settings.ASSET_VIDEO_WORKERS))
+
+    logger.info(f"{REEL_IMAGES}-image {REEL_LENGTH}s reel, {os.cpu_count()} CPUs")
+    logger.info(f"General path, cold cache: {cold_time:.1f}s")
+    logger.info(f"General path, warm cache: {general_time:.1f}s")
+    logger.info(f"Still-image path, warm cache: {still_time:.1f}s ({general_time / still_time:.1f}x faster)")
+    logger.info(f"Segment workers ({Settings.ASSET_VIDEO_WORKERS}), warm cache: {segments_time:.1f}s ({general_time / segments_time:.1f}x faster)")
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+from typing import Callable, Iterator
+import cv2
+import numpy as np
+from src.services.video_editing.combine_videos import (blend_bubble, combine_frames_bubble, combine_frames_vertically, combine_videos_bubble,
+                                                        combine_videos_vertically, get_bubble_layout, get_crop_box_9_8)
+from src.utils.logger import logger
+from src.utils.video_utils import OUTPUT_FPS, run_ffmpeg
+
+CLIP_LENGTH = 10
+FRAME_SIZE = (1080, 1920)
+
+def create_sample_videos(output_dir: str):
+    """
+    A full-frame 9:16 asset video and a portrait actor video with audio, CLIP_LENGTH seconds each.
+    """
+    asset_video_path = os.path.join(output_dir, "assets.mp4")
+    actor_video_path = os.path.join(output_dir, "actor.mp4")
+    run_ffmpeg(["-f", "lavfi", "-i", f"testsrc2=size={FRAME_SIZE[0]}x{FRAME_SIZE[1]}:rate={OUTPUT_FPS}:duration={CLIP_LENGTH}",
+                "-c:v", "libx264", "-preset", "ultrafast", asset_video_path])
+    run_ffmpeg(["-f", "lavfi", "-i", f"smptehdbars=size=1080x1920:rate=30:duration={CLIP_LENGTH}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={CLIP_LENGTH}",
+                "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", actor_video_path])
+    return asset_video_path, actor_video_path
+
+def read_frames(video_path: str) -> Iterator[np.ndarray]:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+def time_call(call: Callable[[], object], repeat: int = 1) -> float:
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - started_at) / repeat
+
+if __name__ == "__main__":
+    # python -m src.services.video_editing.benchmark_layouts
+    frame_count = CLIP_LENGTH * OUTPUT_FPS
+    with tempfile.TemporaryDirectory() as work_dir:
+        asset_video_path, actor_video_path = create_sample_videos(work_dir)
+        frames = list(read_frames(asset_video_path))
+
+        # Python side cost per frame of each compositor: the 9:8 crop copy handed to vstack vs the bubble blend
+        x1, y1, x2, y2 = get_crop_box_9_8(*FRAME_SIZE, (0, 0))
+        crop_time = time_call(lambda: np.ascontiguousarray(frames[0][y1:y2, x1:x2]).tobytes(), repeat=100)
+        x, y, diameter = get_bubble_layout(FRAME_SIZE)
+        avatar = np.full((diameter, diameter, 3), 128, dtype=np.uint8)
+        output = np.empty_like(frames[0])
+        blend_time = time_call(lambda: (np.copyto(output, frames[0]), blend_bubble(output, avatar, x, y)), repeat=100)
+
+        # End to end, including decode and encode
+        vstack_moviepy_time = time_call(lambda: combine_videos_vertically(asset_video_path, actor_video_path,
+                                                                          os.path.join(work_dir, "vstack_moviepy.mp4")))
+        vstack_stream_time = time_call(lambda: combine_frames_vertically(iter(frames), FRAME_SIZE, actor_video_path,
+                                                                         os.path.join(work_dir, "vstack_stream.mp4")))
+        bubble_ffmpeg_time = time_call(lambda: combine_videos_bubble(asset_video_path, actor_video_path,
+                                                                     os.path.join(work_dir, "bubble_ffmpeg.mp4")))
+        bubble_stream_time = time_call(lambda: combine_frames_bubble(iter(frames), FRAME_SIZE, actor_video_path,
+                                                                     os.path.join(work_dir, "bubble_stream.mp4")))
+
+    logger.info(f"{CLIP_LENGTH}s {FRAME_SIZE[0]}x{FRAME_SIZE[1]} at {OUTPUT_FPS} fps, {os.cpu_count()} CPUs, bubble {diameter}px")
+    logger.info(f"Per frame in Python: TOP_BOTTOM crop copy {crop_time * 1000:.2f}ms, bubble copy + blend {blend_time * 1000:.2f}ms")
+    for name, elapsed in [("TOP_BOTTOM moviepy", vstack_moviepy_time), ("TOP_BOTTOM streamed vstack", vstack_stream_time),
+                          ("AVATAR_BUBBLE ffmpeg alphamerge", bubble_ffmpeg_time), ("AVATAR_BUBBLE streamed NumPy blend", bubble_stream_time)]:
+        logger.info(f"{name}: {elapsed:.1f}s, {elapsed / frame_count * 1000:.1f}ms per frame")
@@ -0,0 +1,38 @@
+import os
+import tempfile
+from src.models.base_models import AspectRatio, Asset, AssetType, VideoLayoutType
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import BoxedHighlightCaption
+from src.services.video_editing.benchmark_layouts import CLIP_LENGTH, create_sample_videos, time_call
+from src.services.video_editing.preview_render import PREVIEW_FPS, PREVIEW_FRAME_SIZE, render_preview
+from src.services.video_editing.single_pass_render import render_top_bottom_single_pass
+from src.utils.logger import logger
+
+SCRIPT = "Tired of dull mornings? Meet the new smart mug. It keeps your coffee hot for hours. Try it today!"
+
+if __name__ == "__main__":
+    # python -m src.services.video_editing.benchmark_preview
+    caption_type = BoxedHighlightCaption(font_path="src/fonts/Roboto-Black.ttf", font_size=72, default_color=(255, 255, 255),
+                                         highlight_color=(255, 0, 0), outline_color=(0, 0, 0), outline_thickness=3,
+                                         background_color=(0, 0, 0, 0), background_padding=5)
+    timeline = CaptionTimeline.from_script(SCRIPT, CLIP_LENGTH)
+    with tempfile.TemporaryDirectory() as work_dir:
+        asset_video_path, actor_video_path = create_sample_videos(work_dir)
+        assets = [Asset(type=AssetType.VIDEO, local_path=asset_video_path)]
+
+        final_time = time_call(lambda: render_top_bottom_single_pass(
+            assets, CLIP_LENGTH, AspectRatio.NINE_SIXTEEN.value, actor_video_path, os.path.join(work_dir, "final", "final.mp4"),
+            caption_type, timeline, use_ass_captions=True))
+        # The first preview also normalizes the assets at preview size, later ones hit the asset cache
+        preview_times = {}
+        for name, layout in (("first run", VideoLayoutType.TOP_BOTTOM.value), ("TOP_BOTTOM", VideoLayoutType.TOP_BOTTOM.value),
+                             ("AVATAR_BUBBLE", VideoLayoutType.AVATAR_BUBBLE.value)):
+            output_path = os.path.join(work_dir, "preview", f"{layout}.mp4")
+            preview_times[name] = time_call(lambda: render_preview(
+                assets, CLIP_LENGTH, layout, actor_video_path, output_path, None, caption_type, timeline))
+
+    logger.info(f"{CLIP_LENGTH}s clip, {os.cpu_count()} CPUs")
+    logger.info(f"Final single pass 1080x1920: {final_time:.1f}s")
+    for name, elapsed in preview_times.items():
+        logger.info(f"Preview {PREVIEW_FRAME_SIZE[0]}x{PREVIEW_FRAME_SIZE[1]} at {PREVIEW_FPS} fps, {name}: {elapsed:.1f}s "
+                    f"({final_time / elapsed:.1f}x faster)")
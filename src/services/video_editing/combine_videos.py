@@ -1,11 +1,27 @@
+import functools
+import os
+from typing import Iterable, Optional, Tuple
+import cv2
 import moviepy.editor as mp
+import numpy as np
 from src.utils.logger import logger
+from src.utils.media_probe import MediaInfo, media_probe
+from src.utils.video_utils import OUTPUT_FPS, OUTPUT_PIX_FMT, X264_CRF, X264_PRESET, close_ffmpeg_pipe, open_ffmpeg_pipe
 
-def validate_video(video_clip, video_path):
-    """Validate video dimensions and properties"""
-    if video_clip.w <= 0 or video_clip.h <= 0:
-        raise ValueError(f"Invalid video dimensions for {video_path}. Width: {video_clip.w}, Height: {video_clip.h}")
-    return True
+# AVATAR_BUBBLE: the actor in a circle over the full-frame asset video, bottom right and clear of
+# the captions (vertically centered) and of the platform UI at the bottom of a reel
+BUBBLE_DIAMETER_RATIO = 0.4
+BUBBLE_MARGIN_RATIO = 0.05
+BUBBLE_BOTTOM_RATIO = 0.12
+# The square crop of the actor video is moved up, towards the face
+BUBBLE_SHIFT = (0, -200)
+
+def validate_video(video_path) -> MediaInfo:
+    """Validate video dimensions and properties from the container headers, before any decoder is opened"""
+    media_info = media_probe.probe(video_path)
+    if media_info.kind != "video" or not media_info.width or not media_info.height:
+        raise ValueError(f"Invalid video dimensions for {video_path}. Width: {media_info.width}, Height: {media_info.height}")
+    return media_info
 
 def combine_videos_vertically(top_video_path, bottom_video_path, output_path, shift_top_video=(0, 0), shift_bottom_video=(0, -100)):
     """
@@ -25,14 +41,14 @@ def combine_videos_vertically(top_video_path, bottom_video_path, output_path, sh
     logger.debug(f"Top video path: {top_video_path}, Bottom video path: {bottom_video_path}")
     
     try:
+        # Validate videos
+        validate_video(top_video_path)
+        validate_video(bottom_video_path)
+
         # Load the videos
         top_video = mp.VideoFileClip(top_video_path)
         bottom_video = mp.VideoFileClip(bottom_video_path)
         
-        # Validate videos
-        validate_video(top_video, top_video_path)
-        validate_video(bottom_video, bottom_video_path)
-        
         logger.info(f"Loaded videos - Top: {top_video.w}x{top_video.h}, Bottom: {bottom_video.w}x{bottom_video.h}")
 
         # Function to center crop the video to 9:8 aspect ratio with shift
@@ -98,6 +114,270 @@ def combine_videos_vertically(top_video_path, bottom_video_path, output_path, sh
         if 'bottom_video' in locals(): bottom_video.close()
         logger.debug("Video clips closed.")
 
+def get_crop_box(width: int, height: int, target_aspect_ratio: float, shift: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """
+    (x1, y1, x2, y2) of the centered crop to target_aspect_ratio, moved by shift.
+    """
+    if width / height > target_aspect_ratio:
+        new_width = int(height * target_aspect_ratio)
+        x_center = width // 2 + shift[0]
+        return max(0, x_center - new_width // 2), 0, min(width, x_center + new_width // 2), height
+    new_height = int(width / target_aspect_ratio)
+    y_center = height // 2 + shift[1]
+    return 0, max(0, y_center - new_height // 2), width, min(height, y_center + new_height // 2)
+
+def get_crop_box_9_8(width: int, height: int, shift: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """
+    (x1, y1, x2, y2) of the 9:8 crop center_crop_to_9_8 applies to a width x height video.
+    """
+    return get_crop_box(width, height, 9 / 8, shift)
+
+def crop_to_9_8_filter(shift: Tuple[int, int]) -> str:
+    """
+    ffmpeg crop equivalent of center_crop_to_9_8 in combine_videos_vertically, evaluated on the input size
+    so the lipsync video does not need to be probed beforehand.
+    """
+    width = "if(gt(iw/ih,9/8),trunc(ih*9/8/2)*2,iw)"
+    height = "if(gt(iw/ih,9/8),ih,trunc(iw*8/9/2)*2)"
+    x = f"max(0,min(iw-ow,(iw-ow)/2+{shift[0]}))"
+    y = f"max(0,min(ih-oh,(ih-oh)/2+{shift[1]}))"
+    return f"crop=w='{width}':h='{height}':x='{x}':y='{y}'"
+
+def combine_frames_vertically(top_frames: Iterable[np.ndarray], top_size: Tuple[int, int], bottom_video_path: str,
+                              output_path: str, shift_top_video=(0, 0), shift_bottom_video=(0, -100),
+                              bottom_size: Optional[Tuple[int, int]] = None) -> str:
+    """
+    TOP_BOTTOM layout of combine_videos_vertically with the top track streamed as BGR frames
+    (e.g. AssetTimeline.frames()) instead of read from an encoded video. The top frames are cropped
+    here and piped to ffmpeg, which decodes the bottom video next to them, stacks both halves and
+    muxes the bottom audio. bottom_size (e.g. from the actor preprocessing cache) skips probing the
+    bottom video; the bottom crop itself is evaluated by ffmpeg on the decoded size.
+    """
+    logger.info("Starting the process to combine streamed frames with a video vertically.")
+    if bottom_size is None:
+        media_info = validate_video(bottom_video_path)
+        bottom_size = (media_info.width, media_info.height)
+    bottom_width, bottom_height = bottom_size
+
+    top_x1, top_y1, top_x2, top_y2 = get_crop_box_9_8(*top_size, shift_top_video)
+    bottom_x1, _, bottom_x2, _ = get_crop_box_9_8(bottom_width, bottom_height, shift_bottom_video)
+    top_crop_size = (top_x2 - top_x1, top_y2 - top_y1)
+
+    final_width = max(top_crop_size[0], bottom_x2 - bottom_x1)
+    final_height = final_width * 16 // 9
+    half_height = final_height // 2
+    logger.info(f"Final video dimensions: {final_width}x{final_height}")
+
+    filters = [
+        f"[0:v]scale={final_width}:{half_height},setsar=1[top]",
+        f"[1:v]{crop_to_9_8_filter(shift_bottom_video)},scale={final_width}:{half_height},setsar=1,fps={OUTPUT_FPS}[bottom]",
+        # The shorter half holds its last frame, like the moviepy composite keeps the longer clip
+        f"[top][bottom]vstack=inputs=2,format={OUTPUT_PIX_FMT}[video]",
+    ]
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    process = open_ffmpeg_pipe([
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{top_crop_size[0]}x{top_crop_size[1]}", "-r", str(OUTPUT_FPS), "-i", "-",
+        "-i", bottom_video_path,
+        "-filter_complex", ";".join(filters),
+        "-map", "[video]", "-map", "1:a?",
+        "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-c:a", "aac",
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    frame_count = 0
+    last_frame, last_data = None, None
+    try:
+        for frame in top_frames:
+            # Stills yield the same array for a whole segment, so the crop is only copied once
+            if frame is not last_frame:
+                last_frame, last_data = frame, np.ascontiguousarray(frame[top_y1:top_y2, top_x1:top_x2]).tobytes()
+            process.stdin.write(last_data)
+            frame_count += 1
+    except BrokenPipeError:
+        # ffmpeg exited early, close_ffmpeg_pipe raises with its error output
+        pass
+    finally:
+        close_ffmpeg_pipe(process)
+    logger.info(f"Final video written to: {output_path} ({frame_count} streamed frames)")
+    return output_path
+
+def get_bubble_layout(frame_size: Tuple[int, int]) -> Tuple[int, int, int]:
+    """
+    (x, y, diameter) of the avatar bubble in a frame of frame_size.
+    """
+    width, height = frame_size
+    diameter = int(width * BUBBLE_DIAMETER_RATIO) // 2 * 2
+    x = width - diameter - int(width * BUBBLE_MARGIN_RATIO)
+    y = height - diameter - int(height * BUBBLE_BOTTOM_RATIO)
+    return x, y, diameter
+
+def get_bubble_crop_box(width: int, height: int, shift: Tuple[int, int] = BUBBLE_SHIFT) -> Tuple[int, int, int, int]:
+    """
+    (x1, y1, x2, y2) of the square crop of the avatar video. The shift is clamped rather than
+    clipping the square, so the bubble is never stretched.
+    """
+    side = min(width, height)
+    x1 = min(max(0, (width - side) // 2 + shift[0]), width - side)
+    y1 = min(max(0, (height - side) // 2 + shift[1]), height - side)
+    return x1, y1, x1 + side, y1 + side
+
+def bubble_crop_filter(shift: Tuple[int, int] = BUBBLE_SHIFT) -> str:
+    """
+    ffmpeg crop equivalent of get_bubble_crop_box, evaluated on the input size so the avatar video
+    does not need to be probed beforehand.
+    """
+    x = f"max(0,min(iw-ow,trunc((iw-ow)/2)+{shift[0]}))"
+    y = f"max(0,min(ih-oh,trunc((ih-oh)/2)+{shift[1]}))"
+    return f"crop=w='min(iw,ih)':h='min(iw,ih)':x='{x}':y='{y}'"
+
+@functools.lru_cache(maxsize=8)
+def get_bubble_mask(diameter: int) -> np.ndarray:
+    """
+    Anti-aliased circle alpha (uint8, diameter x diameter). Each pixel's coverage falls off linearly
+    over one pixel across the edge. Computed once per size, never per frame.
+    """
+    center = (diameter - 1) / 2
+    y, x = np.ogrid[:diameter, :diameter]
+    distance = np.sqrt((x - center) ** 2 + (y - center) ** 2)
+    alpha = np.round(np.clip(diameter / 2 - distance + 0.5, 0, 1) * 255).astype(np.uint8)
+    alpha.setflags(write=False)
+    return alpha
+
+@functools.lru_cache(maxsize=8)
+def get_bubble_blend_weights(diameter: int) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray], np.ndarray]:
+    """
+    The mask split for blending: the opaque interior as a cv2 copy mask, and the anti-aliased edge
+    pixels (about 3 * diameter of them) with their alpha as uint16.
+    """
+    alpha = get_bubble_mask(diameter)
+    inside = (alpha == 255).astype(np.uint8)
+    edge = np.nonzero((alpha > 0) & (alpha < 255))
+    return inside, edge, alpha[edge].astype(np.uint16)[:, None]
+
+def blend_bubble(frame: np.ndarray, avatar: np.ndarray, x: int, y: int) -> None:
+    """
+    Alpha blend the square avatar frame into frame at (x, y), in place. The interior is a masked
+    copy and only the edge pixels are blended, so the cost is a fraction of blending the square.
+    """
+    inside, edge, edge_alpha = get_bubble_blend_weights(avatar.shape[0])
+    region = frame[y:y + avatar.shape[0], x:x + avatar.shape[1]]
+    copied = cv2.copyTo(avatar, inside, region)
+    if not np.shares_memory(copied, region):
+        region[...] = copied
+    # 255 * 255 + 127 still fits in uint16
+    region[edge] = (avatar[edge] * edge_alpha + region[edge] * (255 - edge_alpha) + 127) // 255
+
+def combine_videos_bubble(background_video_path: str, avatar_video_path: str, output_path: str,
+                          avatar_size: Optional[Tuple[int, int]] = None, shift_avatar_video=BUBBLE_SHIFT) -> str:
+    """
+    AVATAR_BUBBLE layout in one ffmpeg run: the avatar video is cropped square and scaled to the
+    bubble once, alphamerge applies the precomputed circle mask (piped in as a single gray frame and
+    looped) and overlay places it on the full-frame background video. The avatar audio is muxed.
+    avatar_size (e.g. from the actor preprocessing cache) skips probing the avatar video.
+    """
+    logger.info("Starting the process to combine videos as an avatar bubble.")
+    background_info = validate_video(background_video_path)
+    if avatar_size is None:
+        media_info = validate_video(avatar_video_path)
+        avatar_size = (media_info.width, media_info.height)
+    x, y, diameter = get_bubble_layout((background_info.width, background_info.height))
+    crop_x1, crop_y1, crop_x2, crop_y2 = get_bubble_crop_box(*avatar_size, shift_avatar_video)
+    logger.info(f"Final video dimensions: {background_info.width}x{background_info.height}, bubble {diameter}px at ({x}, {y})")
+
+    filters = [
+        f"[1:v]crop={crop_x2 - crop_x1}:{crop_y2 - crop_y1}:{crop_x1}:{crop_y1},scale={diameter}:{diameter},setsar=1,fps={OUTPUT_FPS}[avatar]",
+        "[2:v]loop=loop=-1:size=1[mask]",
+        # The mask is endless, the bubble ends with the avatar video
+        "[avatar][mask]alphamerge=shortest=1[bubble]",
+        f"[0:v]setsar=1,fps={OUTPUT_FPS}[background]",
+        # A shorter avatar holds its last frame until the background ends
+        f"[background][bubble]overlay=x={x}:y={y},format={OUTPUT_PIX_FMT}[video]",
+    ]
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    process = open_ffmpeg_pipe([
+        "-i", background_video_path,
+        "-i", avatar_video_path,
+        "-f", "rawvideo", "-pix_fmt", "gray", "-s", f"{diameter}x{diameter}", "-i", "-",
+        "-filter_complex", ";".join(filters),
+        "-map", "[video]", "-map", "1:a?",
+        "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-c:a", "aac",
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    try:
+        process.stdin.write(get_bubble_mask(diameter).tobytes())
+    except BrokenPipeError:
+        pass
+    finally:
+        close_ffmpeg_pipe(process)
+    logger.info(f"Final video written to: {output_path}")
+    return output_path
+
+def combine_frames_bubble(background_frames: Iterable[np.ndarray], frame_size: Tuple[int, int], avatar_video_path: str,
+                          output_path: str, avatar_size: Optional[Tuple[int, int]] = None, shift_avatar_video=BUBBLE_SHIFT) -> str:
+    """
+    AVATAR_BUBBLE layout with the background streamed as BGR frames (e.g. AssetTimeline.frames()).
+    Each avatar frame is cropped and scaled to the bubble once and blended into the background with
+    the precomputed mask in NumPy, then the frames are piped to ffmpeg, which muxes the avatar audio.
+    """
+    logger.info("Starting the process to combine streamed frames with an avatar bubble.")
+    x, y, diameter = get_bubble_layout(frame_size)
+    cap = cv2.VideoCapture(avatar_video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open avatar video: {avatar_video_path}")
+    if avatar_size is None:
+        avatar_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    avatar_fps = cap.get(cv2.CAP_PROP_FPS) or OUTPUT_FPS
+    crop_x1, crop_y1, crop_x2, crop_y2 = get_bubble_crop_box(*avatar_size, shift_avatar_video)
+    logger.info(f"Final video dimensions: {frame_size[0]}x{frame_size[1]}, bubble {diameter}px at ({x}, {y})")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    process = open_ffmpeg_pipe([
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{frame_size[0]}x{frame_size[1]}", "-r", str(OUTPUT_FPS), "-i", "-",
+        "-i", avatar_video_path,
+        "-map", "0:v", "-map", "1:a?",
+        "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-c:a", "aac",
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    output = np.empty((frame_size[1], frame_size[0], 3), dtype=np.uint8)
+    avatar, avatar_index = None, -1
+    last_frame = None
+    frame_count = 0
+    try:
+        for frame in background_frames:
+            # Resample the avatar to the output fps; past its end the last frame is held
+            target_index = int(frame_count * avatar_fps / OUTPUT_FPS)
+            while avatar_index < target_index:
+                ret, avatar_frame = cap.read()
+                if not ret:
+                    break
+                avatar_index += 1
+                if avatar_index == target_index:
+                    avatar = cv2.resize(avatar_frame[crop_y1:crop_y2, crop_x1:crop_x2], (diameter, diameter), interpolation=cv2.INTER_AREA)
+            # The blend goes into a copy, stills yield the same array for a whole segment. A repeated
+            # frame only needs the bubble's square restored.
+            if frame is not last_frame:
+                np.copyto(output, frame)
+                last_frame = frame
+            else:
+                output[y:y + diameter, x:x + diameter] = frame[y:y + diameter, x:x + diameter]
+            if avatar is not None:
+                blend_bubble(output, avatar, x, y)
+            process.stdin.write(output.data)
+            frame_count += 1
+    except BrokenPipeError:
+        # ffmpeg exited early, close_ffmpeg_pipe raises with its error output
+        pass
+    finally:
+        cap.release()
+        close_ffmpeg_pipe(process)
+    logger.info(f"Final video written to: {output_path} ({frame_count} streamed frames)")
+    return output_path
+
 if __name__ == "__main__":
     # Example usage
     try:
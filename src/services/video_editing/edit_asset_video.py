@@ -1,9 +1,11 @@
-from moviepy.editor import VideoFileClip, ImageClip, CompositeVideoClip, concatenate_videoclips, ColorClip
+from moviepy.editor import VideoFileClip, ImageClip, concatenate_videoclips
 from enum import Enum
 from typing import List
 from src.models.base_models import Asset
 from src.config.constants import Constants
 from src.models.base_models import AspectRatio, AssetType
+from src.services.video_editing.asset_cache import normalized_asset_cache
+from src.services.video_editing.asset_segments import render_image_slideshow
 import os
 import numpy as np
 from PIL import Image, ImageDraw
@@ -25,7 +27,8 @@ def save_intermediate_clip(clip, filename, fps=25):
     logger.debug(f"Saving intermediate clip to {output_path}")
     clip.write_videofile(output_path, codec="libx264", fps=fps)
 
-def generate_asset_video(assets: List[Asset], final_video_length: int, aspect_ratio: AspectRatio, asset_edited_video_path: str) -> str:
+def generate_asset_video(assets: List[Asset], final_video_length: int, aspect_ratio: AspectRatio, asset_edited_video_path: str,
+                         use_still_image_path: bool = True) -> str:
     try:
         logger.info("Starting asset editing process")
         if aspect_ratio == AspectRatio.SQUARE.value:
@@ -36,55 +39,44 @@ def generate_asset_video(assets: List[Asset], final_video_length: int, aspect_ra
             logger.error("Unsupported aspect ratio")
             raise ValueError("Unsupported aspect ratio")
 
+        os.makedirs(os.path.dirname(asset_edited_video_path), exist_ok=True)
+        if use_still_image_path and assets and all(asset.type == AssetType.IMAGE for asset in assets):
+            # Image-only reels skip the per-frame moviepy path entirely
+            return render_image_slideshow(assets, final_video_length, (width, height), asset_edited_video_path)
+
         asset_duration = final_video_length / len(assets)
-        background_color = (245, 243, 242)
-        background = ColorClip(size=(width, height), color=background_color, duration=asset_duration)
 
         clips = []
         for index, asset in enumerate(assets):
             try:
                 logger.debug(f"Processing asset {index}: {asset.local_path}")
+                if asset.type not in (AssetType.VIDEO, AssetType.IMAGE):
+                    logger.warning(f"Unsupported asset type: {asset.type}. Skipping this asset.")
+                    continue
+
+                # Already scaled and padded to the frame, only concatenation is left
+                normalized_path = normalized_asset_cache.get_normalized_asset(asset, (width, height), asset_duration)
                 if asset.type == AssetType.VIDEO:
-                    clip = VideoFileClip(asset.local_path).without_audio()
+                    clip = VideoFileClip(normalized_path)
                     if clip.duration < asset_duration:
                         clip = clip.loop(duration=asset_duration)
                     else:
                         clip = clip.subclip(0, asset_duration)
-
-                elif asset.type == AssetType.IMAGE:
-                    clip = ImageClip(asset.local_path).set_duration(asset_duration)
                 else:
-                    logger.warning(f"Unsupported asset type: {asset.type}. Skipping this asset.")
-                    continue
-
-                clip_aspect_ratio = clip.w / clip.h
-                if clip_aspect_ratio > width / height:
-                    new_width = width
-                    new_height = int(width / clip_aspect_ratio)
-                else:
-                    new_height = height
-                    new_width = int(height * clip_aspect_ratio)
-
-                clip = clip.resize(newsize=(new_width, new_height))
-        
-                
-                clip = clip.set_position(("center", "center"))
-            
-
-                composite_clip = CompositeVideoClip([background.copy(), clip], size=(width, height))
-                composite_clip = composite_clip.set_duration(asset_duration)
-                clips.append(composite_clip)
+                    clip = ImageClip(normalized_path).set_duration(asset_duration)
+                clips.append(clip)
             except Exception as e:
                 logger.error(f"Error processing asset {index}: {str(e)}")
                 import traceback
                 logger.debug(traceback.format_exc())
                 continue
+        logger.info(f"Normalized asset cache: {normalized_asset_cache.stats()}")
 
         if not clips:
             logger.error("No valid clips to concatenate")
             raise ValueError("No valid clips to concatenate")
 
-        final_clip = concatenate_videoclips(clips, method="compose")
+        final_clip = concatenate_videoclips(clips, method="chain")
         os.makedirs(os.path.dirname(asset_edited_video_path), exist_ok=True)
         logger.info(f"Writing final video to {asset_edited_video_path}")
         final_clip.write_videofile(asset_edited_video_path, codec="libx264", fps=25)
@@ -92,7 +84,6 @@ def generate_asset_video(assets: List[Asset], final_video_length: int, aspect_ra
         final_clip.close()
         for clip in clips:
             clip.close()
-        background.close()
 
         logger.info("Video editing process completed successfully")
         return asset_edited_video_path
@@ -0,0 +1,110 @@
+import os
+from typing import List, Optional, Tuple
+import cv2
+from src.models.base_models import Asset, AssetType, VideoLayoutType
+from src.services.captions_generation.ass_captions import get_subtitles_filter, write_ass_script
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import CaptionType
+from src.services.video_editing.asset_timeline import AssetTimeline
+from src.services.video_editing.combine_videos import BUBBLE_SHIFT, bubble_crop_filter, crop_to_9_8_filter, get_bubble_layout, get_bubble_mask
+from src.utils.logger import logger
+from src.utils.video_utils import OUTPUT_FPS, OUTPUT_PIX_FMT, run_ffmpeg
+
+# A ninth of the final pixels at half the frame rate, encoded with the fastest x264 preset
+PREVIEW_FRAME_SIZE = (360, 640)
+PREVIEW_FPS = 12
+PREVIEW_PRESET = "ultrafast"
+PREVIEW_CRF = 30
+# The captions are laid out on the final frame and libass scales the script to the preview,
+# so line breaks and word positions match the final render
+FINAL_FRAME_SIZE = (1080, 1920)
+
+def render_preview(assets: List[Asset], final_video_length: float, layout: str, actor_video_path: str, output_path: str,
+                   audio_path: Optional[str] = None,
+                   caption_type: Optional[CaptionType] = None,
+                   timeline: Optional[CaptionTimeline] = None,
+                   shift_actor_video: Tuple[int, int] = (0, -100)) -> str:
+    """
+    Render a PREVIEW_FRAME_SIZE proxy of the final video in one ffmpeg run:
+    - the asset track from the same AssetTimeline segments as the final render, normalized at preview size
+    - the TOP_BOTTOM or AVATAR_BUBBLE layout of the actor video (a local path or URL, looped if short)
+    - the captions as an ASS script, and the actor audio unless audio_path is given
+    """
+    logger.info(f"Starting preview render ({layout}, {final_video_length:.1f}s)")
+    width, height = PREVIEW_FRAME_SIZE
+
+    # Segment boundaries are computed on the OUTPUT_FPS timeline, exactly as for the final render
+    asset_timeline = AssetTimeline.from_assets(assets, final_video_length, PREVIEW_FRAME_SIZE)
+    input_args = []
+    filters = []
+    for index, segment in enumerate(asset_timeline.segments):
+        normalized_path = asset_timeline.get_normalized_path(segment)
+        if segment.asset.type == AssetType.IMAGE:
+            input_args += ["-loop", "1", "-framerate", str(OUTPUT_FPS), "-i", normalized_path]
+        else:
+            input_args += ["-i", normalized_path]
+        # A short video holds its last frame, like AssetTimeline.frames()
+        filters.append(
+            f"[{index}:v]tpad=stop=-1:stop_mode=clone,trim=end_frame={segment.frame_count},setpts=PTS-STARTPTS,"
+            f"setsar=1,format={OUTPUT_PIX_FMT}[asset{index}]"
+        )
+    segment_count = len(asset_timeline.segments)
+    filters.append("".join(f"[asset{index}]" for index in range(segment_count)) + f"concat=n={segment_count}:v=1:a=0,fps={PREVIEW_FPS}[assets]")
+
+    actor_input = segment_count
+    input_args += ["-stream_loop", "-1", "-i", actor_video_path]
+    next_input = actor_input + 1
+    if layout == VideoLayoutType.TOP_BOTTOM.value:
+        half_height = height // 2
+        filters.append(f"[assets]{crop_to_9_8_filter((0, 0))},scale={width}:{half_height},setsar=1[top]")
+        filters.append(
+            f"[{actor_input}:v]fps={PREVIEW_FPS},{crop_to_9_8_filter(shift_actor_video)},"
+            f"scale={width}:{half_height},setsar=1,format={OUTPUT_PIX_FMT}[bottom]"
+        )
+        filters.append("[top][bottom]vstack=inputs=2[layout]")
+    elif layout == VideoLayoutType.AVATAR_BUBBLE.value:
+        x, y, diameter = get_bubble_layout(PREVIEW_FRAME_SIZE)
+        mask_path = os.path.join(os.path.dirname(output_path), f"bubble_mask_{diameter}.png")
+        os.makedirs(os.path.dirname(mask_path), exist_ok=True)
+        cv2.imwrite(mask_path, get_bubble_mask(diameter))
+        mask_input = next_input
+        next_input += 1
+        input_args += ["-loop", "1", "-i", mask_path]
+        filters.append(
+            f"[{actor_input}:v]fps={PREVIEW_FPS},{bubble_crop_filter(BUBBLE_SHIFT)},scale={diameter}:{diameter},setsar=1[avatar]"
+        )
+        filters.append(f"[{mask_input}:v]format=gray[mask]")
+        filters.append("[avatar][mask]alphamerge=shortest=1[bubble]")
+        filters.append(f"[assets][bubble]overlay=x={x}:y={y}[layout]")
+    else:
+        logger.error("Unsupported layout type")
+        raise Exception("Unsupported layout type")
+
+    if caption_type is not None and timeline:
+        script_path = os.path.join(os.path.dirname(output_path), "preview_captions.ass")
+        write_ass_script(caption_type, timeline, FINAL_FRAME_SIZE, script_path)
+        subtitles_filter = get_subtitles_filter(script_path, os.path.dirname(caption_type.font_path))
+        filters.append(f"[layout]{subtitles_filter},format={OUTPUT_PIX_FMT}[video]")
+    else:
+        filters.append(f"[layout]format={OUTPUT_PIX_FMT}[video]")
+
+    audio_map = f"{actor_input}:a?"
+    if audio_path:
+        audio_map = f"{next_input}:a"
+        input_args += ["-i", audio_path]
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    run_ffmpeg([
+        *input_args,
+        "-filter_complex", ";".join(filters),
+        "-map", "[video]",
+        "-map", audio_map,
+        "-t", f"{final_video_length:.3f}",
+        "-r", str(PREVIEW_FPS),
+        "-c:v", "libx264", "-preset", PREVIEW_PRESET, "-crf", str(PREVIEW_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-c:a", "aac", "-b:a", "64k",
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    logger.info(f"Preview written to: {output_path}")
+    return output_path
@@ -0,0 +1,146 @@
+import os
+from typing import List, Optional, Tuple
+from PIL import Image
+from src.models.base_models import AspectRatio, Asset, AssetType
+from src.services.captions_generation.ass_captions import get_subtitles_filter, write_ass_script
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import CaptionType
+from src.services.video_editing.combine_videos import crop_to_9_8_filter
+from src.utils.logger import logger
+from src.utils.video_utils import OUTPUT_FPS, OUTPUT_PIX_FMT, X264_CRF, X264_PRESET, run_ffmpeg
+
+# Same (245, 243, 242) background generate_asset_video pads the assets with
+ASSET_BACKGROUND_COLOR = "0xF5F3F2"
+
+def get_frame_size(aspect_ratio: AspectRatio) -> Tuple[int, int]:
+    if aspect_ratio == AspectRatio.SQUARE.value:
+        return 1080, 1080
+    elif aspect_ratio == AspectRatio.NINE_SIXTEEN.value:
+        return 1080, 1920
+    logger.error("Unsupported aspect ratio")
+    raise ValueError("Unsupported aspect ratio")
+
+def write_caption_overlay_playlist(caption_type: CaptionType, timeline: CaptionTimeline,
+                                   frame_size: Tuple[int, int], overlays_dir: str) -> str:
+    """
+    Render every distinct caption state once as a transparent PNG and write an ffconcat playlist
+    that shows each of them for as long as it is active. ffmpeg overlays the playlist as one input.
+    """
+    os.makedirs(overlays_dir, exist_ok=True)
+    position = (0, frame_size[1] // 2)  # Vertically center the captions
+
+    blank_path = os.path.abspath(os.path.join(overlays_dir, "blank.png"))
+    Image.new("RGBA", frame_size, (0, 0, 0, 0)).save(blank_path)
+
+    rendered = {}
+    entries = []
+    current_time = 0.0
+    for start_time, end_time, words, word_index in timeline.states():
+        if start_time > current_time:
+            entries.append((blank_path, start_time - current_time))
+            current_time = start_time
+        if end_time <= current_time:
+            continue
+
+        key = (tuple(words), word_index)
+        if key not in rendered:
+            overlay_path = os.path.abspath(os.path.join(overlays_dir, f"caption_{len(rendered):05d}.png"))
+            caption_type.render_overlay(frame_size, words, word_index, position).save(overlay_path)
+            rendered[key] = overlay_path
+        entries.append((rendered[key], end_time - current_time))
+        current_time = end_time
+
+    # The concat demuxer ignores the duration of the last entry, so always finish on a blank frame
+    entries.append((blank_path, None))
+    logger.info(f"Rendered {len(rendered)} caption overlays for {len(entries)} caption states")
+
+    playlist_path = os.path.join(overlays_dir, "captions.ffconcat")
+    with open(playlist_path, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for path, duration in entries:
+            f.write(f"file '{path}'\n")
+            if duration is not None:
+                f.write(f"duration {duration:.3f}\n")
+    return playlist_path
+
+def render_top_bottom_single_pass(assets: List[Asset], final_video_length: float, aspect_ratio: AspectRatio,
+                                  lipsync_video_path: str, output_path: str,
+                                  caption_type: Optional[CaptionType] = None,
+                                  timeline: Optional[CaptionTimeline] = None,
+                                  use_ass_captions: bool = False,
+                                  shift_top_video=(0, 0), shift_bottom_video=(0, -100)) -> str:
+    """
+    Render the final TOP_BOTTOM video with a single ffmpeg filtergraph:
+    - asset slideshow (fit + pad on the background colour, looped/trimmed per asset)
+    - 9:8 crops of the asset track and the lipsync video, stacked vertically
+    - caption overlay (PNG playlist, or libass with use_ass_captions) and the lipsync audio
+    The result is encoded exactly once, unlike generate_asset_video -> combine_videos_vertically ->
+    process_video_for_captions which encode three times.
+    """
+    logger.info("Starting single pass render of the final video")
+    width, height = get_frame_size(aspect_ratio)
+
+    assets = [asset for asset in assets if asset.type in (AssetType.IMAGE, AssetType.VIDEO)]
+    if not assets:
+        logger.error("No valid assets to render")
+        raise ValueError("No valid assets to render")
+    asset_duration = final_video_length / len(assets)
+
+    input_args = []
+    filters = []
+    for index, asset in enumerate(assets):
+        if asset.type == AssetType.IMAGE:
+            input_args += ["-loop", "1", "-framerate", str(OUTPUT_FPS), "-t", f"{asset_duration:.3f}", "-i", asset.local_path]
+        else:
+            input_args += ["-stream_loop", "-1", "-t", f"{asset_duration:.3f}", "-i", asset.local_path]
+        filters.append(
+            f"[{index}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color={ASSET_BACKGROUND_COLOR},setsar=1,"
+            f"fps={OUTPUT_FPS},format={OUTPUT_PIX_FMT},trim=duration={asset_duration:.3f},setpts=PTS-STARTPTS[asset{index}]"
+        )
+    filters.append("".join(f"[asset{index}]" for index in range(len(assets))) + f"concat=n={len(assets)}:v=1:a=0[assets]")
+
+    lipsync_input = len(assets)
+    input_args += ["-i", lipsync_video_path]
+
+    # Both halves are cropped to 9:8 and scaled to half of a 9:16 frame
+    final_width = width
+    final_height = final_width * 16 // 9
+    half_height = final_height // 2
+    filters.append(f"[assets]{crop_to_9_8_filter(shift_top_video)},scale={final_width}:{half_height},setsar=1[top]")
+    filters.append(
+        f"[{lipsync_input}:v]{crop_to_9_8_filter(shift_bottom_video)},scale={final_width}:{half_height},setsar=1,"
+        f"fps={OUTPUT_FPS},format={OUTPUT_PIX_FMT}[bottom]"
+    )
+    filters.append("[top][bottom]vstack=inputs=2[stacked]")
+
+    if caption_type is not None and timeline and use_ass_captions:
+        script_path = os.path.join(os.path.dirname(output_path), "captions.ass")
+        write_ass_script(caption_type, timeline, (final_width, final_height), script_path)
+        subtitles_filter = get_subtitles_filter(script_path, os.path.dirname(caption_type.font_path))
+        filters.append(f"[stacked]{subtitles_filter},format={OUTPUT_PIX_FMT}[video]")
+    elif caption_type is not None and timeline:
+        overlays_dir = os.path.join(os.path.dirname(output_path), "caption_overlays")
+        playlist_path = write_caption_overlay_playlist(caption_type, timeline, (final_width, final_height), overlays_dir)
+        captions_input = lipsync_input + 1
+        input_args += ["-f", "concat", "-safe", "0", "-i", playlist_path]
+        filters.append(f"[{captions_input}:v]format=rgba[captions]")
+        filters.append(f"[stacked][captions]overlay=0:0:eof_action=pass,format={OUTPUT_PIX_FMT}[video]")
+    else:
+        filters.append(f"[stacked]format={OUTPUT_PIX_FMT}[video]")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    run_ffmpeg([
+        *input_args,
+        "-filter_complex", ";".join(filters),
+        "-map", "[video]",
+        "-map", f"{lipsync_input}:a?",
+        "-t", f"{final_video_length:.3f}",
+        "-r", str(OUTPUT_FPS),
+        "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-c:a", "aac",
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    logger.info(f"Single pass render written to: {output_path}")
+    return output_path
@@ -11,6 +11,7 @@ from src.services.voice_over_generation.elevenlabs_t2s import elevenlabs_text_to
 from src.supabase_tools.handle_bucket_updates import upload_file_to_projects
 from src.config.constants import Constants
 from src.utils.logger import logger
+from src.utils.media_probe import media_probe
 
 async def generate_t2s_audio(project_id: str, script: str, voice: VoiceBase) -> Tuple[str, float]:
     logger.info(f"Generating audio from script for voice: {voice.name}")
@@ -40,7 +41,7 @@ async def generate_t2s_audio(project_id: str, script: str, voice: VoiceBase) ->
 
     # Get audio duration
     try:
-        duration = await get_audio_duration_librosa(t2s_output_audio_path)
+        duration = await get_audio_duration(t2s_output_audio_path)
     except Exception as e:
         logger.error(f"Failed to get audio duration: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to process generated audio")
@@ -58,15 +59,17 @@ async def generate_t2s_audio(project_id: str, script: str, voice: VoiceBase) ->
 
     return t2s_output_audio_file_url, duration
 
-async def get_audio_duration_librosa(audio_file_path: str) -> float:
-    import librosa
+async def get_audio_duration(audio_file_path: str) -> float:
     logger.info(f"Calculating audio duration for file: {audio_file_path}")
     try:
-        duration = await asyncio.to_thread(librosa.get_duration, path=audio_file_path)
+        # Read from the container headers, the audio is not decoded
+        duration = (await media_probe.probe_async(audio_file_path)).duration
+        if not duration:
+            raise ValueError(f"No duration in the headers of {audio_file_path}")
         logger.info(f"Audio duration calculated: {duration} seconds")
         return duration
     except Exception as e:
-        logger.error(f"Failed to get audio duration using librosa: {e}")
+        logger.error(f"Failed to get audio duration: {e}")
         raise
 
 if __name__ == "__main__":
@@ -1,4 +1,3 @@
-import asyncio
 from uuid import UUID
 from fastapi import HTTPException
 from src.config.settings import Settings
@@ -8,7 +7,8 @@ from src.models.shared_state import projects_in_memory
 from src.notification.async_slack_bot import RA_SLACK_BOT
 from src.supabase_tools.handle_project_tb_updates import get_project_from_db, get_project_id_from_prediction_id, update_project_in_db 
 from src.utils.logger import logger
-from src.workflow.video_gen_workflow import video_post_processing
+from src.workflow.stage_artifacts import LIPSYNC_STAGE
+from src.workflow.video_gen_workflow import video_generation_graph
 from fastapi import HTTPException
 from src.config.settings import Settings
 
@@ -23,20 +23,11 @@ async def process_replicate_webhook(data):
 
         logger.info(f"Processing prediction ID: {prediction_id}")
         project_id = await get_project_id_from_prediction_id(prediction_id)
-        
-        # Attempt to get and update the project, retrying if the asset video local path is empty
-        for attempt in range(5):
-            project = await get_and_update_project(project_id, lipsync_video_url)
-            if project.assets_video_local_path:
-                logger.info(f"Project {project_id} updated with lipsync video URL.")
-                return await video_post_processing(project)
-            else:
-                logger.warning(f"Assets video local path is empty for project {project_id}. Retrying in 1 minute... (Attempt {attempt + 1}/5)")
-                await asyncio.sleep(60)  # Wait for 1 minute before retrying
+        project = await get_and_update_project(project_id, lipsync_video_url)
+        logger.info(f"Project {project_id} updated with lipsync video URL.")
 
-        # If after 5 attempts the asset video local path is still empty, log an error
-        logger.error(f"Assets video local path is still empty after 5 attempts for project {project_id}.")
-        raise ValueError("Assets video local path is not updated after multiple attempts")
+        # The render starts here if the other stages already finished, else once the last of them does
+        return await video_generation_graph.complete(project, LIPSYNC_STAGE, {"lipsync_video_url": lipsync_video_url})
 
     except Exception as e:
         logger.error(f"Error in process_replicate_webhook: {str(e)}")
@@ -1,4 +1,5 @@
 import asyncio
+from typing import List, Tuple
 from src.models.base_models import DoDoWebhook
 from uuid import UUID
 from src.supabase_tools.supabase_client import SUPABASE_CLIENT
@@ -37,5 +38,15 @@ async def check_existing_webhook(payment_id: UUID) -> tuple[bool, dict]:
     except Exception as e:
         raise Exception(f"An error occurred while checking for existing webhook in the database: {e}")
 
+async def get_paid_product_ids(user_id: UUID) -> List[Tuple[str, bool]]:
+    """
+    (product_id, test_mode) of every successful payment of the user.
+    """
+    try:
+        response = SUPABASE_CLIENT.table(TableNames.DODO_WEBHOOKS).select("product_id, test_mode").eq("user_id", str(user_id)).eq("type", "payment.succeeded").execute()
+        return [(row["product_id"], row["test_mode"]) for row in response.data]
+    except Exception as e:
+        raise Exception(f"An error occurred while fetching the payments of user {user_id}: {e}")
+
 if __name__ == "__main__":
     asyncio.run(check_existing_webhook("123e4567-e89b-12d3-a456-426614174000"))
\ No newline at end of file
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple, Type
+import numpy as np
+import requests
+from PIL import Image
+from src.utils.logger import logger
+from src.utils.media_probe import probe_local_file, probe_remote
+from src.utils.video_utils import run_ffmpeg
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler with single range support, ETags and a count of the body bytes sent, as a
+    local stand-in for the S3 bucket the assets live in.
+    """
+    bytes_sent = 0
+    support_ranges = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_file_headers(self, path: str, start: int, end: int, file_size: int, partial: bool) -> None:
+        self.send_response(206 if partial else 200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes" if self.support_ranges else "none")
+        self.send_header("ETag", f'"{hashlib.md5(f"{path}{os.path.getmtime(path)}".encode()).hexdigest()}"')
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{file_size}")
+        self.end_headers()
+
+    def get_range(self, file_size: int) -> Tuple[int, int, bool]:
+        range_header = self.headers.get("Range")
+        if not self.support_ranges or not range_header or not range_header.startswith("bytes="):
+            return 0, file_size, False
+        first, last = range_header[len("bytes="):].split("-")
+        if not first:
+            # Suffix range: the last N bytes
+            return max(0, file_size - int(last)), file_size, True
+        return int(first), min(file_size, int(last) + 1 if last else file_size), True
+
+    def do_HEAD(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        file_size = os.path.getsize(path)
+        self.send_file_headers(path, 0, file_size, file_size, False)
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        file_size = os.path.getsize(path)
+        start, end, partial = self.get_range(file_size)
+        if start >= file_size:
+            self.send_error(416)
+            return
+        self.send_file_headers(path, start, end, file_size, partial)
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            try:
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 64 * 1024))
+                    self.wfile.write(chunk)
+                    type(self).bytes_sent += len(chunk)
+                    remaining -= len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # The range probe drops the connection once it has the head of a full response
+                pass
+
+def start_server(directory: str, support_ranges: bool = True) -> Tuple[ThreadingHTTPServer, Type[RangeRequestHandler], str]:
+    """
+    Serve the directory on a free local port in a background thread. Returns the server, its handler
+    class (for bytes_sent) and the base URL.
+    """
+    handler = type("LocalRangeRequestHandler", (RangeRequestHandler,), {"support_ranges": support_ranges, "bytes_sent": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f"http://127.0.0.1:{server.server_address[1]}"
+
+def create_sample_files(output_dir: str) -> List[str]:
+    """
+    A JPEG whose start of frame sits behind 120KB of metadata, a PNG, and the same 10s 1080x1920 mp4
+    with the moov at the tail (as uploaded by most phones) and at the head (faststart).
+    """
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 255, (1600, 1200, 3), dtype=np.uint8)).save(os.path.join(output_dir, "product.png"))
+
+    jpeg_path = os.path.join(output_dir, "product.jpg")
+    Image.fromarray(rng.integers(0, 255, (1500, 2000, 3), dtype=np.uint8)).save(jpeg_path, quality=90)
+    with open(jpeg_path, "rb") as f:
+        jpeg = f.read()
+    comment = b"\xff\xfe" + (65535).to_bytes(2, "big") + b"x" * 65533
+    with open(jpeg_path, "wb") as f:
+        f.write(jpeg[:2] + comment + comment + jpeg[2:])
+
+    video_args = ["-f", "lavfi", "-i", "testsrc2=size=1080x1920:rate=30:duration=10",
+                  "-f", "lavfi", "-i", "sine=frequency=440:duration=10",
+                  "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest"]
+    run_ffmpeg([*video_args, os.path.join(output_dir, "actor_tail_moov.mp4")])
+    run_ffmpeg([*video_args, "-movflags", "+faststart", os.path.join(output_dir, "actor_faststart.mp4")])
+    return ["product.png", "product.jpg", "actor_tail_moov.mp4", "actor_faststart.mp4"]
+
+if __name__ == "__main__":
+    # python -m src.utils.benchmark_remote_probe
+    with tempfile.TemporaryDirectory() as work_dir:
+        names = create_sample_files(work_dir)
+        server, handler, base_url = start_server(work_dir)
+        try:
+            for name in names:
+                # Signed URLs carry a query string, the probe must not depend on it
+                url = f"{base_url}/{name}?X-Amz-Signature=local"
+                expected = probe_local_file(os.path.join(work_dir, name))
+
+                started_at = time.perf_counter()
+                download_bytes = len(requests.get(url).content)
+                download_time = time.perf_counter() - started_at
+
+                sent_before = handler.bytes_sent
+                started_at = time.perf_counter()
+                info = probe_remote(url)
+                probe_time = time.perf_counter() - started_at
+                probe_bytes = handler.bytes_sent - sent_before
+
+                assert (info.width, info.height, info.duration) == (expected.width, expected.height, expected.duration), \
+                    f"{name}: {info} != {expected}"
+                logger.info(f"{name}: {info.width}x{info.height} {info.duration or 0:.2f}s | range probe {probe_time * 1000:.1f}ms, "
+                            f"{probe_bytes / 1024:.0f}KB | full download {download_time * 1000:.1f}ms, {download_bytes / 1024:.0f}KB")
+        finally:
+            server.shutdown()
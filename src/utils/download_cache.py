@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+import aiohttp
+from src.config.settings import Settings
+from src.utils.logger import logger
+
+# Temp files older than this are leftovers of a crashed download
+STALE_TEMP_SECONDS = 3600
+
+class DownloadCache:
+    """
+    Disk cache of remote files fetched with one shared aiohttp connection pool.
+    - at most `concurrency` downloads run at a time
+    - concurrent requests for the same file share one download (single-flight)
+    - files are written to a temp name and renamed into place, so a crash never leaves a truncated entry
+    - the least recently used files are evicted when the cache grows past max_bytes (atime is the LRU
+      clock, so mtime stays stable for the media probe cache)
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, concurrency: int = 8):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def get_cache_path(self, url: str) -> str:
+        # Host and path only: signed URLs differ in their query string for the same file
+        parts = urlsplit(url)
+        extension = os.path.splitext(parts.path)[1].lower()
+        digest = hashlib.md5(f"{parts.netloc}{parts.path}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}{extension}")
+
+    def get_cached_path(self, url: str) -> Optional[str]:
+        """
+        Path of an already downloaded file, None when it is not cached.
+        """
+        cache_path = self.get_cache_path(url)
+        if not os.path.exists(cache_path):
+            return None
+        self.touch(cache_path)
+        return cache_path
+
+    def touch(self, path: str) -> None:
+        stat = os.stat(path)
+        os.utime(path, (time.time(), stat.st_mtime))
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # The pool belongs to the running loop; a new loop (e.g. asyncio.run in a script) gets a new one
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                                  timeout=aiohttp.ClientTimeout(total=600))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._in_flight = {}
+            self._loop = loop
+        return self._session
+
+    async def fetch(self, url: str) -> str:
+        """
+        Local path of the file, downloading it on a miss.
+        """
+        cached_path = self.get_cached_path(url)
+        if cached_path:
+            return cached_path
+
+        session = self.get_session()
+        cache_path = self.get_cache_path(url)
+        in_flight = self._in_flight.get(cache_path)
+        if in_flight is not None:
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # The downloading task was cancelled rather than this one: download it here instead
+                if not in_flight.cancelled():
+                    raise
+                return await self.fetch(url)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_path] = future
+        try:
+            async with self._semaphore:
+                await self.download(session, url, cache_path)
+            future.set_result(cache_path)
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieved here so a download nobody else waited for does not log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            # Only unresolved when the download was cancelled, which must not leave the waiters hanging
+            if not future.done():
+                future.cancel()
+            self._in_flight.pop(cache_path, None)
+
+        await asyncio.to_thread(self.evict)
+        return cache_path
+
+    async def fetch_many(self, urls: List[str]) -> List[str]:
+        return await asyncio.gather(*[self.fetch(url) for url in urls])
+
+    async def download(self, session: aiohttp.ClientSession, url: str, cache_path: str) -> None:
+        logger.info(f"Downloading {url}")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                written = 0
+                with open(temp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(1024 * 1024):
+                        f.write(chunk)
+                        written += len(chunk)
+                if response.content_length is not None and written != response.content_length:
+                    raise IOError(f"Incomplete download of {url}: {written}/{response.content_length} bytes")
+            os.replace(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def evict(self) -> None:
+        entries = []
+        now = time.time()
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(path)
+                if filename.endswith(".tmp"):
+                    if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                        os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+                logger.info(f"Evicted cached download {path}")
+            except FileNotFoundError:
+                continue
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+download_cache = DownloadCache(Settings.DOWNLOAD_CACHE_DIR, Settings.DOWNLOAD_CACHE_MAX_BYTES, Settings.DOWNLOAD_CONCURRENCY)
@@ -0,0 +1,467 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import uuid
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+import requests
+from cachetools import LRUCache
+from PIL import Image
+from pydantic import BaseModel
+from src.config.settings import Settings
+from src.utils.logger import logger
+from src.utils.video_utils import run_ffprobe
+
+# read_at(offset, size) -> bytes, so the box reader works on files and on ranged HTTP reads alike
+ReadAt = Callable[[int, int], bytes]
+
+# First ranged read of a remote file: image headers and the start of an mp4 fit in it
+REMOTE_HEAD_BYTES = 64 * 1024
+# Minimum size of the following ranged reads, so a trailing moov usually comes back in one request
+REMOTE_BLOCK_BYTES = 64 * 1024
+# Start of frame markers. DHT (C4), JPG (C8) and DAC (CC) share the range but carry no dimensions
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+class MediaInfo(BaseModel):
+    """
+    Container level metadata of an image, video or audio file, read without decoding frames.
+    """
+    kind: str  # "image", "video" or "audio"
+    format: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    frame_count: Optional[int] = None
+    duration: Optional[float] = None
+    video_codec: Optional[str] = None
+    has_audio: bool = False
+    audio_sample_rate: Optional[int] = None
+    audio_channels: Optional[int] = None
+    # Display rotation in degrees from the track matrix
+    rotation: int = 0
+    # Presentation times of the sync samples, None when the container does not list them
+    keyframe_times: Optional[List[float]] = None
+
+def is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+def get_url_id(url: str) -> str:
+    """
+    Scheme, host and path of a URL: signed URLs differ in their query string for the same file.
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+def get_source_etag(url: str) -> str:
+    """
+    ETag of a remote file, falling back to Last-Modified/Content-Length when the storage
+    does not send one.
+    """
+    response = requests.head(url, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    etag = response.headers.get("ETag")
+    if etag:
+        return etag.strip('"')
+    return f"{response.headers.get('Last-Modified', '')}|{response.headers.get('Content-Length', '')}"
+
+def iter_boxes(read_at: ReadAt, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    (type, payload start, box end) of the ISO BMFF boxes between start and end.
+    """
+    offset = start
+    while offset + 8 <= end:
+        header = read_at(offset, 16)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            # Box runs to the end of the file
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+def find_moov(read_at: ReadAt, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) of the moov payload, skipping over mdat by the box sizes only.
+    """
+    for box_type, payload_start, box_end in iter_boxes(read_at, 0, file_size):
+        if box_type == b"moov":
+            return payload_start, box_end
+    return None
+
+def get_children(data: bytes, start: int = 0, end: Optional[int] = None) -> Dict[bytes, List[Tuple[int, int]]]:
+    children: Dict[bytes, List[Tuple[int, int]]] = {}
+    read_at = lambda offset, size: data[offset:offset + size]
+    for box_type, payload_start, box_end in iter_boxes(read_at, start, len(data) if end is None else end):
+        children.setdefault(box_type, []).append((payload_start, box_end))
+    return children
+
+def parse_track(moov: bytes, start: int, end: int) -> Optional[dict]:
+    trak = get_children(moov, start, end)
+    if b"tkhd" not in trak or b"mdia" not in trak:
+        return None
+    track = {}
+
+    tkhd_start, _ = trak[b"tkhd"][0]
+    version = moov[tkhd_start]
+    matrix_start = tkhd_start + (4 + 8 + 8 + 4 + 4 + 8 if version == 1 else 4 + 4 + 4 + 4 + 4 + 4) + 8 + 8
+    a, b = struct.unpack(">ii", moov[matrix_start:matrix_start + 8])
+    track["rotation"] = int(round(math.degrees(math.atan2(b / 65536, a / 65536)))) % 360
+
+    mdia = get_children(moov, *trak[b"mdia"][0])
+    mdhd_start, _ = mdia[b"mdhd"][0]
+    if moov[mdhd_start] == 1:
+        timescale, duration = struct.unpack(">IQ", moov[mdhd_start + 20:mdhd_start + 32])
+    else:
+        timescale, duration = struct.unpack(">II", moov[mdhd_start + 12:mdhd_start + 20])
+    hdlr_start, _ = mdia[b"hdlr"][0]
+    track["handler"] = moov[hdlr_start + 8:hdlr_start + 12]
+    track["duration"] = duration / timescale if timescale else None
+
+    minf = get_children(moov, *mdia[b"minf"][0])
+    stbl = get_children(moov, *minf[b"stbl"][0])
+    stsd_start, _ = stbl[b"stsd"][0]
+    entry_start = stsd_start + 8
+    track["codec"] = moov[entry_start + 4:entry_start + 8].decode("latin-1").strip()
+    if track["handler"] == b"vide":
+        track["width"], track["height"] = struct.unpack(">HH", moov[entry_start + 32:entry_start + 36])
+    elif track["handler"] == b"soun":
+        track["channels"] = struct.unpack(">H", moov[entry_start + 24:entry_start + 26])[0]
+        track["sample_rate"] = struct.unpack(">I", moov[entry_start + 32:entry_start + 36])[0] >> 16
+
+    # Sample times from the time-to-sample table, keyframes from the sync sample table
+    sample_deltas = []
+    if b"stts" in stbl:
+        stts_start, _ = stbl[b"stts"][0]
+        entry_count = struct.unpack(">I", moov[stts_start + 4:stts_start + 8])[0]
+        sample_deltas = list(struct.iter_unpack(">II", moov[stts_start + 8:stts_start + 8 + 8 * entry_count]))
+    track["frame_count"] = sum(count for count, _ in sample_deltas)
+    if b"stss" in stbl and timescale:
+        stss_start, _ = stbl[b"stss"][0]
+        entry_count = struct.unpack(">I", moov[stss_start + 4:stss_start + 8])[0]
+        sync_samples = {number - 1 for (number,) in struct.iter_unpack(">I", moov[stss_start + 8:stss_start + 8 + 4 * entry_count])}
+        keyframe_times = []
+        sample_index, sample_time = 0, 0
+        for count, delta in sample_deltas:
+            for _ in range(count):
+                if sample_index in sync_samples:
+                    keyframe_times.append(sample_time / timescale)
+                sample_index += 1
+                sample_time += delta
+        track["keyframe_times"] = keyframe_times
+    return track
+
+def parse_mp4(read_at: ReadAt, file_size: int) -> Optional[MediaInfo]:
+    """
+    MediaInfo from the moov box of an mp4/mov file. Only the box headers on the way to moov and
+    moov itself are read. Returns None for files without a usable moov (e.g. fragmented mp4).
+    """
+    if read_at(4, 4) != b"ftyp":
+        return None
+    moov_range = find_moov(read_at, file_size)
+    if moov_range is None:
+        return None
+    moov = read_at(moov_range[0], moov_range[1] - moov_range[0])
+    children = get_children(moov)
+    if b"mvhd" not in children:
+        return None
+
+    mvhd_start, _ = children[b"mvhd"][0]
+    if moov[mvhd_start] == 1:
+        timescale, duration = struct.unpack(">IQ", moov[mvhd_start + 20:mvhd_start + 32])
+    else:
+        timescale, duration = struct.unpack(">II", moov[mvhd_start + 12:mvhd_start + 20])
+
+    tracks = [track for track in (parse_track(moov, *trak_range) for trak_range in children.get(b"trak", [])) if track]
+    video = next((track for track in tracks if track["handler"] == b"vide"), None)
+    audio = next((track for track in tracks if track["handler"] == b"soun"), None)
+    if video is not None and not video["frame_count"]:
+        return None
+
+    info = MediaInfo(
+        kind="video" if video is not None else "audio",
+        format="mp4",
+        duration=duration / timescale if timescale and duration else None,
+        has_audio=audio is not None,
+    )
+    if video is not None:
+        info.width, info.height = video["width"], video["height"]
+        info.frame_count = video["frame_count"]
+        info.fps = video["frame_count"] / video["duration"] if video["duration"] else None
+        info.video_codec = video["codec"]
+        info.rotation = video["rotation"]
+        info.keyframe_times = video.get("keyframe_times")
+        info.duration = info.duration or video["duration"]
+    if audio is not None:
+        info.audio_sample_rate = audio.get("sample_rate")
+        info.audio_channels = audio.get("channels")
+        info.duration = info.duration or audio["duration"]
+    return info
+
+def parse_rate(rate: Optional[str]) -> Optional[float]:
+    if not rate or "/" not in rate:
+        return None
+    numerator, denominator = rate.split("/")
+    return float(numerator) / float(denominator) if float(denominator) else None
+
+def parse_ffprobe_json(data: dict) -> MediaInfo:
+    """
+    MediaInfo from `ffprobe -show_format -show_streams -of json` output.
+    """
+    format_data = data.get("format", {})
+    streams = data.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), None)
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+    format_name = format_data.get("format_name", "")
+    duration = format_data.get("duration")
+
+    is_image = video is not None and ("image2" in format_name or format_name.endswith("_pipe"))
+    info = MediaInfo(
+        kind="image" if is_image else "video" if video is not None else "audio",
+        format=format_name.split(",")[0],
+        duration=None if is_image or duration is None else float(duration),
+        has_audio=audio is not None,
+    )
+    if video is not None:
+        info.width, info.height = video.get("width"), video.get("height")
+        info.video_codec = video.get("codec_name")
+        if not is_image:
+            info.fps = parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate"))
+            if video.get("nb_frames"):
+                info.frame_count = int(video["nb_frames"])
+            elif info.fps and info.duration:
+                info.frame_count = int(round(info.fps * info.duration))
+            rotation = video.get("tags", {}).get("rotate")
+            for side_data in video.get("side_data_list", []):
+                rotation = side_data.get("rotation", rotation)
+            info.rotation = int(float(rotation)) % 360 if rotation is not None else 0
+    if audio is not None:
+        info.audio_sample_rate = int(audio["sample_rate"]) if audio.get("sample_rate") else None
+        info.audio_channels = audio.get("channels")
+    return info
+
+def probe_with_ffprobe(source: str) -> MediaInfo:
+    output = run_ffprobe(["-show_format", "-show_streams", "-of", "json", source])
+    return parse_ffprobe_json(json.loads(output))
+
+def probe_image(path: Union[str, BinaryIO]) -> Optional[MediaInfo]:
+    try:
+        # Image.open only parses the header, pixels are decoded on first access
+        with Image.open(path) as image:
+            return MediaInfo(kind="image", format=(image.format or "").lower(), width=image.width, height=image.height)
+    except Exception:
+        return None
+
+def probe_local_file(path: str) -> MediaInfo:
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        def read_at(offset: int, size: int) -> bytes:
+            f.seek(offset)
+            return f.read(size)
+        info = parse_mp4(read_at, file_size)
+    return info or probe_image(path) or probe_with_ffprobe(path)
+
+def get_jpeg_size(read_at: ReadAt) -> Optional[Tuple[int, int]]:
+    """
+    (width, height) from the JPEG start of frame segment, walking the marker segments before it.
+    """
+    offset = 2
+    while True:
+        header = read_at(offset, 9)
+        if len(header) < 4 or header[0] != 0xFF:
+            return None
+        marker = header[1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Standalone markers have no length
+            offset += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if len(header) < 9:
+                return None
+            height, width = struct.unpack(">HH", header[5:9])
+            return width, height
+        if marker == 0xDA:
+            # Image data starts and no frame header was found
+            return None
+        offset += 2 + struct.unpack(">H", header[2:4])[0]
+
+def parse_image_header(read_at: ReadAt) -> Optional[MediaInfo]:
+    """
+    MediaInfo of a JPEG (SOF), PNG (IHDR) or GIF (screen descriptor) from its header bytes.
+    """
+    head = read_at(0, 24)
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", head[16:24])
+        return MediaInfo(kind="image", format="png", width=width, height=height)
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        width, height = struct.unpack("<HH", head[6:10])
+        return MediaInfo(kind="image", format="gif", width=width, height=height)
+    if head.startswith(b"\xff\xd8"):
+        size = get_jpeg_size(read_at)
+        if size is not None:
+            return MediaInfo(kind="image", format="jpeg", width=size[0], height=size[1])
+    return None
+
+class RangeReader:
+    """
+    read_at over HTTP Range requests. Fetched blocks are kept, so the many small reads of the header
+    parsers cost one request per region of the file: the head, and for mp4 the moov wherever it is.
+    """
+    def __init__(self, url: str, session: requests.Session):
+        self.url = url
+        self.session = session
+        self.file_size: Optional[int] = None
+        self.request_count = 0
+        self.bytes_read = 0
+        self._blocks: List[Tuple[int, bytes]] = []
+
+    def fetch(self, start: int, end: int) -> bytes:
+        headers = {"Range": f"bytes={start}-{end - 1}", "Accept-Encoding": "identity"}
+        with self.session.get(self.url, headers=headers, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            self.request_count += 1
+            if response.status_code == 206:
+                # Content-Range: bytes 0-65535/1234567
+                total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+                if total.isdigit():
+                    self.file_size = int(total)
+            elif start == 0:
+                # The server ignored the range: read the head of the full response and drop the rest
+                if response.headers.get("Content-Length", "").isdigit():
+                    self.file_size = int(response.headers["Content-Length"])
+            else:
+                raise IOError(f"Server does not support range requests: {self.url}")
+
+            data = b""
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                data += chunk
+                if len(data) >= end - start:
+                    break
+        self.bytes_read += len(data)
+        return data[:end - start]
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        if self.file_size is not None:
+            size = min(size, self.file_size - offset)
+        if size <= 0:
+            return b""
+        for start, data in self._blocks:
+            if start <= offset and offset + size <= start + len(data):
+                return data[offset - start:offset - start + size]
+        data = self.fetch(offset, offset + max(size, REMOTE_BLOCK_BYTES))
+        self._blocks.append((offset, data))
+        return data[:size]
+
+def probe_remote(url: str) -> MediaInfo:
+    """
+    MediaInfo of a URL from ranged reads of its header instead of a full download: JPEG/PNG/GIF
+    from the first block, mp4/mov from the head plus the moov box (a trailing moov is found by
+    skipping mdat by its size). Anything else, or a server without range support, goes to ffprobe.
+    """
+    try:
+        with requests.Session() as session:
+            reader = RangeReader(url, session)
+            head = reader.read_at(0, REMOTE_HEAD_BYTES)
+            info = parse_image_header(reader.read_at)
+            if info is None and reader.file_size:
+                info = parse_mp4(reader.read_at, reader.file_size)
+            if info is None:
+                info = probe_image(BytesIO(head))
+            if info is not None:
+                logger.debug(f"Probed {url} with {reader.request_count} range requests ({reader.bytes_read} bytes)")
+                return info
+    except Exception as e:
+        logger.warning(f"Range probe of {url} failed, falling back to ffprobe: {e}")
+    return probe_with_ffprobe(url)
+
+class MediaProbe:
+    """
+    Metadata of media files and URLs without decoding them. mp4/mov headers are read with a box
+    reader, images with PIL's header parser and everything else with ffprobe JSON. URLs are probed
+    with HTTP range reads of the same headers, so they are never downloaded in full. Results are
+    cached in memory and on disk, keyed by path + mtime + size for files and URL + ETag for URLs,
+    where the URL is taken without its query string. URLs found in memory are not revalidated, so
+    a probe of a cached URL sends no request.
+    """
+    def __init__(self, cache_dir: str, max_entries: int = 4096):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._memory = LRUCache(maxsize=max_entries)
+
+    def get_memory_key(self, source: str) -> str:
+        return get_url_id(source) if is_url(source) else self.get_cache_key(source)
+
+    def get_cache_key(self, source: str) -> str:
+        if is_url(source):
+            return f"{get_url_id(source)}|{get_source_etag(source)}"
+        stat = os.stat(source)
+        return f"{os.path.abspath(source)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+    def get_disk_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def probe(self, source: str) -> MediaInfo:
+        memory_key = self.get_memory_key(source)
+        with self._lock:
+            info = self._memory.get(memory_key)
+        if info is not None:
+            return info
+
+        key = self.get_cache_key(source)
+        disk_path = self.get_disk_path(key)
+        if os.path.exists(disk_path):
+            with open(disk_path) as f:
+                info = MediaInfo.model_validate_json(f.read())
+        else:
+            logger.debug(f"Probing {source}")
+            info = probe_remote(source) if is_url(source) else probe_local_file(source)
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            temp_path = f"{disk_path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(info.model_dump_json())
+            os.replace(temp_path, disk_path)
+
+        with self._lock:
+            self._memory[memory_key] = info
+        return info
+
+    async def probe_async(self, source: str) -> MediaInfo:
+        return await asyncio.to_thread(self.probe, source)
+
+    async def probe_many(self, sources: List[str], concurrency: int = 8) -> List[MediaInfo]:
+        """
+        Probe several files or URLs concurrently, e.g. all assets of a project.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def probe_limited(source: str) -> MediaInfo:
+            async with semaphore:
+                return await self.probe_async(source)
+
+        return await asyncio.gather(*[probe_limited(source) for source in sources])
+
+media_probe = MediaProbe(Settings.MEDIA_PROBE_CACHE_DIR)
+
+if __name__ == "__main__":
+    # python -m src.utils.media_probe <file or URL> ...
+    import sys
+    for source, info in zip(sys.argv[1:], asyncio.run(media_probe.probe_many(sys.argv[1:]))):
+        print(source, info.model_dump_json(indent=2))
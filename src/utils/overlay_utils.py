@@ -0,0 +1,69 @@
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+
+# (x0, y0, x1, y1) region of a frame, end exclusive
+ROI = Tuple[int, int, int, int]
+
+class OverlaySprite:
+    """
+    Premultiplied-alpha overlay stored in BGR order, ready to be blended onto frames from
+    cv2.VideoCapture.read() without colour conversions. Used for captions and any other
+    fixed overlay (logo, CTA).
+    """
+    def __init__(self, bgr_premultiplied: np.ndarray, alpha: np.ndarray):
+        self.bgr_premultiplied = bgr_premultiplied
+        self.alpha = alpha
+        self.inverse_alpha = 255 - alpha
+        self.height, self.width = alpha.shape[:2]
+
+    @classmethod
+    def from_rgba_image(cls, image: Image.Image) -> "OverlaySprite":
+        rgba = np.asarray(image.convert('RGBA'), dtype=np.uint16)
+        alpha = rgba[:, :, 3:4]
+        # Premultiply with rounding and flip RGB -> BGR once, when the sprite is created
+        bgr_premultiplied = (rgba[:, :, 2::-1] * alpha + 127) // 255
+        return cls(bgr_premultiplied.astype(np.uint8), alpha.astype(np.uint8))
+
+    def to_rgba_image(self) -> Image.Image:
+        alpha = self.alpha.astype(np.uint16)
+        rgb = self.bgr_premultiplied[:, :, ::-1].astype(np.uint16) * 255
+        rgb = np.where(alpha > 0, (rgb + alpha // 2) // np.maximum(alpha, 1), 0)
+        rgba = np.concatenate([np.minimum(rgb, 255), alpha], axis=2).astype(np.uint8)
+        return Image.fromarray(rgba, 'RGBA')
+
+def get_overlay_roi(frame_shape: Tuple[int, ...], sprite: OverlaySprite, x: int, y: int) -> Optional[ROI]:
+    """
+    Clip a sprite placed at (x, y) to the frame. Returns None when nothing is visible.
+    """
+    frame_height, frame_width = frame_shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + sprite.width, frame_width), min(y + sprite.height, frame_height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+def blend_overlay(frame: np.ndarray, sprite: OverlaySprite, x: int, y: int) -> Optional[ROI]:
+    """
+    Blend the sprite onto a BGR uint8 frame in place, touching only the covered region:
+    out = premultiplied + frame * (255 - alpha) / 255. Returns the blended ROI.
+    """
+    roi = get_overlay_roi(frame.shape, sprite, x, y)
+    if roi is None:
+        return None
+    x0, y0, x1, y1 = roi
+    sx, sy = x0 - x, y0 - y
+    sprite_rows = slice(sy, sy + (y1 - y0))
+    sprite_cols = slice(sx, sx + (x1 - x0))
+
+    region = frame[y0:y1, x0:x1]
+    blended = region.astype(np.uint16)
+    blended *= sprite.inverse_alpha[sprite_rows, sprite_cols]
+    # Exact rounded division by 255 for values up to 255 * 255
+    blended += 128
+    blended += blended >> 8
+    blended >>= 8
+    blended += sprite.bgr_premultiplied[sprite_rows, sprite_cols]
+    np.minimum(blended, 255, out=blended)
+    region[...] = blended
+    return roi
@@ -1,3 +1,102 @@
+import multiprocessing
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from src.config.settings import Settings
+from src.utils.logger import logger
+
+# Encoder settings shared by every ffmpeg based render so outputs stay comparable
+# with the moviepy path (moviepy's libx264 defaults are preset medium / crf 23).
+OUTPUT_FPS = 25
+X264_PRESET = "medium"
+X264_CRF = 23
+OUTPUT_PIX_FMT = "yuv420p"
+# Keyframe every 2 seconds. Segments encoded with the same arguments can be joined with stream copy.
+SEGMENT_GOP = OUTPUT_FPS * 2
+
+def get_x264_args(tune: Optional[str] = None) -> List[str]:
+    """
+    Video encoder arguments shared by every asset segment.
+    """
+    args = [
+        "-c:v", "libx264", "-preset", X264_PRESET, "-crf", str(X264_CRF), "-pix_fmt", OUTPUT_PIX_FMT,
+        "-r", str(OUTPUT_FPS), "-g", str(SEGMENT_GOP),
+    ]
+    if tune:
+        args += ["-tune", tune]
+    return args
+
+def get_segment_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool encoding the segments of a render, at most one process per CPU.
+    """
+    # The pools are started from the render worker processes, which run an asyncio loop with
+    # to_thread threads; a forked child could inherit a lock held by one of those threads, so the
+    # pool processes are spawned.
+    workers = max(1, min(workers, os.cpu_count() or 1))
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def run_ffmpeg(args: List[str]) -> None:
+    """
+    Run ffmpeg with the given arguments and raise if it exits with an error.
+    """
+    command = [Settings.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", *args]
+    logger.debug(f"Running ffmpeg: {' '.join(command)}")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        stderr = result.stderr.strip()
+        logger.error(f"ffmpeg exited with code {result.returncode}: {stderr}")
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {stderr[-1000:]}")
+
+def run_ffprobe(args: List[str]) -> str:
+    """
+    Run ffprobe with the given arguments and return its stdout.
+    """
+    command = [Settings.FFPROBE_BINARY, "-v", "error", *args]
+    logger.debug(f"Running ffprobe: {' '.join(command)}")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        stderr = result.stderr.strip()
+        logger.error(f"ffprobe exited with code {result.returncode}: {stderr}")
+        raise RuntimeError(f"ffprobe exited with code {result.returncode}: {stderr[-1000:]}")
+    return result.stdout
+
+def get_keyframe_times(input_video: str) -> List[float]:
+    """
+    Presentation times of the video keyframes, read from the packet flags without decoding.
+    """
+    output = run_ffprobe([
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        input_video,
+    ])
+    keyframe_times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframe_times.append(float(pts_time))
+    return sorted(keyframe_times)
+
+def open_ffmpeg_pipe(args: List[str]) -> subprocess.Popen:
+    """
+    Start ffmpeg with stdin open for raw frames. Finish with close_ffmpeg_pipe.
+    """
+    command = [Settings.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", *args]
+    logger.debug(f"Starting ffmpeg pipe: {' '.join(command)}")
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def close_ffmpeg_pipe(process: subprocess.Popen) -> None:
+    """
+    Close stdin of a process started with open_ffmpeg_pipe, wait for it and raise if it failed.
+    """
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        stderr = stderr.decode(errors="replace").strip()
+        logger.error(f"ffmpeg exited with code {process.returncode}: {stderr}")
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {stderr[-1000:]}")
+
 # def merge_audio_video(video_path, audio_path, output_path):
 #     print("Merging audio and video...")
 #     audio = ffmpeg.input(audio_path)
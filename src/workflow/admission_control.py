@@ -0,0 +1,152 @@
+import asyncio
+import os
+import shutil
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+from src.api.routes.users_routes import reduce_credit
+from src.config.constants import Constants
+from src.config.settings import Settings
+from src.models.base_models import Project, ProjectStatus
+from src.supabase_tools.handle_project_tb_updates import get_project_id_from_prediction_id, update_project_in_db
+from src.utils.logger import logger
+from src.workflow.job_queue import IO_QUEUE, Admission, AdmissionStatus, JobQueue, job_queue
+from src.workflow.stage_artifacts import stage_artifacts
+from src.workflow.stage_graph import RUN_JOB
+
+# Estimated peak memory of a render: moviepy holds a few decoded 1080x1920 clips per asset next to
+# the actor video and the frames of the captions, which grow with the duration
+RENDER_BASE_MEMORY_MB = 600
+RENDER_MEMORY_PER_ASSET_MB = 200
+RENDER_MEMORY_PER_SECOND_MB = 15
+# Share of the container's memory the renders may use when RENDER_MEMORY_BUDGET_MB is not set
+MEMORY_BUDGET_SHARE = 0.75
+
+def get_render_memory_mb(project: Project) -> float:
+    duration = project.final_video_duration or (project.video_configuration.duration if project.video_configuration else 0)
+    return RENDER_BASE_MEMORY_MB + RENDER_MEMORY_PER_ASSET_MB * len(project.assets) + RENDER_MEMORY_PER_SECOND_MB * duration
+
+def get_memory_limit_mb() -> float:
+    """
+    Memory limit of the container's cgroup, else the machine's memory.
+    """
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as file:
+                limit = file.read().strip()
+            # "max" and the v1 "unlimited" value (close to 2**63) mean no limit
+            if limit != "max" and int(limit) < 2 ** 60:
+                return int(limit) / 1024 ** 2
+        except (OSError, ValueError):
+            continue
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 2
+
+def get_free_disk_mb() -> float:
+    os.makedirs(Constants.LOCAL_STORAGE_BASE_PATH, exist_ok=True)
+    return shutil.disk_usage(Constants.LOCAL_STORAGE_BASE_PATH).free / 1024 ** 2
+
+class AdmissionController:
+    """
+    Admission control of video generations. A new project waits in the job store until there is
+    capacity for it: fewer than MAX_IN_FLIGHT_RENDERS projects running, the estimated render memory
+    of the running ones plus its own within the memory budget and at least MIN_FREE_DISK_MB free
+    under temp_storage. Admitted projects are charged a credit and their run is enqueued. Finished
+    and failed runs release their place, which admits the next waiting projects.
+    """
+    def __init__(self, store: JobQueue = job_queue):
+        self.store = store
+        self.memory_budget_mb = Settings.RENDER_MEMORY_BUDGET_MB or MEMORY_BUDGET_SHARE * get_memory_limit_mb()
+
+    async def request(self, project: Project, priority: int = 0) -> Dict[str, Any]:
+        """
+        Let the project wait for admission and admit what fits. Returns whether the project was
+        admitted with the id of its run (None when it had no credit left, or while another process
+        is still starting it), or its position among the waiting projects.
+        """
+        memory_mb = get_render_memory_mb(project)
+        requested_at = time.time()
+        requested = await asyncio.to_thread(self.store.request_admission, str(project.id), str(project.user_id),
+                                            project.model_dump(mode="json"), priority, memory_mb, Settings.ADMISSION_TIMEOUT_SECONDS)
+        if not requested:
+            return {"admitted": False, "in_progress": True, "queue_position": None}
+        logger.info(f"Project {project.id} waits for admission, estimated render memory {memory_mb:.0f} MB")
+
+        started = await self.admit_waiting()
+        if str(project.id) in started:
+            return {"admitted": True, "job_id": started[str(project.id)]}
+        position = await asyncio.to_thread(self.store.get_admission_position, str(project.id))
+        if position is not None:
+            return {"admitted": False, "in_progress": False, "queue_position": position}
+
+        # A render worker's admit_waiting admitted the project between the request and this pass
+        run = await asyncio.to_thread(self.store.get_latest_job, str(project.id), RUN_JOB)
+        if run is not None and run.created_at >= requested_at:
+            return {"admitted": True, "job_id": run.id}
+        status = await asyncio.to_thread(self.store.get_admission_status, str(project.id))
+        if status == AdmissionStatus.RELEASED:
+            logger.info(f"Project {project.id} was admitted by another process without a credit left")
+            return {"admitted": True, "job_id": None}
+        return {"admitted": True, "job_id": None, "starting": True}
+
+    async def admit_waiting(self) -> Dict[str, Optional[str]]:
+        """
+        Start the waiting projects that fit. Returns the run's job id by project id, None for the
+        projects that were admitted without a credit left.
+        """
+        started: Dict[str, Optional[str]] = {}
+        while True:
+            free_disk_mb = await asyncio.to_thread(get_free_disk_mb)
+            if free_disk_mb < Settings.MIN_FREE_DISK_MB:
+                # Stage artifacts of finished projects make room first
+                missing_bytes = int((Settings.MIN_FREE_DISK_MB - free_disk_mb) * 1024 ** 2)
+                if await asyncio.to_thread(stage_artifacts.evict, time.time() - Settings.ADMISSION_TIMEOUT_SECONDS, missing_bytes):
+                    continue
+                logger.warning(f"Only {free_disk_mb:.0f} MB free under {Constants.LOCAL_STORAGE_BASE_PATH}, admitting no projects")
+                return started
+            admitted = await asyncio.to_thread(self.store.admit, Settings.MAX_IN_FLIGHT_RENDERS,
+                                               self.memory_budget_mb, Settings.ADMISSION_TIMEOUT_SECONDS)
+            for index, admission in enumerate(admitted):
+                try:
+                    started[admission.project_id] = await self.start(admission)
+                except Exception as e:
+                    # E.g. Supabase is down: the projects not started yet wait in their place for the next pass
+                    logger.error(f"Could not start video generation for admitted project {admission.project_id}, "
+                                 f"requeueing it and {len(admitted) - index - 1} more: {e}")
+                    for waiting in admitted[index:]:
+                        await asyncio.to_thread(self.store.requeue_admission, waiting.project_id)
+                    return started
+            # Projects without credits released their place right away, which may admit the next ones
+            if not admitted or all(started.get(admission.project_id) for admission in admitted):
+                return started
+
+    async def start(self, admission: Admission) -> Optional[str]:
+        project = Project.model_validate(admission.payload)
+        credits = await reduce_credit(project.user_id)
+        if not credits["reduced_credits"]:
+            logger.warning(f"No credits available for user {project.user_id}, project {project.id} is not generated")
+            await asyncio.to_thread(self.store.release_admission, admission.project_id)
+            project.status = ProjectStatus.FAILED
+            await update_project_in_db(project)
+            return None
+        # The stage jobs of the run inherit its priority
+        job_id = await asyncio.to_thread(self.store.enqueue, IO_QUEUE, RUN_JOB, {"project": admission.payload},
+                                         priority=admission.priority, user_id=admission.user_id, project_id=admission.project_id)
+        logger.info(f"Admitted project {project.id}, video generation job {job_id}")
+        return job_id
+
+    async def release(self, project_id: UUID) -> None:
+        await asyncio.to_thread(self.store.release_admission, str(project_id))
+        await self.admit_waiting()
+
+    async def release_prediction(self, prediction_id: str) -> None:
+        """
+        Release the project of a lipsync prediction that failed, its run cannot finish.
+        """
+        try:
+            project_id = await get_project_id_from_prediction_id(prediction_id)
+        except Exception as e:
+            logger.warning(f"No project to release for prediction {prediction_id}: {e}")
+            return
+        await self.release(project_id)
+
+admission_control = AdmissionController()
@@ -0,0 +1,654 @@
+import json
+import os
+import sqlite3
+import statistics
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+from src.config.settings import Settings
+from src.utils.logger import logger
+
+# CPU heavy stages (asset video, actor preprocessing, render) and the network bound ones (T2S, lipsync, captions, upload)
+RENDER_QUEUE = "render"
+IO_QUEUE = "io"
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class Job(BaseModel):
+    id: str
+    queue: str
+    name: str
+    payload: Dict[str, Any]
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    available_at: float
+    locked_until: Optional[float] = None
+    worker_id: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    priority: int = 0
+    user_id: Optional[str] = None
+    project_id: Optional[str] = None
+
+class AdmissionStatus(str, Enum):
+    WAITING = "waiting"
+    ADMITTED = "admitted"
+    RELEASED = "released"
+
+class Admission(BaseModel):
+    project_id: str
+    user_id: Optional[str] = None
+    payload: Dict[str, Any]
+    priority: int = 0
+    memory_mb: float
+    status: AdmissionStatus
+    created_at: float
+
+def get_queue_concurrency() -> Dict[str, int]:
+    return {RENDER_QUEUE: Settings.RENDER_QUEUE_CONCURRENCY, IO_QUEUE: Settings.IO_QUEUE_CONCURRENCY}
+
+class JobQueue(ABC):
+    """
+    Durable queue of named jobs with JSON payloads. A worker claims a job for the visibility
+    timeout and extends the claim while it runs; a job whose worker died becomes claimable again
+    once the claim expires. Failed jobs are retried with exponential backoff up to max_attempts.
+    At most queue_concurrency[queue] jobs of a queue run at once, across all workers.
+
+    Jobs are claimed by priority, raised by how long they have been waiting so that low priorities
+    are not starved. A user running JOB_USER_CONCURRENCY jobs of a queue only gets another one
+    when no other user's job is waiting, so one user's ten projects do not hold every worker.
+    The queue also stores the joins of workflow stages that finish in different workers, the
+    timings of finished stages, used to estimate when a project is done, and the admissions of
+    projects waiting for render capacity.
+    """
+    def __init__(self, queue_concurrency: Dict[str, int], visibility_timeout: float):
+        self.queue_concurrency = queue_concurrency
+        self.visibility_timeout = visibility_timeout
+
+    @abstractmethod
+    def enqueue(self, queue: str, name: str, payload: Dict[str, Any], max_attempts: int = Settings.JOB_MAX_ATTEMPTS,
+                delay: float = 0, priority: int = 0, user_id: Optional[str] = None, project_id: Optional[str] = None) -> str:
+        """
+        Add a job and return its id.
+        """
+
+    @abstractmethod
+    def claim(self, queues: List[str], worker_id: str) -> Optional[Job]:
+        """
+        Next available job of the given queues whose queue is below its concurrency limit, or None.
+        Jobs of users below JOB_USER_CONCURRENCY running jobs of the queue come first, then the
+        highest priority raised by the waiting time, then the oldest. Jobs waiting out a retry
+        delay are not available.
+        """
+
+    @abstractmethod
+    def extend(self, job: Job, worker_id: str) -> bool:
+        """
+        Renew the claim. False when the worker lost it (it expired and the job was claimed again).
+        """
+
+    @abstractmethod
+    def complete(self, job: Job, worker_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def fail(self, job: Job, worker_id: str, error: str) -> None:
+        """
+        Schedule a retry, or mark the job failed once it used up its attempts.
+        """
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        pass
+
+    @abstractmethod
+    def arrive(self, join_key: str, branch: str, outputs: Dict[str, Any], branches: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Record that a branch of a join finished with the given outputs. Returns the outputs of every
+        branch once all of them arrived, else None. Arriving again replaces the branch's outputs.
+        """
+
+    @abstractmethod
+    def reset_join(self, join_key: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_join(self, join_key: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Outputs of the branches that arrived so far, by branch.
+        """
+
+    @abstractmethod
+    def get_latest_job(self, project_id: str, name: str) -> Optional[Job]:
+        pass
+
+    @abstractmethod
+    def count_user_jobs(self, user_id: str, name: str, since: float) -> int:
+        """
+        Number of the user's jobs of the given name enqueued since the given time.
+        """
+
+    @abstractmethod
+    def count_running(self, queue: str) -> int:
+        """
+        Number of the queue's jobs running now, across all workers.
+        """
+
+    @abstractmethod
+    def get_project_priority(self, project_id: str) -> int:
+        """
+        Priority of the project's latest job, 0 if it has none.
+        """
+
+    @abstractmethod
+    def get_queue_positions(self, project_id: str) -> List[Tuple[Job, int]]:
+        """
+        The project's waiting jobs, each with its position in its queue (1 is claimed next) in the
+        order claim() would pick them now.
+        """
+
+    @abstractmethod
+    def start_stage_run(self, project_id: str, stage: str) -> None:
+        pass
+
+    @abstractmethod
+    def finish_stage_run(self, project_id: str, stage: str, reused: bool = False) -> None:
+        pass
+
+    @abstractmethod
+    def get_stage_runs(self, project_id: str, since: float) -> Dict[str, Tuple[float, Optional[float]]]:
+        """
+        (started_at, finished_at) of the project's latest run of every stage started since the given time.
+        """
+
+    @abstractmethod
+    def get_stage_durations(self) -> Dict[str, float]:
+        """
+        Median seconds of the recent runs of every stage, not counting reused stages.
+        """
+
+    @abstractmethod
+    def request_admission(self, project_id: str, user_id: Optional[str], payload: Dict[str, Any],
+                          priority: int, memory_mb: float, timeout: float) -> bool:
+        """
+        Let the project wait for admission. False when it is already admitted and not released.
+        """
+
+    @abstractmethod
+    def admit(self, max_in_flight: int, memory_budget_mb: float, timeout: float) -> List[Admission]:
+        """
+        Admit waiting projects, in claim order, while the admitted ones stay within max_in_flight
+        and memory_budget_mb. Admissions older than timeout seconds no longer count.
+        """
+
+    @abstractmethod
+    def release_admission(self, project_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def requeue_admission(self, project_id: str) -> None:
+        """
+        Let an admitted project wait again, in its old place.
+        """
+
+    @abstractmethod
+    def get_admission_status(self, project_id: str) -> Optional[AdmissionStatus]:
+        """
+        Status of the project's admission, None if it never asked for one.
+        """
+
+    @abstractmethod
+    def get_admission_position(self, project_id: str) -> Optional[int]:
+        """
+        Position of the waiting project among the waiting ones (1 is admitted next), None if it does not wait.
+        """
+
+    def get_retry_delay(self, attempts: int) -> float:
+        return Settings.JOB_RETRY_DELAY_SECONDS * 2 ** max(0, attempts - 1)
+
+class SqliteJobQueue(JobQueue):
+    """
+    JobQueue in a local SQLite file, shared by the API and the worker processes of one machine.
+    Claims and join arrivals run in an IMMEDIATE transaction, so two workers never claim the same
+    job and the concurrency limits hold across processes.
+    """
+    def __init__(self, path: str, queue_concurrency: Dict[str, int], visibility_timeout: float,
+                 user_concurrency: int = Settings.JOB_USER_CONCURRENCY, priority_aging: float = Settings.JOB_PRIORITY_AGING_SECONDS):
+        super().__init__(queue_concurrency, visibility_timeout)
+        self.path = path
+        self.user_concurrency = user_concurrency
+        # Seconds of waiting that raise a job's priority by one
+        self.priority_aging = priority_aging
+        self._initialized = False
+
+    def initialize(self, connection: sqlite3.Connection) -> None:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                queue TEXT NOT NULL,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                locked_until REAL,
+                worker_id TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Columns added after the table was first created
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(jobs)").fetchall()}
+        for column, definition in [("started_at", "REAL"), ("priority", "INTEGER NOT NULL DEFAULT 0"), ("user_id", "TEXT"), ("project_id", "TEXT")]:
+            if column not in columns:
+                connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_status_queue ON jobs (status, queue, available_at)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project_id, created_at)")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS joins (
+                join_key TEXT NOT NULL,
+                branch TEXT NOT NULL,
+                outputs TEXT NOT NULL,
+                arrived_at REAL NOT NULL,
+                PRIMARY KEY (join_key, branch)
+            )
+        """)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS stage_runs (
+                project_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                reused INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS stage_runs_project ON stage_runs (project_id, stage, started_at)")
+        connection.execute("CREATE INDEX IF NOT EXISTS stage_runs_finished ON stage_runs (finished_at)")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS admissions (
+                project_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                memory_mb REAL NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS admissions_status ON admissions (status, created_at)")
+        self._initialized = True
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Autocommit; transactions are opened explicitly where they are needed
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            if not self._initialized:
+                self.initialize(connection)
+            yield connection
+        finally:
+            connection.close()
+
+    def to_job(self, row: sqlite3.Row) -> Job:
+        data = dict(row)
+        data["payload"] = json.loads(data["payload"])
+        data.pop("updated_at", None)
+        return Job(**data)
+
+    def enqueue(self, queue: str, name: str, payload: Dict[str, Any], max_attempts: int = Settings.JOB_MAX_ATTEMPTS,
+                delay: float = 0, priority: int = 0, user_id: Optional[str] = None, project_id: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, queue, name, payload, status, max_attempts, available_at, created_at, updated_at, priority, user_id, project_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, queue, name, json.dumps(payload), JobStatus.QUEUED.value, max_attempts, now + delay, now, now,
+                 priority, user_id, project_id)
+            )
+        logger.info(f"Enqueued job {name} ({job_id}) on queue {queue} with priority {priority}")
+        return job_id
+
+    def release_expired(self, connection: sqlite3.Connection, now: float) -> None:
+        # Claims of workers that died or hung: retry the job, or give up on it
+        connection.execute(
+            "UPDATE jobs SET status = ?, worker_id = NULL, locked_until = NULL, last_error = 'visibility timeout expired', updated_at = ? "
+            "WHERE status = ? AND locked_until < ? AND attempts < max_attempts",
+            (JobStatus.QUEUED.value, now, JobStatus.RUNNING.value, now)
+        )
+        connection.execute(
+            "UPDATE jobs SET status = ?, locked_until = NULL, last_error = 'visibility timeout expired', updated_at = ? "
+            "WHERE status = ? AND locked_until < ? AND attempts >= max_attempts",
+            (JobStatus.FAILED.value, now, JobStatus.RUNNING.value, now)
+        )
+
+    def claim(self, queues: List[str], worker_id: str) -> Optional[Job]:
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.release_expired(connection, now)
+                running = dict(connection.execute(
+                    "SELECT queue, COUNT(*) FROM jobs WHERE status = ? GROUP BY queue", (JobStatus.RUNNING.value,)
+                ).fetchall())
+                open_queues = [queue for queue in queues if running.get(queue, 0) < self.queue_concurrency.get(queue, 1)]
+                if not open_queues:
+                    connection.execute("COMMIT")
+                    return None
+
+                # Users below their fair share first, then by priority raised by the waiting time
+                row = connection.execute(
+                    "SELECT jobs.id FROM jobs LEFT JOIN ("
+                    "    SELECT queue, user_id, COUNT(*) AS running FROM jobs WHERE status = ? GROUP BY queue, user_id"
+                    ") AS users ON users.queue = jobs.queue AND users.user_id = jobs.user_id "
+                    f"WHERE jobs.status = ? AND jobs.available_at <= ? AND jobs.queue IN ({','.join('?' * len(open_queues))}) "
+                    "ORDER BY COALESCE(users.running, 0) >= ?, jobs.priority + (? - jobs.created_at) / ? DESC, "
+                    "COALESCE(users.running, 0), jobs.available_at, jobs.created_at LIMIT 1",
+                    (JobStatus.RUNNING.value, JobStatus.QUEUED.value, now, *open_queues, self.user_concurrency, now, self.priority_aging)
+                ).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return None
+
+                connection.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?, worker_id = ?, started_at = ?, updated_at = ? WHERE id = ?",
+                    (JobStatus.RUNNING.value, now + self.visibility_timeout, worker_id, now, now, row["id"])
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def extend(self, job: Job, worker_id: str) -> bool:
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET locked_until = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + self.visibility_timeout, now, job.id, worker_id, JobStatus.RUNNING.value)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job: Job, worker_id: str) -> None:
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, locked_until = NULL, last_error = NULL, updated_at = ? WHERE id = ? AND worker_id = ?",
+                (JobStatus.SUCCEEDED.value, time.time(), job.id, worker_id)
+            )
+
+    def fail(self, job: Job, worker_id: str, error: str) -> None:
+        now = time.time()
+        with self.connect() as connection:
+            if job.attempts < job.max_attempts:
+                retry_delay = self.get_retry_delay(job.attempts)
+                connection.execute(
+                    "UPDATE jobs SET status = ?, available_at = ?, locked_until = NULL, worker_id = NULL, last_error = ?, updated_at = ? "
+                    "WHERE id = ? AND worker_id = ?",
+                    (JobStatus.QUEUED.value, now + retry_delay, error, now, job.id, worker_id)
+                )
+                logger.warning(f"Job {job.name} ({job.id}) failed on attempt {job.attempts}/{job.max_attempts}, retrying in {retry_delay:.0f}s: {error}")
+            else:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, locked_until = NULL, last_error = ?, updated_at = ? WHERE id = ? AND worker_id = ?",
+                    (JobStatus.FAILED.value, error, now, job.id, worker_id)
+                )
+                logger.error(f"Job {job.name} ({job.id}) failed after {job.attempts} attempts: {error}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.to_job(row) if row is not None else None
+
+    def arrive(self, join_key: str, branch: str, outputs: Dict[str, Any], branches: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        with self.connect() as connection:
+            # Serializes the arrivals, so of two branches finishing together the second sees the first
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO joins (join_key, branch, outputs, arrived_at) VALUES (?, ?, ?, ?)",
+                    (join_key, branch, json.dumps(outputs), time.time())
+                )
+                rows = connection.execute("SELECT branch, outputs FROM joins WHERE join_key = ?", (join_key,)).fetchall()
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        arrived = {row["branch"]: json.loads(row["outputs"]) for row in rows}
+        if not all(branch in arrived for branch in branches):
+            return None
+        return arrived
+
+    def reset_join(self, join_key: str) -> None:
+        with self.connect() as connection:
+            connection.execute("DELETE FROM joins WHERE join_key = ?", (join_key,))
+
+    def get_join(self, join_key: str) -> Dict[str, Dict[str, Any]]:
+        with self.connect() as connection:
+            rows = connection.execute("SELECT branch, outputs FROM joins WHERE join_key = ?", (join_key,)).fetchall()
+        return {row["branch"]: json.loads(row["outputs"]) for row in rows}
+
+    def get_latest_job(self, project_id: str, name: str) -> Optional[Job]:
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE project_id = ? AND name = ? ORDER BY created_at DESC LIMIT 1", (project_id, name)
+            ).fetchone()
+        return self.to_job(row) if row is not None else None
+
+    def count_user_jobs(self, user_id: str, name: str, since: float) -> int:
+        with self.connect() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND name = ? AND created_at >= ?", (user_id, name, since)
+            ).fetchone()[0]
+
+    def count_running(self, queue: str) -> int:
+        with self.connect() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status = ?", (queue, JobStatus.RUNNING.value)
+            ).fetchone()[0]
+
+    def get_project_priority(self, project_id: str) -> int:
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT priority FROM jobs WHERE project_id = ? ORDER BY created_at DESC LIMIT 1", (project_id,)
+            ).fetchone()
+        return row["priority"] if row is not None else 0
+
+    def get_claim_order(self, row: sqlite3.Row, user_running: int, now: float) -> tuple:
+        # Same order as claim(); jobs waiting out their retry delay follow the claimable ones
+        delayed = row["available_at"] > now
+        return (delayed, row["available_at"] if delayed else 0.0, user_running >= self.user_concurrency,
+                -(row["priority"] + (now - row["created_at"]) / self.priority_aging), user_running,
+                row["available_at"], row["created_at"])
+
+    def get_queue_positions(self, project_id: str) -> List[Tuple[Job, int]]:
+        # A snapshot: the fair share term changes as other users' jobs start and finish
+        now = time.time()
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM jobs WHERE project_id = ? AND status = ?", (project_id, JobStatus.QUEUED.value)
+            ).fetchall()
+            positions = []
+            for queue in {row["queue"] for row in rows}:
+                running = dict(connection.execute(
+                    "SELECT user_id, COUNT(*) FROM jobs WHERE queue = ? AND status = ? AND user_id IS NOT NULL GROUP BY user_id",
+                    (queue, JobStatus.RUNNING.value)
+                ).fetchall())
+                waiting = connection.execute(
+                    "SELECT * FROM jobs WHERE queue = ? AND status = ?", (queue, JobStatus.QUEUED.value)
+                ).fetchall()
+                waiting.sort(key=lambda job: self.get_claim_order(job, running.get(job["user_id"], 0), now))
+                ranks = {job["id"]: rank for rank, job in enumerate(waiting, start=1)}
+                positions += [(self.to_job(row), ranks[row["id"]]) for row in rows if row["queue"] == queue]
+        return positions
+
+    def start_stage_run(self, project_id: str, stage: str) -> None:
+        with self.connect() as connection:
+            connection.execute("INSERT INTO stage_runs (project_id, stage, started_at) VALUES (?, ?, ?)", (project_id, stage, time.time()))
+
+    def finish_stage_run(self, project_id: str, stage: str, reused: bool = False) -> None:
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE stage_runs SET finished_at = ?, reused = ? WHERE rowid = ("
+                "    SELECT rowid FROM stage_runs WHERE project_id = ? AND stage = ? AND finished_at IS NULL ORDER BY started_at DESC LIMIT 1"
+                ")",
+                (now, int(reused), project_id, stage)
+            )
+            if cursor.rowcount == 0:
+                connection.execute(
+                    "INSERT INTO stage_runs (project_id, stage, started_at, finished_at, reused) VALUES (?, ?, ?, ?, ?)",
+                    (project_id, stage, now, now, int(reused))
+                )
+
+    def get_stage_runs(self, project_id: str, since: float) -> Dict[str, Tuple[float, Optional[float]]]:
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT stage, started_at, finished_at FROM stage_runs WHERE project_id = ? AND started_at >= ? ORDER BY started_at",
+                (project_id, since)
+            ).fetchall()
+        return {row["stage"]: (row["started_at"], row["finished_at"]) for row in rows}
+
+    def get_stage_durations(self, history: int = 50) -> Dict[str, float]:
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT stage, finished_at - started_at AS seconds FROM stage_runs "
+                "WHERE finished_at IS NOT NULL AND reused = 0 ORDER BY finished_at DESC LIMIT 2000"
+            ).fetchall()
+        durations: Dict[str, List[float]] = {}
+        for row in rows:
+            if len(durations.setdefault(row["stage"], [])) < history:
+                durations[row["stage"]].append(row["seconds"])
+        return {stage: statistics.median(seconds) for stage, seconds in durations.items()}
+
+    def request_admission(self, project_id: str, user_id: Optional[str], payload: Dict[str, Any],
+                          priority: int, memory_mb: float, timeout: float) -> bool:
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT status, created_at, updated_at FROM admissions WHERE project_id = ?", (project_id,)).fetchone()
+                if row is not None and row["status"] == AdmissionStatus.ADMITTED.value and row["updated_at"] > now - timeout:
+                    connection.execute("COMMIT")
+                    return False
+                # Asking again while waiting keeps the place in the queue
+                created_at = row["created_at"] if row is not None and row["status"] == AdmissionStatus.WAITING.value else now
+                connection.execute(
+                    "INSERT OR REPLACE INTO admissions (project_id, user_id, payload, priority, memory_mb, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (project_id, user_id, json.dumps(payload), priority, memory_mb, AdmissionStatus.WAITING.value, created_at, now)
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return True
+
+    def admit(self, max_in_flight: int, memory_budget_mb: float, timeout: float) -> List[Admission]:
+        now = time.time()
+        admitted = []
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                in_flight, memory_mb = connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(memory_mb), 0) FROM admissions WHERE status = ? AND updated_at > ?",
+                    (AdmissionStatus.ADMITTED.value, now - timeout)
+                ).fetchone()
+                rows = connection.execute(
+                    "SELECT * FROM admissions WHERE status = ? ORDER BY priority + (? - created_at) / ? DESC, created_at",
+                    (AdmissionStatus.WAITING.value, now, self.priority_aging)
+                ).fetchall()
+                for row in rows:
+                    # In order, so a large render is not passed over by smaller ones forever; one
+                    # render is admitted even when it alone exceeds the budget
+                    if in_flight >= max_in_flight or (in_flight > 0 and memory_mb + row["memory_mb"] > memory_budget_mb):
+                        break
+                    connection.execute(
+                        "UPDATE admissions SET status = ?, updated_at = ? WHERE project_id = ?",
+                        (AdmissionStatus.ADMITTED.value, now, row["project_id"])
+                    )
+                    in_flight += 1
+                    memory_mb += row["memory_mb"]
+                    data = dict(row)
+                    data["payload"] = json.loads(data["payload"])
+                    data["status"] = AdmissionStatus.ADMITTED
+                    data.pop("updated_at")
+                    admitted.append(Admission(**data))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return admitted
+
+    def release_admission(self, project_id: str) -> None:
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE admissions SET status = ?, updated_at = ? WHERE project_id = ? AND status = ?",
+                (AdmissionStatus.RELEASED.value, time.time(), project_id, AdmissionStatus.ADMITTED.value)
+            )
+
+    def requeue_admission(self, project_id: str) -> None:
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE admissions SET status = ?, updated_at = ? WHERE project_id = ? AND status = ?",
+                (AdmissionStatus.WAITING.value, time.time(), project_id, AdmissionStatus.ADMITTED.value)
+            )
+
+    def get_admission_status(self, project_id: str) -> Optional[AdmissionStatus]:
+        with self.connect() as connection:
+            row = connection.execute("SELECT status FROM admissions WHERE project_id = ?", (project_id,)).fetchone()
+        return AdmissionStatus(row["status"]) if row is not None else None
+
+    def get_admission_position(self, project_id: str) -> Optional[int]:
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT priority, created_at FROM admissions WHERE project_id = ? AND status = ?",
+                (project_id, AdmissionStatus.WAITING.value)
+            ).fetchone()
+            if row is None:
+                return None
+            # Same order as admit(), see get_queue_positions
+            key = row["priority"] * self.priority_aging - row["created_at"]
+            ahead = connection.execute(
+                "SELECT COUNT(*) FROM admissions WHERE status = ? AND project_id != ? AND "
+                "(priority * ? - created_at > ? OR (priority * ? - created_at = ? AND created_at < ?))",
+                (AdmissionStatus.WAITING.value, project_id, self.priority_aging, key, self.priority_aging, key, row["created_at"])
+            ).fetchone()[0]
+        return ahead + 1
+
+    def purge(self, older_than: float) -> int:
+        """
+        Delete finished jobs last updated, joins last arrived at, stage runs started and admissions
+        released more than older_than seconds ago.
+        """
+        cutoff = time.time() - older_than
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value, cutoff)
+            )
+            connection.execute(
+                "DELETE FROM joins WHERE join_key IN (SELECT join_key FROM joins GROUP BY join_key HAVING MAX(arrived_at) < ?)",
+                (cutoff,)
+            )
+            connection.execute("DELETE FROM stage_runs WHERE started_at < ?", (cutoff,))
+            connection.execute("DELETE FROM admissions WHERE status = ? AND updated_at < ?", (AdmissionStatus.RELEASED.value, cutoff))
+            return cursor.rowcount
+
+job_queue = SqliteJobQueue(Settings.JOB_QUEUE_PATH, get_queue_concurrency(), Settings.JOB_VISIBILITY_TIMEOUT_SECONDS)
@@ -0,0 +1,87 @@
+import math
+import time
+from typing import Any, Dict
+from uuid import UUID
+from src.models.base_models import DurationOption, Project
+from src.payments.payments_utils import get_pack_type_from_product_id
+from src.supabase_tools.handle_dodo_webhook_tb_updates import get_paid_product_ids
+from src.supabase_tools.handle_profiles_tb_updates import get_user_from_db
+from src.utils.logger import logger
+from src.workflow.job_queue import Job, job_queue
+from src.workflow.stage_graph import RUN_JOB, STAGE_JOB
+from src.workflow.video_gen_workflow import video_generation_graph
+
+# Priority classes, added up: the largest credit pack the user bought, beta users, short videos
+PACK_PRIORITY = {"STANDARD": 30, "BASIC": 20}
+BETA_PRIORITY = 10
+SHORT_VIDEO_PRIORITY = 5
+# Estimate for stages that never ran yet
+DEFAULT_STAGE_SECONDS = 60.0
+
+async def get_project_priority(project: Project) -> int:
+    priority = 0
+    try:
+        user = await get_user_from_db(project.user_id)
+        if user.beta:
+            priority += BETA_PRIORITY
+        pack_types = [get_pack_type_from_product_id(product_id, "test" if test_mode else "live")
+                      for product_id, test_mode in await get_paid_product_ids(project.user_id)]
+        priority += max([PACK_PRIORITY.get(pack_type, 0) for pack_type in pack_types], default=0)
+    except Exception as e:
+        # Scheduled without the user's priority rather than not at all
+        logger.error(f"Could not get the priority class of user {project.user_id}: {e}")
+    if project.video_configuration and project.video_configuration.duration == DurationOption.SHORT.value:
+        priority += SHORT_VIDEO_PRIORITY
+    return priority
+
+def get_generation_progress(project_id: UUID) -> Dict[str, Any]:
+    """
+    Position of the project's next waiting job in its queue and the estimated seconds until the
+    final video is ready. The estimate follows the stage graph: every unfinished stage takes the
+    median of its recent durations once its inputs finished, plus the time the jobs ahead of it in
+    its queue take. While the project waits for admission, its position among the waiting
+    projects and no estimate.
+    """
+    admission_position = job_queue.get_admission_position(str(project_id))
+    if admission_position is not None:
+        return {"queue_position": admission_position, "eta_seconds": None}
+    run = job_queue.get_latest_job(str(project_id), RUN_JOB)
+    if run is None:
+        return {"queue_position": None, "eta_seconds": None}
+
+    now = time.time()
+    durations = job_queue.get_stage_durations()
+    stage_runs = job_queue.get_stage_runs(str(project_id), run.created_at)
+    waiting_jobs = job_queue.get_queue_positions(str(project_id))
+    queue_position = min([position for _, position in waiting_jobs], default=None)
+    stage_jobs = {job.payload.get("stage"): (job, position) for job, position in waiting_jobs if job.name == STAGE_JOB}
+
+    # No stage is scheduled before the run job is claimed
+    start_at = now
+    for job, position in waiting_jobs:
+        if job.id == run.id:
+            start_at += get_job_wait(job, position, durations, now)
+
+    finish_at: Dict[str, float] = {}
+    for stage in video_generation_graph.order:
+        ready_at = max([finish_at[name] for name in stage.inputs], default=start_at)
+        duration = durations.get(stage.name, DEFAULT_STAGE_SECONDS)
+        started_at, finished_at = stage_runs.get(stage.name, (None, None))
+        if finished_at is not None:
+            finish_at[stage.name] = finished_at
+        elif started_at is not None:
+            finish_at[stage.name] = max(now, started_at + duration)
+        else:
+            wait = get_job_wait(*stage_jobs[stage.name], durations, now) if stage.name in stage_jobs else 0.0
+            finish_at[stage.name] = max(ready_at, now + wait) + duration
+    return {"queue_position": queue_position, "eta_seconds": round(max(0.0, max(finish_at.values()) - now))}
+
+def get_job_wait(job: Job, position: int, durations: Dict[str, float], now: float) -> float:
+    # A failed job waits out its retry delay even when its queue is free
+    return max(get_queue_wait(job.queue, position, durations), job.available_at - now)
+
+def get_queue_wait(queue: str, position: int, durations: Dict[str, float]) -> float:
+    # The jobs ahead are spread over the queue's workers and take about as long as the stages of that queue
+    stage_seconds = [durations.get(stage.name, DEFAULT_STAGE_SECONDS) for stage in video_generation_graph.order if stage.queue == queue]
+    average_seconds = sum(stage_seconds) / len(stage_seconds) if stage_seconds else DEFAULT_STAGE_SECONDS
+    return math.ceil((position - 1) / job_queue.queue_concurrency.get(queue, 1)) * average_seconds
@@ -0,0 +1,329 @@
+import asyncio
+import functools
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from src.config.settings import Settings
+from src.config.constants import Constants
+from src.models.base_models import AspectRatio, CaptionRenderMode, Project, RenderEngine, VideoLayoutType
+from src.services.captions_generation.add_captions_to_video import process_video_for_captions, process_video_for_captions_streaming
+from src.services.captions_generation.ass_captions import process_video_for_captions_ass
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.captions import BoxedHighlightCaption
+from src.services.captions_generation.parallel_captions import process_video_for_captions_parallel
+from src.services.video_editing.aiditor.generate_video import create_and_render_video
+from src.services.video_editing.asset_timeline import AssetTimeline, prepare_asset_timeline
+from src.services.video_editing.combine_videos import combine_frames_bubble, combine_frames_vertically, combine_videos_bubble, combine_videos_vertically
+from src.services.video_editing.optimised_edit_asset_video import edit_asset_video, get_asset_frame_size
+from src.services.video_editing.single_pass_render import render_top_bottom_single_pass
+from src.utils.file_handling import get_local_path
+from src.utils.logger import logger
+from src.utils.util_functions import download_video
+from src.workflow.job_queue import RENDER_QUEUE, JobQueue, job_queue
+from src.workflow.wrokflow_utils import get_render_options
+
+async def generate_asset_video_async(project: Project) -> str:
+    aspect_ratio = AspectRatio.NINE_SIXTEEN.value
+    if get_render_options(project).stream_assets:
+        # Only the asset timeline is prepared, the combine stage streams its frames
+        logger.info(f"Preparing asset timeline for project {project.id}")
+        asset_timeline_path = get_local_path(project.id, "working", "asset_timeline.json")
+        return await asyncio.to_thread(
+            prepare_asset_timeline,
+            project.assets,
+            project.final_video_duration,
+            get_asset_frame_size(aspect_ratio),
+            asset_timeline_path
+        )
+
+    logger.info(f"Generating asset video for project {project.id}")
+    asset_edited_video_path = get_local_path(project.id, "working", f"asset_edited_video_{AspectRatio.NINE_SIXTEEN}.mp4")
+    return await edit_asset_video(
+        project.assets,
+        project.final_video_duration,
+        aspect_ratio,
+        asset_edited_video_path,
+        workers=get_render_options(project).asset_workers
+    )
+
+async def combine_videos(project: Project, lipsync_video_local_path: str, asset_video_path: str,
+                         actor_size: Optional[Tuple[int, int]] = None) -> str:
+    logger.info(f"Combining videos for project {project.id}")
+    final_video_local_path = get_local_path(project.id, "working", "final_video.mp4")
+    
+    # Verify paths are not empty and exist or raise exception
+    if not lipsync_video_local_path or not os.path.exists(lipsync_video_local_path):
+        logger.error(f"Lipsync video path is invalid or does not exist: {lipsync_video_local_path}")
+        raise FileNotFoundError(f"Lipsync video path is invalid or does not exist: {lipsync_video_local_path}")
+    
+    if not asset_video_path or not os.path.exists(asset_video_path):
+        logger.error(f"Asset video path is invalid or does not exist: {asset_video_path}")
+        raise FileNotFoundError(f"Asset video path is invalid or does not exist: {asset_video_path}")
+
+    layout = project.video_layout_base.name
+    stream_assets = get_render_options(project).stream_assets
+    # actor_size: the lipsync video keeps the geometry of the actor video, probed by the actor stage
+    if layout == VideoLayoutType.TOP_BOTTOM.value and stream_assets:
+        # asset_video_path is the asset timeline manifest, its frames go straight into the compositor
+        asset_timeline = AssetTimeline.load(asset_video_path)
+        await asyncio.to_thread(
+            combine_frames_vertically,
+            asset_timeline.frames(),
+            asset_timeline.frame_size,
+            lipsync_video_local_path,
+            final_video_local_path,
+            bottom_size=actor_size
+        )
+    elif layout == VideoLayoutType.TOP_BOTTOM.value:
+        await asyncio.to_thread(
+            combine_videos_vertically,
+            asset_video_path,
+            lipsync_video_local_path,
+            final_video_local_path
+        )
+    elif layout == VideoLayoutType.AVATAR_BUBBLE.value and stream_assets:
+        asset_timeline = AssetTimeline.load(asset_video_path)
+        await asyncio.to_thread(
+            combine_frames_bubble,
+            asset_timeline.frames(),
+            asset_timeline.frame_size,
+            lipsync_video_local_path,
+            final_video_local_path,
+            avatar_size=actor_size
+        )
+    elif layout == VideoLayoutType.AVATAR_BUBBLE.value:
+        await asyncio.to_thread(
+            combine_videos_bubble,
+            asset_video_path,
+            lipsync_video_local_path,
+            final_video_local_path,
+            avatar_size=actor_size
+        )
+    else:
+        logger.error("Unsupported layout type")
+        raise Exception("Unsupported layout type")
+    return final_video_local_path
+
+
+async def render_final_video_single_pass(project: Project, lipsync_video_local_path: str,
+                                         caption_timeline: CaptionTimeline) -> str:
+    logger.info(f"Rendering final video in a single pass for project {project.id}")
+    if project.video_layout_base.name != VideoLayoutType.TOP_BOTTOM.value:
+        logger.error("Unsupported layout type")
+        raise Exception("Unsupported layout type")
+
+    if not lipsync_video_local_path or not os.path.exists(lipsync_video_local_path):
+        logger.error(f"Lipsync video path is invalid or does not exist: {lipsync_video_local_path}")
+        raise FileNotFoundError(f"Lipsync video path is invalid or does not exist: {lipsync_video_local_path}")
+
+    final_video_with_captions_local_path = get_local_path(project.id, "working", "final_video_with_captions.mp4")
+    return await asyncio.to_thread(
+        render_top_bottom_single_pass,
+        project.assets,
+        project.final_video_duration,
+        AspectRatio.NINE_SIXTEEN.value,
+        lipsync_video_local_path,
+        final_video_with_captions_local_path,
+        get_caption_type(),
+        caption_timeline,
+        get_render_options(project).caption_mode == CaptionRenderMode.ASS
+    )
+
+def get_caption_type() -> BoxedHighlightCaption:
+    return BoxedHighlightCaption(
+        font_path=Constants.ROBOTO_FONT_PATH,
+        font_size=72,
+        default_color=(255, 255, 255),
+        highlight_color=(255, 0, 0),
+        outline_color=(0, 0, 0),
+        outline_thickness=3,
+        background_color=(0, 0, 0, 0),
+        background_padding=5
+    )
+
+async def add_captions_to_video(project: Project, final_video_local_path: str,
+                                caption_timeline: CaptionTimeline) -> str:
+    logger.info(f"Adding captions to final video for project {project.id}")
+
+    # Verify input video exists
+    if not os.path.exists(final_video_local_path):
+        raise FileNotFoundError(f"Input video not found at: {final_video_local_path}. Cannot proceed with adding captions.")
+    
+    caption_type = get_caption_type()
+    
+    # Ensure output directory exists
+    final_video_with_captions_local_path = get_local_path(project.id, "working", "final_video_with_captions.mp4")
+    os.makedirs(os.path.dirname(final_video_with_captions_local_path), exist_ok=True)
+
+    render_options = get_render_options(project)
+    if render_options.caption_mode == CaptionRenderMode.PARALLEL:
+        caption_renderer = functools.partial(
+            process_video_for_captions_parallel,
+            workers=render_options.caption_workers or Settings.CAPTION_WORKERS
+        )
+    elif render_options.caption_mode == CaptionRenderMode.ASS:
+        caption_renderer = process_video_for_captions_ass
+    elif render_options.caption_mode == CaptionRenderMode.STREAMING:
+        caption_renderer = process_video_for_captions_streaming
+    else:
+        caption_renderer = process_video_for_captions
+
+    await asyncio.to_thread(
+        caption_renderer,
+        final_video_local_path,
+        final_video_with_captions_local_path,
+        caption_type,
+        caption_timeline
+    )
+    return final_video_with_captions_local_path
+
+class RenderBackend(ABC):
+    """
+    One way of turning a project plus its lipsync video and captions into the final video. Every
+    backend tracks its own health: after RENDER_BACKEND_MAX_FAILURES consecutive failures it is
+    skipped for RENDER_BACKEND_COOLDOWN_SECONDS, unless no other backend is left.
+    """
+    engine: RenderEngine
+    # Relative CPU cost of a render on this machine, the cheapest backend goes first when it is busy
+    local_cost: int = 1
+
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def supports(self, project: Project) -> bool:
+        return project.video_layout_base is not None and project.video_layout_base.name == VideoLayoutType.TOP_BOTTOM.value
+
+    def is_healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= Settings.RENDER_BACKEND_MAX_FAILURES:
+            self.unhealthy_until = time.monotonic() + Settings.RENDER_BACKEND_COOLDOWN_SECONDS
+            logger.warning(f"Render backend {self.engine.value} failed {self.consecutive_failures} times in a row, "
+                           f"skipping it for {Settings.RENDER_BACKEND_COOLDOWN_SECONDS}s")
+
+    @abstractmethod
+    async def render(self, project: Project, lipsync_video_local_path: str, caption_timeline: CaptionTimeline,
+                     actor_size: Optional[Tuple[int, int]] = None) -> str:
+        """
+        Render the final video with captions and return its local path.
+        """
+
+class MoviepyRenderBackend(RenderBackend):
+    """
+    Asset video, layout combine (TOP_BOTTOM or AVATAR_BUBBLE), then captions as a separate pass.
+    """
+    engine = RenderEngine.MOVIEPY
+    local_cost = 2
+
+    def supports(self, project: Project) -> bool:
+        return project.video_layout_base is not None and project.video_layout_base.name in (
+            VideoLayoutType.TOP_BOTTOM.value, VideoLayoutType.AVATAR_BUBBLE.value)
+
+    async def render(self, project: Project, lipsync_video_local_path: str, caption_timeline: CaptionTimeline,
+                     actor_size: Optional[Tuple[int, int]] = None) -> str:
+        if not project.assets_video_local_path or not os.path.exists(project.assets_video_local_path):
+            # The asset stage only runs ahead of time when moviepy was the chosen engine
+            project.assets_video_local_path = await generate_asset_video_async(project)
+        final_video_local_path = await combine_videos(project, lipsync_video_local_path, project.assets_video_local_path, actor_size)
+        return await add_captions_to_video(project, final_video_local_path, caption_timeline)
+
+class FfmpegRenderBackend(RenderBackend):
+    """
+    Assets, layout and captions in a single ffmpeg encode.
+    """
+    engine = RenderEngine.FFMPEG
+
+    async def render(self, project: Project, lipsync_video_local_path: str, caption_timeline: CaptionTimeline,
+                     actor_size: Optional[Tuple[int, int]] = None) -> str:
+        return await render_final_video_single_pass(project, lipsync_video_local_path, caption_timeline)
+
+class RemoteRenderBackend(RenderBackend):
+    """
+    VideoAIditor JSON render of the lipsync video and asset URLs; only the output is downloaded.
+    Its composition (full screen actor intro and outro, asset pairs) and caption style match none
+    of the local layouts, so it only renders projects that chose the remote engine.
+    """
+    engine = RenderEngine.REMOTE
+    local_cost = 0
+
+    def supports(self, project: Project) -> bool:
+        # The render service fetches every source itself, so all of them need a URL
+        return (get_render_options(project).engine == RenderEngine.REMOTE and bool(Settings.VIDEOAIDITOR_API_KEY)
+                and bool(project.lipsync_video_url) and bool(project.assets) and all(asset.url for asset in project.assets))
+
+    async def render(self, project: Project, lipsync_video_local_path: str, caption_timeline: CaptionTimeline,
+                     actor_size: Optional[Tuple[int, int]] = None) -> str:
+        logger.info(f"Rendering final video remotely for project {project.id}")
+        output_url = await create_and_render_video(
+            project.lipsync_video_url,
+            int(project.final_video_duration * 1000),
+            [asset.url for asset in project.assets],
+            caption_timeline.to_caption_words()
+        )
+        if not output_url:
+            raise RuntimeError(f"Remote render failed for project {project.id}")
+        final_video_with_captions_local_path = get_local_path(project.id, "working", "final_video_with_captions.mp4")
+        return await download_video(output_url, final_video_with_captions_local_path)
+
+class RenderRouter:
+    """
+    Picks the render backend per project and falls back to the next one when a render fails.
+    The project's engine goes first, then the other local engine, as both render the same layout
+    and captions. When this box is busy, i.e. LOCAL_RENDER_BUSY_JOBS render jobs run in the job
+    store across all workers or the 1 minute load average per CPU is above LOCAL_RENDER_MAX_LOAD,
+    the cheapest backend goes first. Backends in their failure cooldown go last.
+    """
+    def __init__(self, backends: List[RenderBackend], store: JobQueue = job_queue):
+        self.backends: Dict[RenderEngine, RenderBackend] = {backend.engine: backend for backend in backends}
+        self.store = store
+
+    def is_local_overloaded(self, running_renders: int) -> bool:
+        if running_renders >= Settings.LOCAL_RENDER_BUSY_JOBS:
+            return True
+        load_per_cpu = os.getloadavg()[0] / (os.cpu_count() or 1) if hasattr(os, "getloadavg") else 0.0
+        return load_per_cpu > Settings.LOCAL_RENDER_MAX_LOAD
+
+    def plan(self, project: Project, running_renders: int = 0) -> List[RenderBackend]:
+        preferred = get_render_options(project).engine
+        order = [preferred] + [engine for engine in (RenderEngine.MOVIEPY, RenderEngine.FFMPEG, RenderEngine.REMOTE) if engine != preferred]
+        backends = [self.backends[engine] for engine in order if engine in self.backends and self.backends[engine].supports(project)]
+        if self.is_local_overloaded(running_renders):
+            backends.sort(key=lambda backend: backend.local_cost)
+        # sort is stable, so the order above holds within the healthy and the unhealthy group
+        backends.sort(key=lambda backend: not backend.is_healthy())
+        return backends
+
+    async def render(self, project: Project, lipsync_video_local_path: str, caption_timeline: CaptionTimeline,
+                     actor_size: Optional[Tuple[int, int]] = None) -> Tuple[str, RenderEngine]:
+        """
+        Local path of the final video and the engine that rendered it.
+        """
+        # The render stage runs as a render job itself, so it is part of the count
+        running_renders = await asyncio.to_thread(self.store.count_running, RENDER_QUEUE)
+        backends = self.plan(project, running_renders)
+        if not backends:
+            raise Exception("No render backend supports this project")
+        logger.info(f"Render plan for project {project.id}: {[backend.engine.value for backend in backends]} "
+                    f"({running_renders} render jobs running)")
+
+        errors = []
+        for backend in backends:
+            try:
+                final_video_local_path = await backend.render(project, lipsync_video_local_path, caption_timeline, actor_size)
+                backend.record_success()
+                return final_video_local_path, backend.engine
+            except Exception as e:
+                backend.record_failure()
+                errors.append(f"{backend.engine.value}: {e}")
+                logger.error(f"Render backend {backend.engine.value} failed for project {project.id}: {e}")
+        raise Exception(f"All render backends failed: {'; '.join(errors)}")
+
+render_router = RenderRouter([MoviepyRenderBackend(), FfmpegRenderBackend(), RemoteRenderBackend()])
@@ -0,0 +1,196 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from src.config.settings import Settings
+from src.models.base_models import Project
+from src.services.webhook_processing.replicate_processing import process_replicate_webhook
+from src.utils.logger import logger
+from src.workflow.admission_control import admission_control
+from src.workflow.job_queue import IO_QUEUE, RENDER_QUEUE, Job, JobStatus, job_queue
+from src.workflow.stage_artifacts import stage_artifacts
+from src.workflow.stage_graph import RUN_JOB, STAGE_JOB
+from src.workflow.video_gen_workflow import PREVIEW_JOB, generate_preview_video, video_generation_graph
+
+# Seconds between claims when the queues are empty
+POLL_INTERVAL = 1.0
+# Finished jobs are kept this long for inspection
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+# Seconds a stopping worker gets to finish its running job before it is killed
+SHUTDOWN_TIMEOUT = 30.0
+# Seconds between admission checks of idle workers, for projects waiting on freed memory or disk
+ADMISSION_INTERVAL = 10.0
+
+async def run_video_generation(payload: Dict[str, Any]) -> None:
+    """
+    Schedule the first stages of the run. The project travels in the payload of every stage job
+    since the workers do not share projects_in_memory with the API.
+    """
+    await video_generation_graph.start(Project.model_validate(payload["project"]))
+
+async def run_stage(payload: Dict[str, Any]) -> None:
+    await video_generation_graph.run_stage(Project.model_validate(payload["project"]), payload["stage"])
+
+async def run_replicate_webhook(payload: Dict[str, Any]) -> None:
+    await process_replicate_webhook(payload["data"])
+
+def get_preview_key(project_id: str) -> str:
+    return f"preview/{project_id}"
+
+async def run_preview(payload: Dict[str, Any]) -> None:
+    project = Project.model_validate(payload["project"])
+    preview_video_url = await generate_preview_video(project)
+    # Read by the API with get_preview_result
+    await asyncio.to_thread(job_queue.arrive, get_preview_key(str(project.id)), "result",
+                            {"preview_video_url": preview_video_url}, ["result"])
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]] = {
+    RUN_JOB: run_video_generation,
+    STAGE_JOB: run_stage,
+    "replicate_webhook": run_replicate_webhook,
+    PREVIEW_JOB: run_preview,
+}
+
+def enqueue_replicate_webhook(data: Dict[str, Any]) -> str:
+    # Only records the lipsync video and schedules the render
+    return job_queue.enqueue(IO_QUEUE, "replicate_webhook", {"data": data})
+
+def enqueue_preview(project: Project) -> str:
+    job_queue.reset_join(get_preview_key(str(project.id)))
+    return job_queue.enqueue(RENDER_QUEUE, PREVIEW_JOB, {"project": project.model_dump(mode="json")},
+                             max_attempts=1, user_id=str(project.user_id), project_id=str(project.id))
+
+def get_preview_result(project_id: str) -> Optional[str]:
+    return job_queue.get_join(get_preview_key(project_id)).get("result", {}).get("preview_video_url")
+
+async def keep_claim(job: Job, worker_id: str) -> None:
+    while True:
+        await asyncio.sleep(job_queue.visibility_timeout / 3)
+        if not await asyncio.to_thread(job_queue.extend, job, worker_id):
+            logger.warning(f"Worker {worker_id} lost its claim on job {job.name} ({job.id})")
+            return
+
+async def release_failed_run(job: Job) -> None:
+    # The run is over, its admission goes to the next waiting project
+    try:
+        if job.name in (RUN_JOB, STAGE_JOB):
+            await admission_control.release(job.payload["project"]["id"])
+        elif job.name == "replicate_webhook":
+            await admission_control.release_prediction(job.payload["data"]["id"])
+    except Exception as e:
+        logger.error(f"Could not release the admission of failed job {job.name} ({job.id}): {e}")
+
+async def run_job(job: Job, worker_id: str) -> None:
+    logger.info(f"Worker {worker_id} running job {job.name} ({job.id}), attempt {job.attempts}/{job.max_attempts}")
+    started_at = time.perf_counter()
+    claim_keeper = asyncio.create_task(keep_claim(job, worker_id))
+    try:
+        handler = JOB_HANDLERS.get(job.name)
+        if handler is None:
+            raise ValueError(f"Unknown job: {job.name}")
+        await handler(job.payload)
+    except Exception as e:
+        # HTTPException (raised by handle_error) has an empty str()
+        await asyncio.to_thread(job_queue.fail, job, worker_id, getattr(e, "detail", None) or str(e) or repr(e))
+        failed = await asyncio.to_thread(job_queue.get, job.id)
+        if failed is not None and failed.status == JobStatus.FAILED:
+            await release_failed_run(failed)
+        return
+    finally:
+        claim_keeper.cancel()
+    await asyncio.to_thread(job_queue.complete, job, worker_id)
+    logger.info(f"Worker {worker_id} finished job {job.name} ({job.id}) in {time.perf_counter() - started_at:.1f}s")
+
+async def run_worker(worker_id: str, queues: List[str], stop: Optional[asyncio.Event] = None) -> None:
+    """
+    Claim and run one job at a time until stop is set. The queue's concurrency limits decide how
+    many workers run render jobs at once; the others keep serving the IO queue.
+    """
+    stop = stop or asyncio.Event()
+    logger.info(f"Worker {worker_id} serving queues {queues}")
+    claims = 0
+    admitted_at = 0.0
+    while not stop.is_set():
+        job = await asyncio.to_thread(job_queue.claim, queues, worker_id)
+        if job is None:
+            if time.monotonic() - admitted_at > ADMISSION_INTERVAL:
+                admitted_at = time.monotonic()
+                try:
+                    await admission_control.admit_waiting()
+                except Exception as e:
+                    logger.error(f"Worker {worker_id} could not admit waiting projects: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run_job(job, worker_id)
+        claims += 1
+        if claims % 100 == 0:
+            await asyncio.to_thread(job_queue.purge, JOB_RETENTION_SECONDS)
+            await asyncio.to_thread(stage_artifacts.evict, time.time() - Settings.ADMISSION_TIMEOUT_SECONDS)
+
+def worker_main(index: int, queues: List[str]) -> None:
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+    async def main():
+        stop = asyncio.Event()
+        # Finish the running job on SIGTERM (and on the SIGINT of a Ctrl+C reaching the whole process
+        # group); an unfinished one is picked up again after its visibility timeout
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGINT, stop.set)
+        await run_worker(worker_id, queues, stop)
+
+    asyncio.run(main())
+
+def start_render_workers(processes: int = Settings.JOB_WORKER_PROCESSES,
+                         queues: Optional[List[str]] = None) -> List[multiprocessing.Process]:
+    """
+    Start the worker processes. Spawned rather than forked, so they share no event loop or
+    connections with the API process. Not daemonic, as the asset video and caption renders start
+    process pools of their own; stop_render_workers ends them.
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for index in range(processes):
+        worker = context.Process(target=worker_main, args=(index, queues or [RENDER_QUEUE, IO_QUEUE]),
+                                 name=f"render-worker-{index}")
+        worker.start()
+        workers.append(worker)
+    logger.info(f"Started {processes} render worker processes")
+    return workers
+
+def stop_render_workers(workers: List[multiprocessing.Process], timeout: float = SHUTDOWN_TIMEOUT) -> None:
+    """
+    Ask the workers to finish their running job, then kill the ones still running after timeout seconds.
+    """
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+    deadline = time.monotonic() + timeout
+    for worker in workers:
+        worker.join(max(0.0, deadline - time.monotonic()))
+        if worker.is_alive():
+            logger.warning(f"Render worker {worker.name} did not stop within {timeout:.0f}s, killing it")
+            worker.kill()
+            worker.join()
+    logger.info(f"Stopped {len(workers)} render worker processes")
+
+if __name__ == "__main__":
+    # python -m src.workflow.render_worker
+    # Standalone workers for an API started with START_RENDER_WORKERS=FALSE; dead workers are restarted
+    workers = start_render_workers()
+    try:
+        while True:
+            time.sleep(5)
+            for index, worker in enumerate(workers):
+                if not worker.is_alive():
+                    logger.warning(f"Render worker {worker.name} exited with code {worker.exitcode}, restarting it")
+                    workers[index] = start_render_workers(1)[0]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_render_workers(workers)
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from pydantic import BaseModel
+from src.config.settings import Settings
+from src.models.base_models import Project, RenderOptions
+from src.services.video_editing.asset_cache import normalized_asset_cache
+from src.utils.logger import logger
+
+# Stages of video_gen_workflow whose outputs can be reused by a re-render
+T2S_STAGE = "t2s"
+LIPSYNC_STAGE = "lipsync"
+ASSETS_STAGE = "assets"
+CAPTIONS_STAGE = "captions"
+LAYOUT_STAGE = "layout"
+ACTOR_STAGE = "actor"
+RENDER_STAGE = "render"
+UPLOAD_STAGE = "upload"
+
+class StageRecord(BaseModel):
+    """
+    Fingerprint of a stage's inputs in the latest run, and its outputs once the stage finished.
+    """
+    fingerprint: str
+    outputs: Optional[Dict[str, Any]] = None
+    # Output files kept in the project's artifact directory, deleted when the stage is rebuilt
+    files: List[str] = []
+
+def get_fingerprint(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def get_t2s_fingerprint(project: Project) -> str:
+    voice = project.voice_base.model_dump(mode="json") if project.voice_base else None
+    return get_fingerprint(T2S_STAGE, project.final_script, str(project.voice_id), voice)
+
+def get_lipsync_fingerprint(project: Project, t2s_fingerprint: str) -> str:
+    actor_video_url = project.actor_base.full_video_link if project.actor_base else None
+    return get_fingerprint(LIPSYNC_STAGE, t2s_fingerprint, str(project.actor_id), actor_video_url)
+
+def get_asset_identity(asset) -> str:
+    # Content hash, so re-uploading the same file does not invalidate the asset video
+    if asset.local_path and os.path.exists(asset.local_path):
+        return normalized_asset_cache.get_content_hash(asset.local_path)
+    return asset.url or ""
+
+def get_assets_fingerprint(project: Project, stream_assets: bool) -> str:
+    assets = [(asset.type.value, get_asset_identity(asset)) for asset in project.assets]
+    # The segment lengths follow the voice over duration
+    return get_fingerprint(ASSETS_STAGE, assets, project.final_video_duration, stream_assets)
+
+def get_captions_fingerprint(t2s_fingerprint: str) -> str:
+    return get_fingerprint(CAPTIONS_STAGE, t2s_fingerprint)
+
+def get_actor_fingerprint(project: Project) -> str:
+    actor_video_url = project.actor_base.full_video_link if project.actor_base else None
+    return get_fingerprint(ACTOR_STAGE, str(project.actor_id), actor_video_url)
+
+def get_render_fingerprint(project: Project, lipsync_fingerprint: Optional[str], assets_fingerprint: Optional[str],
+                           caption_style: tuple, render_options: RenderOptions) -> str:
+    layout = project.video_layout_base.name if project.video_layout_base else None
+    # The worker counts change how fast the video renders, not the video
+    options = render_options.model_dump(mode="json", include={"engine", "caption_mode", "stream_assets"})
+    return get_fingerprint(RENDER_STAGE, lipsync_fingerprint, assets_fingerprint, str(project.video_layout_id), layout, caption_style, options)
+
+class StageArtifactStore:
+    """
+    Per project record of every workflow stage's input fingerprint and outputs, so a re-render
+    skips the stages whose inputs did not change. Fingerprints chain (lipsync includes T2S, the
+    render includes lipsync and assets), so a changed input rebuilds its stage and everything
+    downstream. Records live in one JSON file per project and stage, so stages finishing at the same
+    time in different processes do not overwrite each other's records. Output files that must
+    outlive the working directory, such as the asset video, are moved into the project's artifact
+    directory. Projects untouched for max_age seconds are evicted, and the least recently used ones
+    while the store is larger than max_bytes.
+    """
+    def __init__(self, cache_dir: str, max_age: float = Settings.STAGE_CACHE_MAX_AGE_SECONDS,
+                 max_bytes: int = Settings.STAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def get_project_dir(self, project_id: UUID) -> str:
+        return os.path.join(self.cache_dir, str(project_id))
+
+    def get_records_dir(self, project_id: UUID) -> str:
+        return os.path.join(self.get_project_dir(project_id), "stages")
+
+    def load(self, project_id: UUID) -> Dict[str, StageRecord]:
+        records_dir = self.get_records_dir(project_id)
+        if not os.path.isdir(records_dir):
+            return {}
+        records = {}
+        for name in os.listdir(records_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(records_dir, name)) as f:
+                    records[name[:-len(".json")]] = StageRecord.model_validate(json.load(f))
+        return records
+
+    def load_record(self, project_id: UUID, stage: str) -> Optional[StageRecord]:
+        record_path = os.path.join(self.get_records_dir(project_id), f"{stage}.json")
+        if not os.path.exists(record_path):
+            return None
+        with open(record_path) as f:
+            return StageRecord.model_validate(json.load(f))
+
+    def save_record(self, project_id: UUID, stage: str, record: StageRecord) -> None:
+        records_dir = self.get_records_dir(project_id)
+        os.makedirs(records_dir, exist_ok=True)
+        temp_path = os.path.join(records_dir, f"{stage}.{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(record.model_dump(), f)
+        os.replace(temp_path, os.path.join(records_dir, f"{stage}.json"))
+
+    def get_fingerprint(self, project_id: UUID, stage: str) -> Optional[str]:
+        """
+        Input fingerprint of the stage in the latest run, finished or not.
+        """
+        record = self.load_record(project_id, stage)
+        return record.fingerprint if record else None
+
+    def lookup(self, project_id: UUID, stage: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Outputs of the stage if it already finished with the same inputs and its files still exist.
+        """
+        record = self.load_record(project_id, stage)
+        if record is None or record.fingerprint != fingerprint or record.outputs is None:
+            return None
+        if not all(os.path.exists(path) for path in record.files):
+            logger.warning(f"Artifacts of stage {stage} of project {project_id} are missing, rebuilding it")
+            return None
+        logger.info(f"Reusing the {stage} stage of project {project_id}")
+        return record.outputs
+
+    def record(self, project_id: UUID, stage: str, fingerprint: str, outputs: Optional[Dict[str, Any]] = None,
+               files: Optional[List[str]] = None) -> None:
+        """
+        Store the stage's fingerprint, and its outputs once it finished (None while it is running
+        elsewhere, e.g. the lipsync prediction). Files of the previous record are deleted.
+        """
+        with self._lock:
+            previous = self.load_record(project_id, stage)
+            files = files or []
+            if previous is not None:
+                for path in previous.files:
+                    if path not in files and os.path.exists(path):
+                        os.remove(path)
+            self.save_record(project_id, stage, StageRecord(fingerprint=fingerprint, outputs=outputs, files=files))
+
+    def keep_file(self, project_id: UUID, stage: str, path: str) -> str:
+        """
+        Move an output file out of the working directory into the project's artifact directory.
+        """
+        project_dir = self.get_project_dir(project_id)
+        os.makedirs(project_dir, exist_ok=True)
+        kept_path = os.path.join(project_dir, f"{stage}_{uuid.uuid4().hex[:8]}{os.path.splitext(path)[1]}")
+        shutil.move(path, kept_path)
+        return kept_path
+
+    def release_files(self, project_id: UUID, stage: str) -> None:
+        """
+        Delete the stage's files once they are no longer needed, e.g. the final render after its
+        upload. The stage runs again if a later run needs it.
+        """
+        with self._lock:
+            record = self.load_record(project_id, stage)
+            if record is None or not record.files:
+                return
+            for path in record.files:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.save_record(project_id, stage, StageRecord(fingerprint=record.fingerprint))
+
+    def invalidate(self, project_id: UUID) -> None:
+        with self._lock:
+            shutil.rmtree(self.get_project_dir(project_id), ignore_errors=True)
+        logger.info(f"Invalidated stage artifacts of project {project_id}")
+
+    def evict(self, keep_since: Optional[float] = None, free_bytes: int = 0) -> int:
+        """
+        Evict old projects, then the least recently used ones until the store fits max_bytes and
+        at least free_bytes were freed. Projects touched after keep_since (still running) are kept.
+        Returns the number evicted.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        now = time.time()
+        projects = []
+        for name in os.listdir(self.cache_dir):
+            project_dir = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(project_dir):
+                continue
+            touched_at, size = os.path.getmtime(project_dir), 0
+            for root, _, files in os.walk(project_dir):
+                for filename in files:
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except FileNotFoundError:
+                        continue
+                    touched_at, size = max(touched_at, stat.st_mtime), size + stat.st_size
+            projects.append((touched_at, size, name))
+
+        total_bytes = sum(size for _, size, _ in projects)
+        evicted, freed = 0, 0
+        for touched_at, size, name in sorted(projects):
+            if touched_at > now - self.max_age and total_bytes <= self.max_bytes and freed >= free_bytes:
+                break
+            if keep_since is not None and touched_at > keep_since:
+                continue
+            self.invalidate(name)
+            total_bytes -= size
+            freed += size
+            evicted += 1
+        return evicted
+
+stage_artifacts = StageArtifactStore(Settings.STAGE_CACHE_DIR)
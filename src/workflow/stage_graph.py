@@ -0,0 +1,204 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from fastapi import HTTPException
+from src.models.base_models import Project, ProjectStatus
+from src.supabase_tools.handle_project_tb_updates import update_project_in_db
+from src.utils.logger import logger
+from src.workflow.job_queue import IO_QUEUE, JobQueue, job_queue
+from src.workflow.stage_artifacts import StageArtifactStore, get_fingerprint, stage_artifacts
+from src.workflow.stage_join import StageJoin, stage_join
+from src.workflow.wrokflow_utils import handle_error, handle_success
+
+# Job starting a project's run, and the job running one stage of it
+RUN_JOB = "video_generation"
+STAGE_JOB = "stage"
+
+StageOutputs = Dict[str, Any]
+# Project fields of a run that are not stored in the DB, taken from the run's payload when a stage
+# is completed with a project loaded from the DB
+RUN_FIELDS = ["render_options"]
+
+class Stage:
+    """
+    One step of a StageGraph. run gets the project, with the outputs of the input stages applied,
+    and the input stages' outputs by name. It returns the stage's outputs, or None when the stage
+    finishes outside the run (the lipsync prediction, completed by the Replicate webhook).
+    fingerprint gets the project and the input stages' fingerprints and identifies the stage's
+    inputs; by default the stage depends only on its input stages. A stage with cache False runs
+    every time, e.g. one whose input is a file that is new on every run.
+    """
+    def __init__(self, name: str,
+                 run: Callable[[Project, Dict[str, StageOutputs]], Awaitable[Optional[StageOutputs]]],
+                 description: str,
+                 failed_status: ProjectStatus,
+                 inputs: Optional[List[str]] = None,
+                 queue: str = IO_QUEUE,
+                 fingerprint: Optional[Callable[[Project, Dict[str, str]], str]] = None,
+                 file_outputs: Optional[List[str]] = None,
+                 cache: bool = True):
+        self.name = name
+        self.run = run
+        self.description = description
+        self.failed_status = failed_status
+        self.inputs = inputs or []
+        self.queue = queue
+        self.fingerprint = fingerprint
+        # Output keys holding files, moved out of the working directory when the stage finishes
+        self.file_outputs = file_outputs or []
+        self.cache = cache
+
+    def get_fingerprint(self, project: Project, input_fingerprints: Dict[str, str]) -> str:
+        if self.fingerprint is not None:
+            return self.fingerprint(project, input_fingerprints)
+        return get_fingerprint(self.name, [input_fingerprints[name] for name in self.inputs])
+
+def apply_outputs(project: Project, outputs: StageOutputs) -> Project:
+    """
+    Project with the outputs that are Project fields set, e.g. t2s_audio_url.
+    """
+    fields = {key: value for key, value in outputs.items() if key in Project.model_fields}
+    if not fields:
+        return project
+    return Project.model_validate({**project.model_dump(), **fields})
+
+class StageGraph:
+    """
+    Runs a DAG of stages on the job queue. Every stage is a job on its own queue, started as soon
+    as all of its inputs finished, so independent stages run at the same time in different workers.
+    A finished stage is checkpointed: its outputs in the stage artifact store, with its files moved
+    to the project's artifact directory, and its Project fields in the DB. A stage whose inputs did
+    not change since its checkpoint does not run again, so a retried, restarted or re-rendered
+    project continues after its last completed stage. on_complete runs once the last stage finished.
+    Stage jobs inherit the priority the project's run was enqueued with, and the start and end of
+    every stage is recorded in the job store for estimating how long runs take.
+    """
+    def __init__(self, stages: List[Stage], on_complete: Callable[[Project], Awaitable[Any]],
+                 store: JobQueue = job_queue, artifacts: StageArtifactStore = stage_artifacts, join: StageJoin = stage_join):
+        self.stages = {stage.name: stage for stage in stages}
+        self.on_complete = on_complete
+        self.store = store
+        self.artifacts = artifacts
+        self.join = join
+        self.dependents: Dict[str, List[Stage]] = {stage.name: [] for stage in stages}
+        for stage in stages:
+            for name in stage.inputs:
+                if name not in self.stages:
+                    raise ValueError(f"Stage {stage.name} has an unknown input {name}")
+                self.dependents[name].append(stage)
+
+        self.order = self.get_topological_order()
+
+    def get_topological_order(self) -> List[Stage]:
+        input_counts = {name: len(stage.inputs) for name, stage in self.stages.items()}
+        ready = [name for name, count in input_counts.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(self.stages[name])
+            for dependent in self.dependents[name]:
+                input_counts[dependent.name] -= 1
+                if input_counts[dependent.name] == 0:
+                    ready.append(dependent.name)
+        if len(order) != len(self.stages):
+            raise ValueError("Stage graph has a cycle")
+        return order
+
+    async def start(self, project: Project) -> None:
+        for stage in self.stages.values():
+            if len(stage.inputs) > 1:
+                await self.join.reset(project.id, stage.name)
+        await self.schedule(project, [stage for stage in self.stages.values() if not stage.inputs])
+
+    async def schedule(self, project: Project, stages: List[Stage]) -> None:
+        if not stages:
+            return
+        priority = await asyncio.to_thread(self.store.get_project_priority, str(project.id))
+        for stage in stages:
+            await asyncio.to_thread(self.store.enqueue, stage.queue, STAGE_JOB,
+                                    {"project": project.model_dump(mode="json"), "stage": stage.name},
+                                    priority=priority, user_id=str(project.user_id), project_id=str(project.id))
+
+    async def run_stage(self, project: Project, name: str) -> None:
+        stage = self.stages[name]
+        records = self.artifacts.load(project.id)
+        missing = [input_name for input_name in stage.inputs if input_name not in records or records[input_name].outputs is None]
+        if missing:
+            raise ValueError(f"Stage {name} of project {project.id} started before its inputs {missing} finished")
+        inputs = {input_name: records[input_name].outputs for input_name in stage.inputs}
+        for outputs in inputs.values():
+            project = apply_outputs(project, outputs)
+
+        fingerprint = stage.get_fingerprint(project, {input_name: records[input_name].fingerprint for input_name in stage.inputs})
+        outputs = self.artifacts.lookup(project.id, name, fingerprint) if stage.cache else None
+        if outputs is not None:
+            await asyncio.to_thread(self.store.finish_stage_run, str(project.id), name, True)
+            project = apply_outputs(project, outputs)
+            await update_project_in_db(project)
+            return await self.finish_stage(project, stage, outputs)
+
+        logger.info(f"Running stage {name} of project {project.id}")
+        started_at = time.perf_counter()
+        await asyncio.to_thread(self.store.start_stage_run, str(project.id), name)
+        try:
+            outputs = await stage.run(project, inputs)
+        except HTTPException:
+            # Already reported by handle_error
+            raise
+        except Exception as e:
+            await handle_error(project, e, stage.failed_status, stage.description)
+
+        if outputs is None:
+            # Recorded without outputs, complete() finishes it
+            self.artifacts.record(project.id, name, fingerprint)
+            await update_project_in_db(project)
+            logger.info(f"Started stage {name} of project {project.id}, it finishes outside the run")
+            return
+        files = []
+        for key in stage.file_outputs:
+            if outputs.get(key):
+                outputs[key] = self.artifacts.keep_file(project.id, name, outputs[key])
+                files.append(outputs[key])
+        self.artifacts.record(project.id, name, fingerprint, outputs, files)
+        await asyncio.to_thread(self.store.finish_stage_run, str(project.id), name)
+        logger.info(f"Stage {name} of project {project.id} took {time.perf_counter() - started_at:.1f}s")
+
+        project = apply_outputs(project, outputs)
+        await handle_success(project, stage.description)
+        await self.finish_stage(project, stage, outputs)
+
+    async def complete(self, project: Project, name: str, outputs: StageOutputs) -> None:
+        """
+        Finish a stage whose run returned None, with the outputs it delivered.
+        """
+        project = await self.get_run_project(project)
+        fingerprint = self.artifacts.get_fingerprint(project.id, name)
+        if fingerprint is None:
+            raise ValueError(f"Stage {name} of project {project.id} was never started")
+        self.artifacts.record(project.id, name, fingerprint, outputs)
+        await asyncio.to_thread(self.store.finish_stage_run, str(project.id), name)
+        project = apply_outputs(project, outputs)
+        await handle_success(project, self.stages[name].description)
+        await self.finish_stage(project, self.stages[name], outputs)
+
+    async def get_run_project(self, project: Project) -> Project:
+        """
+        Project with the RUN_FIELDS of its latest run, e.g. the render options it was started with.
+        """
+        run = await asyncio.to_thread(self.store.get_latest_job, str(project.id), RUN_JOB)
+        if run is None:
+            return project
+        fields = {name: run.payload["project"].get(name) for name in RUN_FIELDS}
+        return Project.model_validate({**project.model_dump(), **fields})
+
+    async def finish_stage(self, project: Project, stage: Stage, outputs: StageOutputs) -> None:
+        dependents = self.dependents[stage.name]
+        if not dependents:
+            await self.on_complete(project)
+            return
+        ready = []
+        for dependent in dependents:
+            # Of several inputs, the one finishing last starts the stage
+            if len(dependent.inputs) == 1 or await self.join.arrive(project.id, dependent.name, stage.name, outputs, dependent.inputs) is not None:
+                ready.append(dependent)
+        await self.schedule(project, ready)
@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from src.utils.logger import logger
+from src.workflow.job_queue import JobQueue, job_queue
+
+class StageJoin:
+    """
+    Joins of the workflow stages that have several inputs, keyed by project id and stage. Every
+    input stage arrives with its outputs once it finished; the arrival completing the join gets the
+    outputs of all inputs and starts the stage, so nothing waits or polls for the other inputs.
+    Arrivals are stored in the job store since the inputs finish in different worker processes.
+    """
+    def __init__(self, store: JobQueue):
+        self.store = store
+
+    def get_key(self, project_id: UUID, stage: str) -> str:
+        return f"{project_id}/{stage}"
+
+    async def reset(self, project_id: UUID, stage: str) -> None:
+        """
+        Start a new run: arrivals of the previous one no longer count.
+        """
+        await asyncio.to_thread(self.store.reset_join, self.get_key(project_id, stage))
+
+    async def arrive(self, project_id: UUID, stage: str, branch: str, outputs: Dict[str, Any],
+                     branches: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Outputs of every input by stage name if this arrival completed the join, else None.
+        """
+        arrived = await asyncio.to_thread(self.store.arrive, self.get_key(project_id, stage), branch, outputs, branches)
+        if arrived is None:
+            logger.info(f"Stage {branch} of project {project_id} finished, {stage} waits for its other inputs")
+            return None
+        logger.info(f"Stage {branch} of project {project_id} finished last, all inputs of {stage} joined")
+        return arrived
+
+stage_join = StageJoin(job_queue)
+
+if __name__ == "__main__":
+    import tempfile
+    import uuid
+    from src.workflow.job_queue import SqliteJobQueue, get_queue_concurrency
+
+    async def main():
+        join = StageJoin(SqliteJobQueue(tempfile.mktemp(suffix=".sqlite3"), get_queue_concurrency(), 60))
+        project_id = uuid.uuid4()
+        inputs = ["lipsync", "assets"]
+        print(await join.arrive(project_id, "render", "assets", {"assets_video_local_path": "assets.mp4"}, inputs))
+        print(await join.arrive(project_id, "render", "lipsync", {"lipsync_video_url": "https://example.com/lipsync.mp4"}, inputs))
+
+    asyncio.run(main())
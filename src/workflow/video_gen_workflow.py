@@ -1,7 +1,9 @@
 import asyncio
 from datetime import datetime
 import os
-from uuid import UUID
+import time
+from typing import Optional
+from uuid import UUID, uuid4
 
 import cv2
 from src.utils.logger import logger
@@ -9,194 +11,192 @@ from fastapi import HTTPException
 from src.api.routes.video_layouts_routes import get_video_layout_base
 from src.config.settings import Settings
 from src.config.constants import Constants
-from src.models.base_models import AspectRatio, Project, ProjectStatus, VideoLayoutType
+from src.models.base_models import Actor, AspectRatio, Project, ProjectStatus, RenderEngine, VideoLayoutType
 from src.models.shared_state import projects_in_memory
 from src.notification.async_slack_bot import RA_SLACK_BOT
 from src.notification.gmail_service import send_video_ready_alert_by_email
-from src.services.captions_generation.add_captions_to_video import process_video_for_captions
-from src.services.captions_generation.captions import BoxedHighlightCaption
+from src.services.captions_generation.caption_timeline import CaptionTimeline
+from src.services.captions_generation.transcriptions import transcribe_video_assembly_words
 from src.services.lipsync_generation.muse_talk_lipsync import create_muste_talk_prediction
-from src.services.video_editing.combine_videos import combine_videos_vertically
-from src.services.video_editing.edit_asset_video import generate_asset_video
+from src.services.video_editing.actor_cache import actor_preprocessing_cache
+from src.services.video_editing.preview_render import render_preview
 from src.services.voice_over_generation.generate_t2s import generate_t2s_audio
 from src.supabase_tools.handle_bucket_updates import upload_file_to_projects
 from src.supabase_tools.handle_project_tb_updates import update_project_in_db
 from src.supabase_tools.handle_profiles_tb_updates import get_user_from_db
 from src.utils.file_handling import get_local_path
 from src.utils.util_functions import download_video
-from src.workflow.wrokflow_utils import delete_working_directory, download_lipsync_video, handle_error, send_video_ready_notification, upload_final_video, handle_success
+from src.workflow.admission_control import admission_control
+from src.workflow.render_backends import generate_asset_video_async, get_caption_type, render_router
+from src.workflow.job_queue import RENDER_QUEUE
+from src.workflow.stage_artifacts import (ACTOR_STAGE, ASSETS_STAGE, CAPTIONS_STAGE, LAYOUT_STAGE, LIPSYNC_STAGE, RENDER_STAGE, T2S_STAGE,
+                                          UPLOAD_STAGE, get_actor_fingerprint, get_assets_fingerprint, get_captions_fingerprint,
+                                          get_fingerprint, get_lipsync_fingerprint, get_render_fingerprint, get_t2s_fingerprint,
+                                          stage_artifacts)
+from src.workflow.stage_graph import Stage, StageGraph
+from src.workflow.wrokflow_utils import delete_working_directory, download_lipsync_video, get_render_options, handle_error, send_video_ready_notification, upload_final_video
 
-async def start_lipsync_gen_with_audio(project: Project):
-    try:
-        # Generate T2S audio
-        t2s_audio_url, audio_duration = await generate_t2s_audio(project.id, project.final_script, project.voice_base)
-        project.t2s_audio_url = t2s_audio_url
-        project.final_video_duration = audio_duration
-        project.status = ProjectStatus.VOICE_OVER_READY
-        await update_project_in_db(project)
-        await handle_success(project, "T2S audio generation")
-    except Exception as e:
-        await handle_error(project, e, ProjectStatus.VOICE_OVER_GENERATION_FAILED, "T2S audio generation")
-        return
+async def run_t2s_stage(project: Project, inputs: dict) -> dict:
+    t2s_audio_url, audio_duration = await generate_t2s_audio(project.id, project.final_script, project.voice_base)
+    project.status = ProjectStatus.VOICE_OVER_READY
+    return {"t2s_audio_url": t2s_audio_url, "final_video_duration": audio_duration}
 
-    try:
-        prediction_id = await create_muste_talk_prediction(
-            video_input_url=project.actor_base.full_video_link,
-            audio_input_url=project.t2s_audio_url
-        )
-        project.lipsync_prediction_id = prediction_id
-        project.status = ProjectStatus.ACTOR_GENERATION_STARTED
-        await update_project_in_db(project)
-        await handle_success(project, "starting lipsync generation")
-    except Exception as e:
-        await handle_error(project, e, ProjectStatus.ACTOR_GENERATION_COULD_NOT_START, "starting lipsync generation")
-        return
+async def run_lipsync_stage(project: Project, inputs: dict) -> None:
+    project.lipsync_video_url = None
+    project.lipsync_prediction_id = await create_muste_talk_prediction(
+        video_input_url=project.actor_base.full_video_link,
+        audio_input_url=project.t2s_audio_url
+    )
+    project.status = ProjectStatus.ACTOR_GENERATION_STARTED
+    # Finished by the Replicate webhook, see process_replicate_webhook
+    return None
 
-async def start_assets_video_generation(project: Project):
-    try:
-        # Update project status to indicate asset video generation has started
-        project.status = ProjectStatus.ASSETS_VIDEO_GENERATION_STARTED
-        await update_project_in_db(project)
+async def run_captions_stage(project: Project, inputs: dict) -> dict:
+    # The lipsync video carries the same voice over, so it is transcribed while the lipsync runs
+    caption_timeline = await get_caption_timeline(project.t2s_audio_url)
+    return {"lines": caption_timeline.to_lines()}
 
-        # Generate Asset Video
-        logger.info(f"Starting asset video generation for project {project.id}")
-        assets_video_local_path = await generate_asset_video_async(project)
-        project.assets_video_local_path = assets_video_local_path
-        await update_project_in_db(project)
-        await handle_success(project, "asset video generation")
-    except Exception as e:
-        await handle_error(project, e, ProjectStatus.ASSETS_VIDEO_GENERATION_FAILED, "asset video generation")
-        return
+async def run_layout_stage(project: Project, inputs: dict) -> dict:
+    video_layout_base = await get_video_layout_base(project.video_layout_id)
+    return {"video_layout_base": video_layout_base.model_dump(mode="json")}
 
-async def video_post_processing(project: Project):
-    try:
-        logger.info(f"Starting video post-processing for project {project.id}")
+def get_project_actor(project: Project) -> Actor:
+    return Actor(id=project.actor_id, **project.actor_base.model_dump())
 
-        # Download lipsync video
-        try:
-            lipsync_video_local_path = await download_lipsync_video(project)
-            project.status = ProjectStatus.ACTOR_GENERATION_COMPLETED
-            await update_project_in_db(project)
-            await handle_success(project, "downloading lipsync video")
-        except Exception as e:
-            await handle_error(project, e, ProjectStatus.ACTOR_GENERATION_FAILED, "downloading lipsync video")
-            return
+async def run_actor_stage(project: Project, inputs: dict) -> dict:
+    # Only saves the render from probing the lipsync video, so a failure does not stop the run
+    try:
+        actor_preprocessing = await asyncio.to_thread(actor_preprocessing_cache.get, get_project_actor(project))
+        return {"actor_size": [actor_preprocessing.width, actor_preprocessing.height]}
+    except Exception as e:
+        logger.warning(f"Could not preprocess the actor of project {project.id}: {e}")
+        return {"actor_size": None}
 
-        # Retrieve video layout base
-        try:
-            video_layout_base = await get_video_layout_base(project.video_layout_id)
-            project.video_layout_base = video_layout_base
-        except Exception as e:
-            await handle_error(project, e, ProjectStatus.LAYOUT_RETRIEVAL_FAILED, "retrieving video layout base")
-            return
+async def run_assets_stage(project: Project, inputs: dict) -> dict:
+    render_options = get_render_options(project)
+    if render_options.engine != RenderEngine.MOVIEPY:
+        logger.info(f"Skipping asset video generation for project {project.id}, the {render_options.engine.value} engine renders the assets during post-processing")
+        return {"assets_video_local_path": None}
 
-        # Combine videos
-        try:
-            final_video_local_path = await combine_videos(project, lipsync_video_local_path, project.assets_video_local_path)
-            await handle_success(project, "combining videos")
-        except Exception as e:
-            await handle_error(project, e, ProjectStatus.VIDEO_EDITING_FAILED, "combining videos")
-            return
+    project.status = ProjectStatus.ASSETS_VIDEO_GENERATION_STARTED
+    await update_project_in_db(project)
+    return {"assets_video_local_path": await generate_asset_video_async(project)}
 
-        # Add captions to final video
-        try:
-            final_video_with_captions_local_path = await add_captions_to_video(project, final_video_local_path)
-            await handle_success(project, "adding captions to video")
-        except Exception as e:
-            await handle_error(project, e, ProjectStatus.CAPTIONS_ADDITION_FAILED, "adding captions to video")
-            return
+async def run_render_stage(project: Project, inputs: dict) -> dict:
+    try:
+        lipsync_video_local_path = await download_lipsync_video(project)
+        project.status = ProjectStatus.ACTOR_GENERATION_COMPLETED
+        await update_project_in_db(project)
+    except Exception as e:
+        await handle_error(project, e, ProjectStatus.ACTOR_GENERATION_FAILED, "downloading lipsync video")
 
-        # Upload final video
-        try:
-            logger.info(f"final_video_with_captions_local_path: {final_video_with_captions_local_path}")
-            final_video_url = await upload_final_video(project, final_video_with_captions_local_path)
-            project.final_video_url = final_video_url
-            project.status = ProjectStatus.COMPLETED
-            project.updated_at = datetime.now()
-            await update_project_in_db(project)
-            await handle_success(project, "uploading final video")
-        except Exception as e:
-            await handle_error(project, e, ProjectStatus.UPLOAD_FAILED, "uploading final video")
-            return
+    # Probed by the actor stage, so the compositor does not probe the lipsync video
+    actor_size = tuple(inputs[ACTOR_STAGE]["actor_size"]) if inputs[ACTOR_STAGE]["actor_size"] else None
 
-        await send_video_ready_notification(project.id, project.user_id, final_video_url)
+    # The router picks the engine for the current load and falls back to the others on failure
+    caption_timeline = CaptionTimeline(inputs[CAPTIONS_STAGE]["lines"])
+    final_video_local_path, render_engine = await render_router.render(project, lipsync_video_local_path, caption_timeline, actor_size)
+    logger.info(f"Rendered the final video of project {project.id} with the {render_engine.value} engine")
+    return {"final_video_local_path": final_video_local_path}
 
-        # Delete the working directory
-        delete_working_directory(project.id)
+async def run_upload_stage(project: Project, inputs: dict) -> dict:
+    return {"final_video_url": await upload_final_video(project, inputs[RENDER_STAGE]["final_video_local_path"])}
 
-        return project
+async def finish_video_generation(project: Project):
+    project.status = ProjectStatus.COMPLETED
+    project.updated_at = datetime.now()
+    await update_project_in_db(project)
+    await send_video_ready_notification(project.id, project.user_id, project.final_video_url)
+    delete_working_directory(project.id)
+    # Uploaded, so only the asset video and the other inputs of a re-render stay on disk
+    stage_artifacts.release_files(project.id, RENDER_STAGE)
+    await admission_control.release(project.id)
 
-    except Exception as e:
-        await handle_error(project, e, ProjectStatus.POST_PROCESSING_FAILED, "video post-processing")
+# T2S -> lipsync (finished by its webhook) runs next to the asset video, the captions, the layout and
+# the actor preprocessing; the render starts once the last of them finished
+video_generation_graph = StageGraph([
+    Stage(T2S_STAGE, run_t2s_stage, "T2S audio generation", ProjectStatus.VOICE_OVER_GENERATION_FAILED,
+          fingerprint=lambda project, inputs: get_t2s_fingerprint(project)),
+    Stage(LIPSYNC_STAGE, run_lipsync_stage, "lipsync generation", ProjectStatus.ACTOR_GENERATION_COULD_NOT_START,
+          inputs=[T2S_STAGE], fingerprint=lambda project, inputs: get_lipsync_fingerprint(project, inputs[T2S_STAGE])),
+    Stage(CAPTIONS_STAGE, run_captions_stage, "transcribing voice over for captions", ProjectStatus.CAPTIONS_ADDITION_FAILED,
+          inputs=[T2S_STAGE], fingerprint=lambda project, inputs: get_captions_fingerprint(inputs[T2S_STAGE])),
+    Stage(ASSETS_STAGE, run_assets_stage, "asset video generation", ProjectStatus.ASSETS_VIDEO_GENERATION_FAILED,
+          inputs=[T2S_STAGE], queue=RENDER_QUEUE, file_outputs=["assets_video_local_path"],
+          fingerprint=lambda project, inputs: get_assets_fingerprint(project, get_render_options(project).stream_assets)),
+    Stage(LAYOUT_STAGE, run_layout_stage, "retrieving video layout base", ProjectStatus.LAYOUT_RETRIEVAL_FAILED,
+          fingerprint=lambda project, inputs: get_fingerprint(LAYOUT_STAGE, str(project.video_layout_id))),
+    Stage(ACTOR_STAGE, run_actor_stage, "preprocessing actor video", ProjectStatus.POST_PROCESSING_FAILED, queue=RENDER_QUEUE,
+          fingerprint=lambda project, inputs: get_actor_fingerprint(project)),
+    Stage(RENDER_STAGE, run_render_stage, "rendering final video", ProjectStatus.VIDEO_EDITING_FAILED,
+          inputs=[LIPSYNC_STAGE, CAPTIONS_STAGE, ASSETS_STAGE, LAYOUT_STAGE, ACTOR_STAGE], queue=RENDER_QUEUE,
+          file_outputs=["final_video_local_path"],
+          fingerprint=lambda project, inputs: get_render_fingerprint(project, inputs[LIPSYNC_STAGE], inputs[ASSETS_STAGE],
+                                                                     get_caption_type().get_style_key(), get_render_options(project))),
+    # Every render is a new file, so it is always uploaded
+    Stage(UPLOAD_STAGE, run_upload_stage, "uploading final video", ProjectStatus.UPLOAD_FAILED, inputs=[RENDER_STAGE], cache=False),
+], on_complete=finish_video_generation)
 
+# Job rendering a preview, on the render queue
+PREVIEW_JOB = "preview"
 
-async def generate_asset_video_async(project: Project) -> str:
-    logger.info(f"Generating asset video for project {project.id}")
-    aspect_ratio = AspectRatio.NINE_SIXTEEN.value
-    asset_edited_video_path = get_local_path(project.id, "working", f"asset_edited_video_{AspectRatio.NINE_SIXTEEN}.mp4")
-    return await asyncio.to_thread(
-        generate_asset_video,
-        project.assets,
-        project.final_video_duration,
-        aspect_ratio,
-        asset_edited_video_path
-    )
+def get_stored_caption_timeline(project: Project) -> Optional[CaptionTimeline]:
+    """
+    Captions of the project's captions stage, if it ran for the current voice over.
+    """
+    record = stage_artifacts.load_record(project.id, CAPTIONS_STAGE)
+    if record is None or record.outputs is None or record.fingerprint != get_captions_fingerprint(get_t2s_fingerprint(project)):
+        return None
+    return CaptionTimeline(record.outputs["lines"])
 
-async def combine_videos(project: Project, lipsync_video_local_path: str, asset_video_path: str) -> str:
-    logger.info(f"Combining videos for project {project.id}")
-    final_video_local_path = get_local_path(project.id, "working", "final_video.mp4")
-    
-    # Verify paths are not empty and exist or raise exception
-    if not lipsync_video_local_path or not os.path.exists(lipsync_video_local_path):
-        logger.error(f"Lipsync video path is invalid or does not exist: {lipsync_video_local_path}")
-        raise FileNotFoundError(f"Lipsync video path is invalid or does not exist: {lipsync_video_local_path}")
-    
-    if not asset_video_path or not os.path.exists(asset_video_path):
-        logger.error(f"Asset video path is invalid or does not exist: {asset_video_path}")
-        raise FileNotFoundError(f"Asset video path is invalid or does not exist: {asset_video_path}")
+async def generate_preview_video(project: Project) -> str:
+    """
+    Render and upload a low resolution proxy of the final video, without spending a credit. It uses
+    the same asset and caption timelines as the final render. The lipsync video is used once it
+    exists, with the captions transcribed by the captions stage; before that the actor's source
+    video stands in for it, with the voice over if it is ready, and the captions are timed from
+    the script.
+    """
+    if project.video_layout_base is None:
+        project.video_layout_base = await get_video_layout_base(project.video_layout_id)
 
-    if project.video_layout_base.name == VideoLayoutType.TOP_BOTTOM.value:
-        await asyncio.to_thread(
-            combine_videos_vertically,
-            asset_video_path,
-            lipsync_video_local_path,
-            final_video_local_path
-        )
+    duration = project.final_video_duration or project.video_configuration.duration
+    if project.lipsync_video_url:
+        actor_video_path, audio_path = project.lipsync_video_url, None
     else:
-        logger.error("Unsupported layout type")
-        raise Exception("Unsupported layout type")
-    return final_video_local_path
+        actor_video_path, audio_path = project.actor_base.full_video_link, project.t2s_audio_url
+    caption_timeline = get_stored_caption_timeline(project) if project.lipsync_video_url else None
+    if caption_timeline is None:
+        if not project.final_script:
+            raise ValueError(f"Project {project.id} has no script to time the preview captions from")
+        caption_timeline = CaptionTimeline.from_script(project.final_script, duration)
 
+    logger.info(f"Rendering preview for project {project.id}")
+    started_at = time.perf_counter()
+    # A new name per preview: an existing object would be updated, not uploaded
+    preview_local_path = get_local_path(project.id, "working", f"preview_video_{uuid4().hex}.mp4")
+    await asyncio.to_thread(
+        render_preview,
+        project.assets,
+        duration,
+        project.video_layout_base.name,
+        actor_video_path,
+        preview_local_path,
+        audio_path,
+        get_caption_type(),
+        caption_timeline
+    )
+    logger.info(f"Preview render for project {project.id} took {time.perf_counter() - started_at:.1f}s")
+    try:
+        return await asyncio.to_thread(upload_file_to_projects, project.id, preview_local_path, "video/mp4")
+    finally:
+        os.remove(preview_local_path)
 
-async def add_captions_to_video(project: Project, final_video_local_path: str) -> str:
-    logger.info(f"Adding captions to final video for project {project.id}")
 
-    # Verify input video exists
-    if not os.path.exists(final_video_local_path):
-        raise FileNotFoundError(f"Input video not found at: {final_video_local_path}. Cannot proceed with adding captions.")
-    
-    caption_type = BoxedHighlightCaption(
-        font_path=Constants.ROBOTO_FONT_PATH,
-        font_size=72,
-        default_color=(255, 255, 255),
-        highlight_color=(255, 0, 0),
-        outline_color=(0, 0, 0),
-        outline_thickness=3,
-        background_color=(0, 0, 0, 0),
-        background_padding=5
-    )
-    
-    # Ensure output directory exists
-    final_video_with_captions_local_path = get_local_path(project.id, "working", "final_video_with_captions.mp4")
-    os.makedirs(os.path.dirname(final_video_with_captions_local_path), exist_ok=True)
+async def get_caption_timeline(media_path: str) -> CaptionTimeline:
+    logger.info(f"Transcribing {media_path} for captions")
+    return await asyncio.to_thread(transcribe_video_assembly_words, media_path)
 
-    await asyncio.to_thread(
-        process_video_for_captions,
-        final_video_local_path,
-        final_video_with_captions_local_path,
-        caption_type
-    )
-    return final_video_with_captions_local_path
 
 # async def add_captions_to_video(project: Project, final_video_local_path: str) -> str:
 #     """Add captions to video with enhanced debug logging."""
@@ -8,7 +8,7 @@ from src.supabase_tools.handle_project_tb_updates import update_project_in_db
 from src.supabase_tools.handle_profiles_tb_updates import get_user_from_db
 from src.utils.file_handling import get_local_path
 from src.utils.logger import logger
-from src.models.base_models import Project, ProjectStatus
+from src.models.base_models import CaptionRenderMode, Project, ProjectStatus, RenderEngine, RenderOptions
 from src.notification.async_slack_bot import RA_SLACK_BOT
 from src.supabase_tools.handle_bucket_updates import upload_file_to_projects
 from src.utils.util_functions import download_video
@@ -69,6 +69,16 @@ async def handle_success(project: Project, stage: str):
         f"Status: Successfully completed {stage}"
     )
     
+def get_render_options(project: Project) -> RenderOptions:
+    """Render options chosen for the project, falling back to the configured defaults."""
+    if project.render_options is not None:
+        return project.render_options
+    return RenderOptions(
+        engine=RenderEngine(Settings.DEFAULT_RENDER_ENGINE),
+        caption_mode=CaptionRenderMode(Settings.DEFAULT_CAPTION_MODE),
+        stream_assets=Settings.STREAM_ASSETS
+    )
+
 def delete_working_directory(project_id: UUID):
     import shutil
     temp_storage_path = os.path.join("src", "temp_storage", str(project_id))
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+# The app's modules create their clients and caches at import time: point them at placeholders and
+# a scratch directory before any test imports them
+_scratch_dir = tempfile.mkdtemp(prefix="reelsai_tests_")
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+for name, path in [("ASSET_CACHE_DIR", "asset_cache"), ("MEDIA_PROBE_CACHE_DIR", "media_probe_cache"),
+                   ("ACTOR_CACHE_DIR", "actor_cache"), ("STAGE_CACHE_DIR", "stage_cache"),
+                   ("DOWNLOAD_CACHE_DIR", "download_cache"), ("JOB_QUEUE_PATH", "job_queue.sqlite3")]:
+    os.environ.setdefault(name, os.path.join(_scratch_dir, path))
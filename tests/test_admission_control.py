@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+import pytest
+from src.models.base_models import Project, ProjectStatus, VideoConfiguration
+from src.workflow import admission_control
+from src.workflow.admission_control import AdmissionController
+from src.workflow.job_queue import SqliteJobQueue, get_queue_concurrency
+from src.workflow.stage_graph import RUN_JOB
+
+async def noop(*args, **kwargs):
+    return None
+
+def make_project() -> Project:
+    return Project(id=uuid4(), user_id=uuid4(), product_id=uuid4(), status=ProjectStatus.PROCESSING,
+                   video_configuration=VideoConfiguration(duration=30, target_audience="a", cta="b", direction="c"),
+                   final_script="script", created_at=datetime.now(), updated_at=datetime.now())
+
+@pytest.fixture
+def controllers(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission_control, "update_project_in_db", noop)
+    store = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), get_queue_concurrency(), 60)
+    api, worker = AdmissionController(store), AdmissionController(store)
+    api.memory_budget_mb = worker.memory_budget_mb = 10 ** 6
+
+    # An idle render worker's admit_waiting runs between the request and the API's own pass
+    admit_waiting = api.admit_waiting
+
+    async def admit_after_worker():
+        await worker.admit_waiting()
+        return await admit_waiting()
+    api.admit_waiting = admit_after_worker
+    return api, store
+
+def set_credits(monkeypatch, credits: int) -> None:
+    async def reduce_credit(user_id):
+        return {"reduced_credits": credits > 0}
+    monkeypatch.setattr(admission_control, "reduce_credit", reduce_credit)
+
+def test_project_admitted_by_a_worker_is_reported_as_started(controllers, monkeypatch):
+    api, store = controllers
+    set_credits(monkeypatch, 1)
+    project = make_project()
+    admission = asyncio.run(api.request(project))
+    run = store.get_latest_job(str(project.id), RUN_JOB)
+    assert admission == {"admitted": True, "job_id": run.id}
+
+def test_project_admitted_by_a_worker_without_credits_is_reported_as_such(controllers, monkeypatch):
+    api, store = controllers
+    set_credits(monkeypatch, 0)
+    project = make_project()
+    admission = asyncio.run(api.request(project))
+    assert admission == {"admitted": True, "job_id": None}
+    assert store.get_latest_job(str(project.id), RUN_JOB) is None
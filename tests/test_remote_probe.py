@@ -0,0 +1,98 @@
+import os
+import shutil
+import pytest
+import requests
+from src.utils import media_probe
+from src.utils.benchmark_remote_probe import create_sample_files, start_server
+from src.utils.media_probe import REMOTE_BLOCK_BYTES, RangeReader, probe_local_file, probe_remote
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is needed for the sample videos")
+
+@pytest.fixture(scope="module")
+def sample_dir(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("remote_probe"))
+    create_sample_files(directory)
+    return directory
+
+@pytest.fixture
+def range_server(sample_dir):
+    server, handler, base_url = start_server(sample_dir)
+    yield handler, base_url
+    server.shutdown()
+
+@pytest.fixture
+def plain_server(sample_dir):
+    # A server that ignores Range and always answers 200 with the full file
+    server, handler, base_url = start_server(sample_dir, support_ranges=False)
+    yield handler, base_url
+    server.shutdown()
+
+def read_file(sample_dir, name, start, end):
+    with open(os.path.join(sample_dir, name), "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+def test_range_reader_reads_blocks_with_range_requests(sample_dir, range_server):
+    _, base_url = range_server
+    file_size = os.path.getsize(os.path.join(sample_dir, "actor_tail_moov.mp4"))
+    with requests.Session() as session:
+        reader = RangeReader(f"{base_url}/actor_tail_moov.mp4", session)
+        assert reader.read_at(0, 16) == read_file(sample_dir, "actor_tail_moov.mp4", 0, 16)
+        # The 206 response's Content-Range gives the size of the whole file
+        assert reader.file_size == file_size
+        assert reader.bytes_read == REMOTE_BLOCK_BYTES
+
+        # Reads within the fetched block cost no request
+        assert reader.read_at(100, 200) == read_file(sample_dir, "actor_tail_moov.mp4", 100, 300)
+        assert reader.request_count == 1
+
+        # The tail is fetched with a second request and clamped to the file size
+        assert reader.read_at(file_size - 10, 100) == read_file(sample_dir, "actor_tail_moov.mp4", file_size - 10, file_size)
+        assert reader.request_count == 2
+        assert reader.read_at(file_size, 10) == b""
+
+def test_range_reader_falls_back_to_the_head_of_a_200_response(sample_dir, plain_server):
+    _, base_url = plain_server
+    file_size = os.path.getsize(os.path.join(sample_dir, "actor_tail_moov.mp4"))
+    with requests.Session() as session:
+        reader = RangeReader(f"{base_url}/actor_tail_moov.mp4", session)
+        assert reader.read_at(0, 16) == read_file(sample_dir, "actor_tail_moov.mp4", 0, 16)
+        # The size comes from Content-Length and only the head of the body is read
+        assert reader.file_size == file_size
+        assert reader.bytes_read < file_size
+        # Without range support there is no way to reach the rest of the file
+        with pytest.raises(IOError):
+            reader.read_at(file_size - 10, 10)
+
+@pytest.mark.parametrize("name", ["product.png", "product.jpg", "actor_tail_moov.mp4", "actor_faststart.mp4"])
+def test_probe_remote_matches_local_probe(sample_dir, range_server, name):
+    handler, base_url = range_server
+    expected = probe_local_file(os.path.join(sample_dir, name))
+    # Signed URLs carry a query string, the probe must not depend on it
+    info = probe_remote(f"{base_url}/{name}?X-Amz-Signature=local")
+    assert (info.kind, info.width, info.height, info.duration) == (expected.kind, expected.width, expected.height, expected.duration)
+    assert handler.bytes_sent < os.path.getsize(os.path.join(sample_dir, name))
+
+def test_probe_remote_finds_a_trailing_moov_in_two_requests(sample_dir, range_server):
+    handler, base_url = range_server
+    info = probe_remote(f"{base_url}/actor_tail_moov.mp4")
+    assert (info.width, info.height, info.has_audio) == (1080, 1920, True)
+    assert info.duration == pytest.approx(10, abs=0.1)
+    # The head and the moov: mdat is skipped by its size, not downloaded
+    assert handler.bytes_sent < os.path.getsize(os.path.join(sample_dir, "actor_tail_moov.mp4")) // 10
+
+def test_probe_remote_reads_images_from_the_head_of_a_200_response(sample_dir, plain_server, monkeypatch):
+    _, base_url = plain_server
+    monkeypatch.setattr(media_probe, "probe_with_ffprobe", lambda source: pytest.fail(f"ffprobe was run for {source}"))
+    info = probe_remote(f"{base_url}/product.png")
+    assert (info.width, info.height) == (1200, 1600)
+
+def test_probe_remote_without_range_support_falls_back_to_ffprobe(sample_dir, plain_server, monkeypatch):
+    _, base_url = plain_server
+    # The trailing moov is out of reach without ranges
+    expected = probe_local_file(os.path.join(sample_dir, "actor_tail_moov.mp4"))
+    probed = []
+    monkeypatch.setattr(media_probe, "probe_with_ffprobe", lambda source: probed.append(source) or expected)
+    url = f"{base_url}/actor_tail_moov.mp4"
+    assert probe_remote(url) == expected
+    assert probed == [url]
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+import pytest
+from src.models.base_models import CaptionRenderMode, Project, ProjectStatus, RenderEngine, RenderOptions, VideoConfiguration
+from src.workflow import stage_graph, video_gen_workflow
+from src.workflow.job_queue import IO_QUEUE, RENDER_QUEUE, SqliteJobQueue, get_queue_concurrency
+from src.workflow.stage_artifacts import (ACTOR_STAGE, ASSETS_STAGE, CAPTIONS_STAGE, LAYOUT_STAGE, LIPSYNC_STAGE, RENDER_STAGE,
+                                          StageArtifactStore)
+from src.workflow.stage_graph import RUN_JOB, StageGraph
+from src.workflow.stage_join import StageJoin
+from src.workflow.video_gen_workflow import video_generation_graph
+
+async def noop(*args, **kwargs):
+    return None
+
+class RecordingRouter:
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.projects = []
+
+    async def render(self, project, lipsync_video_local_path, caption_timeline, actor_size=None):
+        self.projects.append(project)
+        with open(self.output_path, "wb") as f:
+            f.write(b"video")
+        return self.output_path, get_engine(project)
+
+def get_engine(project: Project) -> RenderEngine:
+    return project.render_options.engine if project.render_options else RenderEngine.MOVIEPY
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    for module in (stage_graph, video_gen_workflow):
+        monkeypatch.setattr(module, "update_project_in_db", noop)
+    monkeypatch.setattr(stage_graph, "handle_success", noop)
+    store = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), get_queue_concurrency(), 60)
+    return StageGraph(list(video_generation_graph.stages.values()), noop, store,
+                      StageArtifactStore(str(tmp_path / "stage_cache")), StageJoin(store))
+
+def make_project(render_options=None) -> Project:
+    return Project(id=uuid4(), user_id=uuid4(), product_id=uuid4(), status=ProjectStatus.PROCESSING,
+                   video_configuration=VideoConfiguration(duration=30, target_audience="a", cta="b", direction="c"),
+                   final_script="script", created_at=datetime.now(), updated_at=datetime.now(), render_options=render_options)
+
+def test_render_options_survive_the_lipsync_webhook_finishing_last(graph, tmp_path, monkeypatch):
+    router = RecordingRouter(str(tmp_path / "final_video.mp4"))
+    monkeypatch.setattr(video_gen_workflow, "render_router", router)
+
+    async def download_lipsync_video(project):
+        return str(tmp_path / "lipsync.mp4")
+    monkeypatch.setattr(video_gen_workflow, "download_lipsync_video", download_lipsync_video)
+
+    project = make_project(RenderOptions(engine=RenderEngine.FFMPEG, caption_mode=CaptionRenderMode.ASS, stream_assets=True))
+    graph.store.enqueue(IO_QUEUE, RUN_JOB, {"project": project.model_dump(mode="json")},
+                        user_id=str(project.user_id), project_id=str(project.id))
+
+    async def run():
+        await graph.join.reset(project.id, RENDER_STAGE)
+        # Every other input of the render finished in a worker with the run's project
+        for name, outputs in [(CAPTIONS_STAGE, {"lines": []}), (ASSETS_STAGE, {"assets_video_local_path": None}),
+                              (LAYOUT_STAGE, {"video_layout_base": None}), (ACTOR_STAGE, {"actor_size": None})]:
+            graph.artifacts.record(project.id, name, name, outputs)
+            await graph.finish_stage(project, graph.stages[name], outputs)
+        graph.artifacts.record(project.id, LIPSYNC_STAGE, LIPSYNC_STAGE)
+
+        # The Replicate webhook completes the lipsync with the project loaded from the DB, which
+        # has no render options
+        await graph.complete(project.model_copy(update={"render_options": None}), LIPSYNC_STAGE,
+                             {"lipsync_video_url": "https://example.com/lipsync.mp4"})
+
+        job = graph.store.claim([RENDER_QUEUE], "worker")
+        assert job.payload["stage"] == RENDER_STAGE
+        await graph.run_stage(Project.model_validate(job.payload["project"]), RENDER_STAGE)
+
+    asyncio.run(run())
+    assert len(router.projects) == 1
+    assert router.projects[0].render_options == project.render_options
+
+def test_rerender_with_other_options_renders_and_uploads_again(graph, tmp_path, monkeypatch):
+    router = RecordingRouter(str(tmp_path / "final_video.mp4"))
+    monkeypatch.setattr(video_gen_workflow, "render_router", router)
+    uploaded = []
+
+    async def download_lipsync_video(project):
+        return str(tmp_path / "lipsync.mp4")
+
+    async def upload_final_video(project, final_video_local_path):
+        uploaded.append(final_video_local_path)
+        return f"https://example.com/final_{len(uploaded)}.mp4"
+    monkeypatch.setattr(video_gen_workflow, "download_lipsync_video", download_lipsync_video)
+    monkeypatch.setattr(video_gen_workflow, "upload_final_video", upload_final_video)
+
+    project = make_project(RenderOptions(engine=RenderEngine.FFMPEG, caption_mode=CaptionRenderMode.FRAMES))
+
+    async def render_and_upload(project):
+        await graph.join.reset(project.id, RENDER_STAGE)
+        for name, outputs in [(LIPSYNC_STAGE, {"lipsync_video_url": "https://example.com/lipsync.mp4"}),
+                              (CAPTIONS_STAGE, {"lines": []}), (ASSETS_STAGE, {"assets_video_local_path": None}),
+                              (LAYOUT_STAGE, {"video_layout_base": None}), (ACTOR_STAGE, {"actor_size": None})]:
+            graph.artifacts.record(project.id, name, name, outputs)
+            await graph.finish_stage(project, graph.stages[name], outputs)
+        for queue in (RENDER_QUEUE, IO_QUEUE):
+            job = graph.store.claim([queue], "worker")
+            await graph.run_stage(Project.model_validate(job.payload["project"]), job.payload["stage"])
+            graph.store.complete(job, "worker")
+        # As finish_video_generation does once the video is uploaded
+        graph.artifacts.release_files(project.id, RENDER_STAGE)
+
+    asyncio.run(render_and_upload(project))
+    rerender = project.model_copy(update={"render_options": RenderOptions(engine=RenderEngine.FFMPEG, caption_mode=CaptionRenderMode.ASS)})
+    asyncio.run(render_and_upload(rerender))
+
+    assert [rendered.render_options.caption_mode for rendered in router.projects] == [CaptionRenderMode.FRAMES, CaptionRenderMode.ASS]
+    assert len(uploaded) == 2